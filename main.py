@@ -9,33 +9,7 @@
 # from binge_buddy.ollama import OllamaLLM
 
 
-# def run_perception():
-#     # Make instance of PerceptionAgent
-#     agent = PerceptionAgent()
-
-#     # Get the path to the audio folder using pathlib
-#     audio_folder = Path("src/binge_buddy/audio")
-#     result = []
-#     emotion_result = []
-
-#     # Transcribe audio for each file in the audio folder
-#     for (
-#         audio_file
-#     ) in audio_folder.iterdir():  # iterdir() gives us each file in the folder
-#         if audio_file.is_file():  # Check if it's a file (not a directory)
-#             result_item = agent.transcribe(audio_file)
-#             result.append(result_item)
-#             # print(result)
-
-#             # Extract emotion from the transcribed message
-#             emotion_result_item = agent.extract_emotion(result_item)
-#             emotion_result.append(emotion_result_item)
-#             # print(emotion_result)
-
-#             # Delete the audio file after transcribing
-#             # audio_file.unlink()  # unlink() deletes the file
-
-#     return result, emotion_result
+# Bulk transcription of audio files: python -m binge_buddy.ingest <dir or manifest> <results.jsonl>
 
 
 # def main():
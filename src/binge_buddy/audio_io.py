@@ -0,0 +1,282 @@
+"""Conversion of raw audio bytes into the 16 kHz mono float32 samples Whisper expects"""
+
+import atexit
+import logging
+import math
+import os
+import struct
+import subprocess
+import threading
+from collections import deque
+from typing import Deque, Optional
+
+import numpy as np
+from scipy.signal import resample_poly
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+PCM_FORMATS = {"s16le": np.int16, "f32": np.float32}
+
+# WAV format tags (WAVE_FORMAT_EXTENSIBLE carries the real tag in its sub-format GUID)
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class AudioDecodeError(ValueError):
+    """Raised when uploaded bytes cannot be decoded as audio."""
+
+
+def resample(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """
+    Polyphase resampling to 16 kHz. Its low-pass filter removes the content above 8 kHz
+    first, which plain interpolation would fold back into the speech band.
+    """
+    if sample_rate == SAMPLE_RATE or not len(samples):
+        return samples
+    divisor = math.gcd(sample_rate, SAMPLE_RATE)
+    return resample_poly(
+        samples, SAMPLE_RATE // divisor, sample_rate // divisor
+    ).astype(np.float32)
+
+
+def pcm_to_float32(
+    data, pcm_format: str = "s16le", sample_rate: int = SAMPLE_RATE, channels: int = 1
+) -> np.ndarray:
+    """
+    Converts interleaved raw PCM bytes into 16 kHz mono float32 samples in [-1, 1].
+
+    :param data: The raw PCM bytes (any buffer; it is read without copying).
+    :param pcm_format: "s16le" (16-bit signed little-endian) or "f32" (32-bit float).
+    :param sample_rate: Sample rate of the data.
+    :param channels: Number of interleaved channels (downmixed by averaging).
+    """
+    if pcm_format not in PCM_FORMATS:
+        raise ValueError(f"Unsupported PCM format: {pcm_format}")
+    dtype = np.dtype(PCM_FORMATS[pcm_format]).newbyteorder("<")
+    # Ignore a trailing partial sample instead of failing on it
+    usable = len(data) - len(data) % (dtype.itemsize * channels)
+    samples = np.frombuffer(memoryview(data)[:usable], dtype=dtype)
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    if pcm_format == "s16le":
+        samples = samples.astype(np.float32) / 32768.0
+    else:
+        samples = samples.astype(np.float32, copy=False)
+    return resample(samples, sample_rate)
+
+
+def parse_wav(data) -> Optional[np.ndarray]:
+    """
+    Decodes a 16-bit PCM or 32-bit float WAV file in memory. Returns None for anything else
+    (other sample widths, compressed codecs, not a WAV at all) so the caller can fall back
+    to ffmpeg.
+    """
+    view = memoryview(data)
+    if len(view) < 12 or view[:4] != b"RIFF" or view[8:12] != b"WAVE":
+        return None
+    position, fmt = 12, None
+    while position + 8 <= len(view):
+        chunk_id = bytes(view[position : position + 4])
+        (size,) = struct.unpack_from("<I", view, position + 4)
+        body = position + 8
+        if chunk_id == b"fmt " and size >= 16:
+            fmt = struct.unpack_from("<HHIIHH", view, body)
+            if fmt[0] == WAVE_FORMAT_EXTENSIBLE and size >= 26:
+                (sub_format,) = struct.unpack_from("<H", view, body + 24)
+                fmt = (sub_format,) + fmt[1:]
+        elif chunk_id == b"data":
+            if fmt is None:
+                return None
+            tag, channels, sample_rate, _, _, bits = fmt
+            if tag == WAVE_FORMAT_PCM and bits == 16:
+                pcm_format = "s16le"
+            elif tag == WAVE_FORMAT_IEEE_FLOAT and bits == 32:
+                pcm_format = "f32"
+            else:
+                return None
+            # Recorders that stream WAV leave the size at 0 or 0xFFFFFFFF: read to the end
+            end = len(view) if size in (0, 0xFFFFFFFF) else min(body + size, len(view))
+            return pcm_to_float32(view[body:end], pcm_format, sample_rate, channels)
+        position = body + size + size % 2  # chunks are word-aligned
+    return None
+
+
+class FfmpegPool:
+    """
+    Decodes compressed audio through ffmpeg pipes, without temporary files. Idle ffmpeg
+    processes are started ahead of time (they block on stdin until they get input), so an
+    upload does not pay for process start-up.
+    """
+
+    COMMAND = (
+        "ffmpeg -hide_banner -loglevel error -threads 0 -i pipe:0 "
+        f"-f s16le -ac 1 -acodec pcm_s16le -ar {SAMPLE_RATE} pipe:1"
+    ).split()
+
+    def __init__(self, size: int = 2, timeout: float = 60.0):
+        """
+        Initializes the pool. No process is started until the first decode.
+
+        :param size: Idle ffmpeg processes kept ready.
+        :param timeout: Seconds a single decode may take before ffmpeg is killed.
+        """
+        self.size = size
+        self.timeout = timeout
+        self._idle: Deque[subprocess.Popen] = deque()
+        self._lock = threading.Lock()
+        # A single worker replaces used processes off the request path
+        self._refill_wanted = threading.Event()
+        self._refill_worker: Optional[threading.Thread] = None
+        self._closed = False
+
+    def _spawn(self) -> subprocess.Popen:
+        return subprocess.Popen(
+            self.COMMAND,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+    def _refill(self) -> None:
+        with self._lock:
+            missing = 0 if self._closed else self.size - len(self._idle)
+        for _ in range(missing):
+            try:
+                process = self._spawn()
+            except OSError as e:
+                logger.warning("Could not start ffmpeg: %s", e)
+                return
+            with self._lock:
+                if not self._closed:
+                    self._idle.append(process)
+                    continue
+            process.kill()
+            process.communicate()
+            return
+
+    def _refill_loop(self) -> None:
+        while True:
+            self._refill_wanted.wait()
+            self._refill_wanted.clear()
+            self._refill()
+
+    def _request_refill(self) -> None:
+        with self._lock:
+            if self._refill_worker is None:
+                self._refill_worker = threading.Thread(
+                    target=self._refill_loop, name="ffmpeg-pool", daemon=True
+                )
+                self._refill_worker.start()
+        self._refill_wanted.set()
+
+    def _take(self) -> subprocess.Popen:
+        with self._lock:
+            while self._idle:
+                process = self._idle.popleft()
+                if process.poll() is None:
+                    return process
+        return self._spawn()
+
+    def decode(self, data) -> np.ndarray:
+        try:
+            process = self._take()
+        except FileNotFoundError:
+            raise AudioDecodeError(
+                "ffmpeg is required to decode compressed audio"
+            ) from None
+        try:
+            out, err = process.communicate(bytes(data), timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise AudioDecodeError(
+                f"ffmpeg took longer than {self.timeout:.0f}s"
+            ) from None
+        finally:
+            self._request_refill()
+        if process.returncode != 0:
+            raise AudioDecodeError(
+                f"ffmpeg failed: {err.decode(errors='replace').strip()}"
+            )
+        return pcm_to_float32(out)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+        for process in idle:
+            process.kill()
+            process.communicate()
+
+
+ffmpeg_pool = FfmpegPool(size=int(os.getenv("FFMPEG_POOL_SIZE", "2")))
+atexit.register(ffmpeg_pool.close)
+
+
+def decode_audio(data) -> np.ndarray:
+    """
+    Decodes an uploaded audio file held in memory into 16 kHz mono float32 samples: WAV
+    natively, everything else (WebM/Opus from browsers, MP3, ...) through ``ffmpeg_pool``.
+    """
+    samples = parse_wav(data)
+    if samples is None:
+        samples = ffmpeg_pool.decode(data)
+    if not len(samples):
+        raise AudioDecodeError("The upload contains no audio")
+    return samples
+
+
+if __name__ == "__main__":
+    # Per-upload latency and disk I/O: saving to disk and whisper.load_audio (before)
+    # against decoding in memory (after), for every sample file in ./audio
+    import sys
+    import tempfile
+    import time
+    from pathlib import Path
+
+    import whisper
+
+    def disk_io():
+        """Bytes read and written to storage by this process and its reaped children."""
+        try:
+            with open("/proc/self/io") as f:
+                fields = dict(line.split(": ") for line in f.read().splitlines())
+            return int(fields["read_bytes"]), int(fields["write_bytes"])
+        except OSError:
+            return 0, 0
+
+    def measure(label, fn, uploads, repeat=5):
+        fn(uploads[0][1])  # warm up the pool and the page cache
+        read, written = disk_io()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for _, data in uploads:
+                fn(data)
+        elapsed = (time.perf_counter() - start) / (repeat * len(uploads))
+        read_after, written_after = disk_io()
+        count = repeat * len(uploads)
+        print(
+            f"{label:<28} {elapsed * 1000:7.1f} ms/upload, "
+            f"{(written_after - written) / count / 1024:7.1f} KiB written/upload, "
+            f"{(read_after - read) / count / 1024:7.1f} KiB read/upload"
+        )
+
+    directory = (
+        Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / "audio"
+    )
+    uploads = [(path.name, path.read_bytes()) for path in sorted(directory.iterdir())]
+    with tempfile.TemporaryDirectory() as scratch:
+
+        def save_and_load(data):
+            path = os.path.join(scratch, "upload")
+            with open(path, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            return whisper.load_audio(path)
+
+        measure("before (save + load_audio)", save_and_load, uploads)
+    measure("after (in memory)", decode_audio, uploads)
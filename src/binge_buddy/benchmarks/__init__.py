@@ -0,0 +1 @@
+"""Benchmarks of the served app, each starting the servers it measures in subprocesses"""
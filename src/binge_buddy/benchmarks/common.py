@@ -0,0 +1,88 @@
+"""Helpers shared by the server benchmarks"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict
+
+
+async def post(
+    reader, writer, path: str, payload: Dict, body: bytes = b"", content_type: str = ""
+) -> float:
+    """POSTs JSON (or a pre-encoded body) and returns the response time."""
+    if not body:
+        body, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+    start = time.perf_counter()
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    length = 0
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+    await reader.readexactly(length)
+    if not head.startswith(b"HTTP/1.1 200"):
+        raise RuntimeError(head.split(b"\r\n", 1)[0].decode())
+    return time.perf_counter() - start
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 300) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise TimeoutError(f"Nothing listening on port {port}")
+
+
+def bench_env(**overrides: str) -> Dict[str, str]:
+    """
+    Environment for a benchmarked server: local database and message store in a fresh
+    temporary directory, no trace export, warnings only. ``overrides`` replace any of these
+    (e.g. ``MEMORY_DB_BACKEND="mongo"``).
+    """
+    workdir = tempfile.mkdtemp(prefix="binge_buddy_bench_")
+    env = dict(
+        os.environ,
+        MEMORY_DB_BACKEND="local",
+        LOCAL_DB_DIR=os.path.join(workdir, "db"),
+        MESSAGE_STORE_DIR=os.path.join(workdir, "messages"),
+        TRACE_EXPORTER="none",
+        LOG_LEVEL="WARNING",
+    )
+    env.update(overrides)
+    return env
+
+
+def start_fake_ollama(env: Dict[str, str], port: int) -> subprocess.Popen:
+    """Starts binge_buddy.fake_ollama on ``port`` and waits until it accepts connections."""
+    fake = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "binge_buddy.fake_ollama",
+            "--port",
+            str(port),
+            "--parallel",
+            "8",
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    wait_for_port(port)
+    return fake
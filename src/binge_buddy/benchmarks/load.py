@@ -0,0 +1,99 @@
+"""Load test: the Flask dev server vs. the ASGI server, both talking to a fake Ollama"""
+
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from binge_buddy.benchmarks.common import (
+    bench_env,
+    free_port,
+    post,
+    start_fake_ollama,
+    wait_for_port,
+)
+
+
+async def _load(port: int, users: int, turns: int, idle: int) -> Dict:
+    idle_connections = []
+    for _ in range(idle):
+        idle_connections.append(await asyncio.open_connection("127.0.0.1", port))
+
+    latencies: List[float] = []
+    errors = 0
+
+    async def user(i: int):
+        nonlocal errors
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for turn in range(turns):
+            payload = {
+                "user_id": f"user_{i}",
+                "session_id": "s",
+                "text": f"Recommend a movie ({turn})",
+            }
+            try:
+                latencies.append(await post(reader, writer, "/send_message", payload))
+            except Exception:
+                errors += 1
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(i) for i in range(users)))
+    elapsed = time.perf_counter() - start
+    for _, writer in idle_connections:
+        writer.close()
+
+    latencies.sort()
+    return {
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": 1000 * statistics.median(latencies) if latencies else float("nan"),
+        "p95_ms": (
+            1000 * latencies[int(0.95 * (len(latencies) - 1))]
+            if latencies
+            else float("nan")
+        ),
+        "errors": errors,
+    }
+
+
+def benchmark(users: int = 64, turns: int = 5, idle: int = 2000) -> None:
+    """Compares the Flask dev server with the ASGI server, both talking to a fake Ollama."""
+    ollama_port = free_port()
+    env = bench_env(OLLAMA_HOST=f"http://127.0.0.1:{ollama_port}")
+    servers = {
+        "flask dev server": "from binge_buddy.front_end import app; app.run(port={port}, threaded=True)",
+        "asgi (uvicorn)": "from binge_buddy.serve import run; run(host='127.0.0.1', port={port})",
+    }
+
+    fake = start_fake_ollama(env, ollama_port)
+    try:
+        print(f"{users} users x {turns} turns, {idle} idle keep-alive connections")
+        for name, code in servers.items():
+            port = free_port()
+            server = subprocess.Popen(
+                [sys.executable, "-c", code.format(port=port)], env=env
+            )
+            try:
+                wait_for_port(port)
+                result = asyncio.run(_load(port, users, turns, idle))
+            finally:
+                server.terminate()
+                server.wait()
+            print(
+                f"{name:>18}: {result['throughput']:6.1f} turns/s, p50 {result['p50_ms']:7.0f} ms, "
+                f"p95 {result['p95_ms']:7.0f} ms, {result['errors']} errors"
+            )
+    finally:
+        fake.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=64)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--idle", type=int, default=2000)
+    args = parser.parse_args()
+    benchmark(args.users, args.turns, args.idle)
@@ -0,0 +1,134 @@
+"""Chat latency next to concurrent transcriptions, in-process and in the perception pool"""
+
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from binge_buddy.benchmarks.common import (
+    bench_env,
+    free_port,
+    post,
+    start_fake_ollama,
+    wait_for_port,
+)
+
+
+async def _chat_with_uploads(
+    port: int, users: int, turns: int, uploaders: int, clip: bytes
+) -> Dict:
+    """Chat turns from ``users`` while ``uploaders`` clients keep transcribing ``clip``."""
+    boundary = "binge-buddy-benchmark"
+    upload = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="audio"; filename="clip"\r\n'
+        f"Content-Type: application/octet-stream\r\n\r\n".encode()
+        + clip
+        + f"\r\n--{boundary}--\r\n".encode()
+    )
+    latencies: List[float] = []
+    transcriptions = errors = 0
+    done = asyncio.Event()
+
+    async def user(i: int):
+        nonlocal errors
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for turn in range(turns):
+            payload = {
+                "user_id": f"user_{i}",
+                "session_id": "s",
+                "text": f"Recommend a movie ({turn})",
+            }
+            try:
+                latencies.append(await post(reader, writer, "/send_message", payload))
+            except Exception:
+                errors += 1
+        writer.close()
+
+    async def uploader():
+        nonlocal transcriptions, errors
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        content_type = f"multipart/form-data; boundary={boundary}"
+        while not done.is_set():
+            try:
+                await post(reader, writer, "/upload", {}, upload, content_type)
+                transcriptions += 1
+            except Exception:
+                errors += 1
+        writer.close()
+
+    uploads = [asyncio.ensure_future(uploader()) for _ in range(uploaders)]
+    if uploads:
+        await asyncio.sleep(5)  # let the transcriptions get going (and the models load)
+    start = time.perf_counter()
+    await asyncio.gather(*(user(i) for i in range(users)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await asyncio.gather(*uploads)
+
+    latencies.sort()
+    return {
+        "p50_ms": 1000 * statistics.median(latencies) if latencies else float("nan"),
+        "p99_ms": (
+            1000 * latencies[int(0.99 * (len(latencies) - 1))]
+            if latencies
+            else float("nan")
+        ),
+        "transcriptions_per_min": 60 * transcriptions / elapsed,
+        "errors": errors,
+    }
+
+
+def perception_benchmark(
+    users: int = 16, turns: int = 10, uploaders: int = 4, processes: int = 2
+) -> None:
+    """Chat p50/p99 alone, next to in-process transcriptions, and next to a process pool."""
+    clip = (Path(__file__).parent.parent / "audio" / "ukfood-short.mp3").read_bytes()
+    ollama_port = free_port()
+    env = bench_env(OLLAMA_HOST=f"http://127.0.0.1:{ollama_port}", WARMUP_MODELS="1")
+    scenarios = {
+        "chat only": (0, 0),
+        "uploads in-process": (uploaders, 0),
+        "uploads in pool": (uploaders, processes),
+    }
+    fake = start_fake_ollama(env, ollama_port)
+    try:
+        print(
+            f"{users} users x {turns} turns, {uploaders} clients uploading {len(clip)} byte clips"
+        )
+        for name, (scenario_uploaders, scenario_processes) in scenarios.items():
+            port = free_port()
+            code = (
+                f"from binge_buddy.serve import run; run(host='127.0.0.1', port={port})"
+            )
+            server = subprocess.Popen(
+                [sys.executable, "-c", code],
+                env=dict(env, PERCEPTION_PROCESSES=str(scenario_processes)),
+            )
+            try:
+                wait_for_port(port)
+                result = asyncio.run(
+                    _chat_with_uploads(port, users, turns, scenario_uploaders, clip)
+                )
+            finally:
+                server.terminate()
+                server.wait()
+            print(
+                f"{name:>20}: chat p50 {result['p50_ms']:7.0f} ms, p99 {result['p99_ms']:7.0f} ms, "
+                f"{result['transcriptions_per_min']:5.1f} transcriptions/min, {result['errors']} errors"
+            )
+    finally:
+        fake.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--uploaders", type=int, default=4)
+    parser.add_argument("--processes", type=int, default=2)
+    args = parser.parse_args()
+    perception_benchmark(args.users, args.turns, args.uploaders, args.processes)
@@ -0,0 +1,62 @@
+"""Time to import the front end, to be ready, and to serve the first transcription"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+from binge_buddy.benchmarks.common import bench_env
+
+_STARTUP_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import binge_buddy.front_end as front_end
+result = {"import_s": time.perf_counter() - start}
+if sys.argv[1] == "eager":
+    front_end.agent.model  # what importing front_end used to do
+elif sys.argv[1] == "warmup":
+    while front_end.warmup["status"] == "running":
+        time.sleep(0.05)
+front_end.storage_ready.wait()
+result["ready_s"] = time.perf_counter() - start
+import numpy as np
+start = time.perf_counter()
+front_end.agent.transcribe_audio(np.zeros(16000, dtype=np.float32))
+result["first_transcription_s"] = time.perf_counter() - start
+print(json.dumps(result))
+"""
+
+
+def startup_benchmark(backend: str = "local") -> None:
+    """
+    Time to import the front end, to be ready, and to serve the first transcription.
+
+    :param backend: Memory database to start against ("mongo" uses the MONGO_* settings),
+        so that database round-trips at startup are measured too.
+    """
+    # The probe transcribes silence: with VAD it would be trimmed and Whisper never run
+    env = bench_env(MEMORY_DB_BACKEND=backend, VAD="0")
+    modes = {
+        "eager (before)": ("eager", "0"),
+        "lazy": ("lazy", "0"),
+        "lazy + warm-up": ("warmup", "1"),
+    }
+    for name, (mode, warmup) in modes.items():
+        output = subprocess.run(
+            [sys.executable, "-c", _STARTUP_PROBE, mode],
+            env=dict(env, WARMUP_MODELS=warmup),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(
+            f"{name:>15}: import {result['import_s']:5.1f} s, ready {result['ready_s']:5.1f} s, "
+            f"first transcription {result['first_transcription_s']:5.1f} s"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--backend", choices=["local", "mongo"], default="local")
+    startup_benchmark(parser.parse_args().backend)
@@ -0,0 +1,201 @@
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate
+from langchain_core.runnables import RunnableLambda
+
+from binge_buddy import utils
+from binge_buddy.enums import Priority
+from binge_buddy.llm_scheduler import priority
+from binge_buddy.message import Message
+from binge_buddy.message_log import MessageLog
+from binge_buddy.ollama import OllamaLLM
+from binge_buddy.tracing import bind_context, tracer
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token), good enough for budgeting."""
+    return len(text) // 4 + 1
+
+
+class ContextWindow:
+    def __init__(
+        self,
+        llm: OllamaLLM,
+        message_log: MessageLog,
+        max_turns: int = 12,
+        token_budget: int = 1500,
+        summary_token_budget: int = 300,
+        background: bool = True,
+        sticky: bool = False,
+        summary_chunk: Optional[int] = None,
+    ):
+        """
+        Initializes the context window over a message log.
+
+        :param llm: The LLM model used to fold old turns into the rolling summary.
+        :param message_log: The message log to build the context from.
+        :param max_turns: Maximum number of most recent messages kept verbatim.
+        :param token_budget: Token budget for the verbatim messages.
+        :param summary_token_budget: Target length of the rolling summary in tokens.
+        :param background: Update the summary in a background thread instead of inline.
+        :param sticky: Keep the window start fixed until the window overflows, then jump
+            ahead by half a window. The verbatim turns then stay a stable prompt prefix
+            across turns (for KV-cache reuse) instead of shifting by one every turn.
+        :param summary_chunk: Number of evicted messages folded into the summary at once
+            (default half a window). Until that many are pending they stay verbatim, so
+            the summary is not rewritten by an LLM call on every turn.
+        """
+        self.llm = llm
+        self.message_log = message_log
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.summary_token_budget = summary_token_budget
+        self.background = background
+        self.sticky = sticky
+        self.summary_chunk = summary_chunk or max(1, max_turns // 2)
+
+        self.summary = ""
+        self._summarized_upto = 0  # Messages before this index are part of the summary
+        self._start = 0  # Current window start in sticky mode
+        self._generation = 0  # Bumped by reset, so an update in flight is dropped
+        self._lock = threading.Lock()
+        self._worker = None
+
+        self.system_prompt_initial = """
+        You are keeping a running summary of a conversation between a user and "Binge Buddy", a movie and TV show recommendation assistant.
+
+        ## Current summary
+        {summary}
+
+        ## New conversation turns
+        {turns}
+
+        Update the summary with the new turns. Keep the user's stated preferences, the titles that were recommended and how the user reacted to them.
+        Drop greetings and small talk. Keep it under {max_words} words.
+
+        Write the final output under the title "Summary:".
+        """
+
+        self.prompt = ChatPromptTemplate.from_messages(
+            [SystemMessagePromptTemplate.from_template(self.system_prompt_initial)]
+        )
+        self.llm_runnable = RunnableLambda(lambda x: self.llm._call(x))
+        self.summary_runnable = self.prompt | self.llm_runnable
+
+    def _fit(self, max_turns: int, token_budget: int) -> int:
+        """Index of the oldest message that still fits in the given turn and token budget."""
+        lines = self.message_log.get_history(last=max_turns)
+        kept = 0
+        used = 0
+        for line in reversed(lines):
+            cost = estimate_tokens(line)
+            # Always keep at least the latest message, even if it is over budget
+            if used + cost > token_budget and kept:
+                break
+            used += cost
+            kept += 1
+        return len(self.message_log.messages) - kept
+
+    def _window_start(self) -> int:
+        """Index of the oldest message kept verbatim."""
+        if not self.sticky:
+            return self._fit(self.max_turns, self.token_budget)
+
+        count = len(self.message_log.messages) - self._start
+        if count <= self.max_turns and self._start <= len(self.message_log.messages):
+            used = sum(
+                estimate_tokens(l) for l in self.message_log.get_history(last=count)
+            )
+            if used <= self.token_budget:
+                return self._start
+        # Overflowed: restart from half a window so the next turns can append to it
+        self._start = self._fit(max(1, self.max_turns // 2), self.token_budget // 2)
+        return self._start
+
+    def get_context(self) -> Tuple[str, List[Message]]:
+        """
+        Returns the rolling summary and the recent messages kept verbatim. Messages that
+        fell out of the window are folded into the summary in chunks, and are returned
+        verbatim until they are part of it.
+
+        :return: A (summary, recent messages) tuple.
+        """
+        start = self._window_start()
+        if start - self._summarized_upto >= self.summary_chunk:
+            self._schedule_summary(start)
+        with self._lock:
+            summary, summarized_upto = self.summary, self._summarized_upto
+        return summary, self.message_log.messages[min(start, summarized_upto) :]
+
+    def _schedule_summary(self, upto: int) -> None:
+        if not self.background:
+            self._update_summary(upto)
+            return
+        with self._lock:
+            # One update at a time; the next turn picks up whatever is still pending
+            if self._worker and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(
+                target=bind_context(self._update_summary), args=(upto,), daemon=True
+            )
+            self._worker.start()
+
+    def _update_summary(self, upto: int) -> None:
+        with self._lock:
+            begin, generation = self._summarized_upto, self._generation
+        turns = "\n".join(
+            MessageLog.render(m) for m in self.message_log.messages[begin:upto]
+        )
+        # The summary is only needed by a later turn, so it yields to interactive calls
+        with (
+            tracer.span("context_window.summarize", {"turns": upto - begin}),
+            priority(Priority.Background),
+        ):
+            response = utils.remove_think_tags(
+                self.summary_runnable.invoke(
+                    {
+                        "summary": self.summary or "(empty)",
+                        "turns": turns,
+                        "max_words": self.summary_token_budget * 3 // 4,
+                    }
+                )
+            )
+        with self._lock:
+            if generation != self._generation:
+                return
+            self.summary = response.split("Summary:", 1)[-1].strip()
+            self._summarized_upto = upto
+
+    def snapshot(self) -> Dict:
+        """
+        Returns the summary and the number of latest messages it does not cover, so that
+        a session reloaded from its tail can be restored with ``restore``.
+        """
+        with self._lock:
+            return {
+                "summary": self.summary,
+                "unsummarized": len(self.message_log.messages) - self._summarized_upto,
+            }
+
+    def restore(self, snapshot: Optional[Dict]) -> None:
+        """
+        Restores a summary taken with ``snapshot`` over a message log rehydrated from its
+        tail; the messages before the tail are only known through the summary.
+        """
+        if not snapshot:
+            return
+        count = len(self.message_log.messages)
+        with self._lock:
+            self._generation += 1
+            self.summary = snapshot.get("summary", "")
+            self._summarized_upto = max(0, count - snapshot.get("unsummarized", count))
+            self._start = self._summarized_upto
+
+    def reset(self) -> None:
+        """Forget the summary, e.g. after the message log was cleared."""
+        with self._lock:
+            self.summary = ""
+            self._summarized_upto = 0
+            self._start = 0
+            self._generation += 1
@@ -0,0 +1,136 @@
+"""Shared text emotion classifier with batched and micro-batched inference"""
+
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from binge_buddy.micro_batcher import MicroBatcher
+
+DEFAULT_EMOTION_MODEL = "bhadresh-savani/distilbert-base-uncased-emotion"
+
+
+class EmotionClassifier:
+    def __init__(
+        self,
+        model_name: str = DEFAULT_EMOTION_MODEL,
+        batch_size: int = 16,
+        max_wait: float = 0.01,
+        quantize: bool = False,
+        num_threads: Optional[int] = None,
+    ):
+        """
+        Initializes the classifier. The model is only loaded on first use.
+
+        :param model_name: The Hugging Face text-classification model.
+        :param batch_size: Texts per forward pass, for both batched calls and micro-batches.
+        :param max_wait: Seconds a single request waits for concurrent ones to share its batch.
+        :param quantize: Dynamically quantize the linear layers to int8 for faster CPU inference.
+        :param num_threads: CPU threads for torch (a process-wide setting).
+        """
+        self.model_name = model_name
+        self.quantize = quantize
+        self.num_threads = num_threads
+        self.batch_size = batch_size
+        self._pipeline = None
+        self._lock = threading.Lock()
+        self.batcher = MicroBatcher(
+            self.classify,
+            max_batch=batch_size,
+            max_wait=max_wait,
+            name="emotion-batcher",
+        )
+
+    def _load(self):
+        with self._lock:
+            if self._pipeline is None:
+                import torch
+                from transformers import pipeline
+
+                if self.num_threads:
+                    torch.set_num_threads(self.num_threads)
+                classifier = pipeline(
+                    "text-classification", model=self.model_name, device=-1
+                )
+                if self.quantize:
+                    classifier.model = torch.quantization.quantize_dynamic(
+                        classifier.model, {torch.nn.Linear}, dtype=torch.qint8
+                    )
+                self._pipeline = classifier
+        return self._pipeline
+
+    @property
+    def loaded(self) -> bool:
+        return self._pipeline is not None
+
+    def classify(
+        self, texts: List[str], batch_size: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        Classifies many texts, batch_size at a time.
+
+        :param texts: The transcripts or messages to classify.
+        :param batch_size: Overrides the default batch size for this call.
+        :return: One {"label", "score"} dictionary per text.
+        """
+        if not texts:
+            return []
+        classifier = self._pipeline or self._load()
+        return classifier(
+            list(texts), batch_size=batch_size or self.batch_size, truncation=True
+        )
+
+    def __call__(self, text: str) -> Dict:
+        """Classifies a single text, batched together with concurrent calls."""
+        return self.batcher(text)
+
+
+# Shared by every PerceptionAgent so the weights are loaded once per process
+emotion_classifier = EmotionClassifier(
+    batch_size=int(os.getenv("EMOTION_BATCH_SIZE", "16")),
+    max_wait=float(os.getenv("EMOTION_MAX_WAIT", "0.01")),
+    quantize=os.getenv("EMOTION_QUANTIZE", "0") == "1",
+    num_threads=int(os.getenv("PERCEPTION_THREADS", "0")) or None,
+)
+
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    from transformers import pipeline
+
+    texts = [
+        "I absolutely loved that movie, it made my day!",
+        "That ending was so sad, I cried for an hour.",
+        "Why would they cancel the show, this is infuriating.",
+        "The jump scares in that film were terrifying.",
+    ] * 64
+
+    # Before: a new pipeline for every message
+    start = time.perf_counter()
+    for text in texts[:4]:
+        pipeline("text-classification", model=DEFAULT_EMOTION_MODEL)(text)
+    print(
+        f"new pipeline per call: {(time.perf_counter() - start) / 4 * 1000:8.1f} ms/message"
+    )
+
+    classifier = EmotionClassifier()
+    classifier.classify(texts[:1])  # load the weights once
+    for batch_size in (1, 8, 32):
+        start = time.perf_counter()
+        classifier.classify(texts, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        print(
+            f"cached, batch {batch_size:>2}:      {elapsed / len(texts) * 1000:8.1f} ms/message "
+            f"({len(texts) / elapsed:6.1f} messages/s)"
+        )
+
+    # Concurrent single-message requests, as they arrive from request threads
+    start = time.perf_counter()
+    with ThreadPoolExecutor(32) as pool:
+        list(pool.map(classifier, texts))
+    elapsed = time.perf_counter() - start
+    print(
+        f"micro-batched (32 threads): {len(texts) / elapsed:6.1f} messages/s, "
+        f"avg batch {classifier.batcher.stats()['avg_batch_size']:.1f}"
+    )
@@ -1,5 +1,6 @@
 from enum import Enum
 
+
 # defines a set of attributes
 class Attribute(str, Enum):
     Likes = "Likes"
@@ -18,7 +19,14 @@ class Attribute(str, Enum):
     Rewatcher = "Rewatcher"
     Popularity = "Popularity"
 
+
 # defines a list of available actions
 class Action(str, Enum):
     Create = "Create"
-    Update = "Update"
\ No newline at end of file
+    Update = "Update"
+
+
+# defines the priority classes of LLM calls (lower value is served first)
+class Priority(int, Enum):
+    Interactive = 0
+    Background = 1
@@ -0,0 +1,123 @@
+from typing import Dict, Sequence, TypedDict
+
+from langchain.schema import HumanMessage
+from langchain_core.messages import BaseMessage
+from langgraph.graph import END, StateGraph
+
+from binge_buddy import utils
+from binge_buddy.episodic_store import EpisodicMemoryStore
+from binge_buddy.state_handler import (
+    call_extractor_reviewer,
+    call_memory_extractor,
+    call_memory_sentinel,
+    review_route,
+)
+from binge_buddy.tracing import traced
+
+episodic_store = EpisodicMemoryStore()
+
+
+# Define the state of the episodic agent
+class EpisodicAgentState(TypedDict):
+    # The user whose memories are being processed
+    user_id: str
+    # The session the messages belong to
+    session_id: str
+    # The list of previous messages in the conversation
+    messages: Sequence[BaseMessage]
+    # Whether the information is relevant
+    contains_information: str
+    # The extracted knowledge from the user's message
+    extracted_knowledge: str
+    # The review verdict on the extracted knowledge ("valid" or "invalid: <feedback>")
+    extractor_valid: str
+    # Number of reviews of the extracted knowledge so far
+    extractor_reviews: int
+    # Number of memories appended to the episodic store
+    stored_memories: int
+
+
+@traced("memory.episodic_store")
+def call_memory_store(state):
+    """
+    Appends the approved extracted memories as-is, without aggregation, under the
+    attribute the extractor assigned them to.
+    """
+    facts = utils.parse_extracted_facts(state["extracted_knowledge"])
+    for fact in facts:
+        episodic_store.append(
+            state["user_id"],
+            fact["memory"],
+            attribute=fact["attribute"],
+            session_id=state.get("session_id"),
+        )
+    return {"stored_memories": len(facts)}
+
+
+class EpisodicGraphHandler:
+    """
+    This class is responsible for setting up the episodic workflow graph.
+    """
+
+    def __init__(self):
+        self.state = EpisodicAgentState
+        self.graph = None
+
+    def run(self):
+        self.graph = StateGraph(self.state)
+
+        self.graph.add_node("sentinel", call_memory_sentinel)
+        self.graph.add_node("memory_extractor", call_memory_extractor)
+        self.graph.add_node("memory_reviewer", call_extractor_reviewer)
+        self.graph.add_node("memory_store", call_memory_store)
+
+        self.graph.set_entry_point("sentinel")
+
+        self.graph.add_conditional_edges(
+            "sentinel",
+            lambda x: x["contains_information"],
+            {
+                "yes": "memory_extractor",
+                "no": END,
+            },
+        )
+
+        self.graph.add_conditional_edges(
+            "memory_extractor",
+            lambda state: ("continue" if bool(state["extracted_knowledge"]) else "end"),
+            {
+                "continue": "memory_reviewer",
+                "end": END,
+            },
+        )
+
+        self.graph.add_conditional_edges(
+            "memory_reviewer",
+            review_route(
+                "extractor_valid",
+                "extractor_reviews",
+                "memory_store",
+                "memory_extractor",
+            ),
+        )
+
+        self.graph.add_edge("memory_store", END)
+
+        return self.graph.compile()
+
+
+if __name__ == "__main__":
+    app = EpisodicGraphHandler().run()
+
+    inputs: Dict = {
+        "user_id": "user",
+        "session_id": "session",
+        "messages": [HumanMessage(content="I watched a great horror movie yesterday.")],
+    }
+    for output in app.stream(inputs):
+        for key, value in output.items():
+            print(f"Output from node '{key}':")
+            print(value)
+
+    for memory in episodic_store.query("user", contains="horror"):
+        print(memory)
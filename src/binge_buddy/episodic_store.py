@@ -0,0 +1,467 @@
+"""Append-only, segmented on-disk store for episodic memories"""
+
+import heapq
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+# Index record: timestamp (float64), log offset (uint64), record length (uint32), attribute id (uint16)
+INDEX_RECORD = struct.Struct("<dQIH")
+NO_ATTRIBUTE = 0
+
+Timestamp = Union[float, datetime]
+
+
+def _to_epoch(value: Optional[Timestamp]) -> Optional[float]:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return value
+
+
+class _UserLog:
+    """Segment files, manifest and attribute dictionary of a single user."""
+
+    def __init__(self, directory: Path, segment_max_bytes: int, fsync_every: int):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync_every = fsync_every
+        self.lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self.attributes_path = directory / "attributes.json"
+        self.attribute_ids: Dict[str, int] = {}
+        if self.attributes_path.exists():
+            self.attribute_ids = json.loads(self.attributes_path.read_text())
+        self.attribute_names = {v: k for k, v in self.attribute_ids.items()}
+
+        # The manifest lists the live segments; merges publish by swapping it
+        self.manifest_path = directory / "manifest.json"
+        if self.manifest_path.exists():
+            manifest = json.loads(self.manifest_path.read_text())
+        else:
+            existing = sorted(int(p.stem) for p in directory.glob("*.idx"))
+            manifest = {
+                "segments": existing or [1],
+                "active": existing[-1] if existing else 1,
+            }
+        self.live: List[int] = manifest["segments"]
+        self.segment_id = manifest["active"]
+        self.next_id = max(self.live) + 1
+        self._write_manifest()
+        self._remove_orphans()
+
+        self.log_file = self.index_file = None
+        self.last_ts = self._last_indexed_ts()
+        self._unsynced = 0
+
+    def log_path(self, segment_id: int) -> Path:
+        return self.directory / f"{segment_id:08d}.log"
+
+    def index_path(self, segment_id: int) -> Path:
+        return self.directory / f"{segment_id:08d}.idx"
+
+    def segments(self) -> List[int]:
+        return list(self.live)
+
+    def _write_manifest(self) -> None:
+        tmp = self.manifest_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps({"segments": self.live, "active": self.segment_id}))
+        os.replace(tmp, self.manifest_path)
+
+    def _remove_orphans(self) -> None:
+        # Left behind by a merge that was interrupted before or after its manifest swap
+        for path in (
+            list(self.directory.glob("*.tmp"))
+            + list(self.directory.glob("*.idx"))
+            + list(self.directory.glob("*.log"))
+        ):
+            if path.suffix == ".tmp" or int(path.stem) not in self.live:
+                path.unlink()
+
+    def _last_indexed_ts(self) -> float:
+        index_path = self.index_path(self.segment_id)
+        size = index_path.stat().st_size if index_path.exists() else 0
+        if size < INDEX_RECORD.size:
+            return 0.0
+        with open(index_path, "rb") as f:
+            f.seek(size // INDEX_RECORD.size * INDEX_RECORD.size - INDEX_RECORD.size)
+            return INDEX_RECORD.unpack(f.read(INDEX_RECORD.size))[0]
+
+    def _open_segment(self):
+        self.log_file = open(self.log_path(self.segment_id), "ab")
+        self.index_file = open(self.index_path(self.segment_id), "ab")
+
+    def close(self):
+        """Closes the active segment's files; the next append reopens them."""
+        if self.log_file is not None:
+            self.log_file.close()
+            self.index_file.close()
+            self.log_file = self.index_file = None
+
+    def _roll_over(self):
+        self.close()
+        self.segment_id = self.next_id
+        self.next_id += 1
+        self.live.append(self.segment_id)
+        self.last_ts = 0.0
+        self._open_segment()
+        self._write_manifest()
+
+    def attribute_id(self, attribute: Optional[str]) -> int:
+        if not attribute:
+            return NO_ATTRIBUTE
+        key = attribute.upper()
+        if key not in self.attribute_ids:
+            self.attribute_ids[key] = len(self.attribute_ids) + 1
+            self.attribute_names[self.attribute_ids[key]] = key
+            self.attributes_path.write_text(json.dumps(self.attribute_ids))
+        return self.attribute_ids[key]
+
+    def append(self, ts: float, attribute_id: int, payload: bytes) -> None:
+        if self.log_file is None:
+            self._open_segment()
+        # Each segment's index is sorted by time so range queries can binary search it;
+        # an older timestamp starts a new segment and queries merge the segments
+        if ts < self.last_ts or (
+            self.log_file.tell() + len(payload) > self.segment_max_bytes
+            and self.log_file.tell()
+        ):
+            self._roll_over()
+
+        offset = self.log_file.tell()
+        self.log_file.write(payload)
+        self.index_file.write(INDEX_RECORD.pack(ts, offset, len(payload), attribute_id))
+        self.log_file.flush()
+        self.index_file.flush()
+        self.last_ts = ts
+
+        self._unsynced += 1
+        if self.fsync_every and self._unsynced >= self.fsync_every:
+            os.fsync(self.log_file.fileno())
+            os.fsync(self.index_file.fileno())
+            self._unsynced = 0
+
+    def merge(self, segment_ids: List[int]) -> None:
+        """
+        Rewrites sealed segments as one new segment, sorted by time and without exact
+        duplicate memories. Callers hold the lock.
+        """
+        records = []
+        for segment_id in segment_ids:
+            log_bytes = self.log_path(segment_id).read_bytes()
+            index_bytes = self.index_path(segment_id).read_bytes()
+            usable = len(index_bytes) // INDEX_RECORD.size * INDEX_RECORD.size
+            for ts, offset, length, attribute_id in INDEX_RECORD.iter_unpack(
+                index_bytes[:usable]
+            ):
+                records.append((ts, attribute_id, log_bytes[offset : offset + length]))
+        records.sort(key=lambda record: record[0])
+
+        target = self.next_id
+        self.next_id += 1
+        seen = set()
+        with (
+            open(self.log_path(target), "wb") as out_log,
+            open(self.index_path(target), "wb") as out_index,
+        ):
+            for ts, attribute_id, raw in records:
+                key = (attribute_id, json.loads(raw)["memory"].strip().lower())
+                if key in seen:
+                    continue
+                seen.add(key)
+                out_index.write(
+                    INDEX_RECORD.pack(ts, out_log.tell(), len(raw), attribute_id)
+                )
+                out_log.write(raw)
+            out_log.flush()
+            out_index.flush()
+            os.fsync(out_log.fileno())
+            os.fsync(out_index.fileno())
+
+        # Publish the merged segment in one step; queries snapshot the manifest and open
+        # their files under the lock, so the old files can go as soon as it is swapped
+        merged = set(segment_ids)
+        self.live = [s for s in self.live if s not in merged] + [target]
+        self._write_manifest()
+        for segment_id in segment_ids:
+            self.index_path(segment_id).unlink()
+            self.log_path(segment_id).unlink()
+
+
+class EpisodicMemoryStore:
+    """Long-term episodic memory for Binge Buddy, stored as append-only segment files"""
+
+    def __init__(
+        self,
+        root: Optional[Union[str, Path]] = None,
+        segment_max_bytes: int = 4 * 1024 * 1024,
+        fsync_every: int = 0,
+        max_open_users: int = 128,
+    ):
+        """
+        Initializes the episodic memory store.
+
+        :param root: Directory holding one sub-directory of segments per user.
+        :param segment_max_bytes: Size at which the active segment is rolled over.
+        :param fsync_every: fsync after this many appends (0 leaves syncing to the OS).
+        :param max_open_users: Users whose active segment files are kept open for appends;
+            the least recently written are closed and reopened on their next append.
+        """
+        self.root = Path(root or os.getenv("EPISODIC_STORE_DIR", "episodic_store"))
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync_every = fsync_every
+        self.max_open_users = max_open_users
+        self._logs: Dict[str, _UserLog] = {}
+        self._open: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _user_log(self, user_id: str, writing: bool = False) -> _UserLog:
+        evicted = []
+        with self._lock:
+            if user_id not in self._logs:
+                directory = self.root / re.sub(r"[^A-Za-z0-9_.-]", "_", user_id)
+                self._logs[user_id] = _UserLog(
+                    directory, self.segment_max_bytes, self.fsync_every
+                )
+            if writing:
+                self._open[user_id] = None
+                self._open.move_to_end(user_id)
+                while len(self._open) > self.max_open_users:
+                    evicted.append(self._logs[self._open.popitem(last=False)[0]])
+            user_log = self._logs[user_id]
+        for other in evicted:
+            with other.lock:
+                other.close()
+        return user_log
+
+    def append(
+        self,
+        user_id: str,
+        memory: str,
+        attribute: Optional[str] = None,
+        session_id: Optional[str] = None,
+        timestamp: Optional[Timestamp] = None,
+    ) -> float:
+        """
+        Appends one episodic memory for a user.
+
+        :param user_id: The user the memory belongs to.
+        :param memory: The extracted memory text.
+        :param attribute: Optional attribute the memory was assigned to.
+        :param session_id: Optional session the memory was extracted from.
+        :param timestamp: When the memory was made (defaults to now).
+        :return: The timestamp the memory was indexed under.
+        """
+        ts = _to_epoch(timestamp) or time.time()
+        user_log = self._user_log(user_id, writing=True)
+        with user_log.lock:
+            attribute_id = user_log.attribute_id(attribute)
+            payload = (
+                json.dumps(
+                    {
+                        "ts": ts,
+                        "memory": memory,
+                        "attribute": attribute.upper() if attribute else None,
+                        "session_id": session_id,
+                    }
+                ).encode("utf-8")
+                + b"\n"
+            )
+            user_log.append(ts, attribute_id, payload)
+        return ts
+
+    def query(
+        self,
+        user_id: str,
+        start: Optional[Timestamp] = None,
+        end: Optional[Timestamp] = None,
+        attribute: Optional[str] = None,
+        contains: Optional[str] = None,
+    ) -> Iterator[Dict]:
+        """
+        Streams a user's memories within [start, end), oldest first.
+
+        :param user_id: The user whose memories are queried.
+        :param start: Inclusive lower time bound (None for no bound).
+        :param end: Exclusive upper time bound (None for no bound).
+        :param attribute: Only return memories stored under this attribute.
+        :param contains: Only return memories containing this text (case-insensitive).
+        """
+        start, end = _to_epoch(start), _to_epoch(end)
+        user_log = self._user_log(user_id)
+        with user_log.lock:
+            attribute_id = (
+                user_log.attribute_ids.get(attribute.upper()) if attribute else None
+            )
+            if attribute and attribute_id is None:
+                return
+            # Opened under the lock: a merge may unlink these files once it has released
+            # it, and the open files stay readable until the query is done with them
+            opened = [
+                (open(user_log.index_path(s), "rb"), open(user_log.log_path(s), "rb"))
+                for s in user_log.segments()
+                if user_log.index_path(s).exists()
+            ]
+        needle = contains.lower() if contains else None
+
+        streams = [
+            self._scan(index_file, log_file, start, end, attribute_id, needle)
+            for index_file, log_file in opened
+        ]
+        try:
+            for _, record in heapq.merge(*streams, key=lambda item: item[0]):
+                yield record
+        finally:
+            for stream in streams:
+                stream.close()
+            for index_file, log_file in opened:
+                index_file.close()
+                log_file.close()
+
+    def _scan(
+        self,
+        index_file,
+        log_file,
+        start: Optional[float],
+        end: Optional[float],
+        attribute_id: Optional[int],
+        needle: Optional[str],
+    ) -> Iterator[Tuple[float, Dict]]:
+        """Yields (ts, record) for the matching records of one segment, oldest first."""
+        index_size = (
+            os.fstat(index_file.fileno()).st_size
+            // INDEX_RECORD.size
+            * INDEX_RECORD.size
+        )
+        log_size = os.fstat(log_file.fileno()).st_size
+        if index_size == 0 or log_size == 0:
+            return
+        index = mmap.mmap(index_file.fileno(), index_size, access=mmap.ACCESS_READ)
+        try:
+            count = index_size // INDEX_RECORD.size
+            first_ts = INDEX_RECORD.unpack_from(index, 0)[0]
+            last_ts = INDEX_RECORD.unpack_from(index, (count - 1) * INDEX_RECORD.size)[
+                0
+            ]
+            if (end is not None and first_ts >= end) or (
+                start is not None and last_ts < start
+            ):
+                return
+            log = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                position = self._bisect(index, count, start) if start is not None else 0
+                while position < count:
+                    ts, offset, length, record_attribute = INDEX_RECORD.unpack_from(
+                        index, position * INDEX_RECORD.size
+                    )
+                    position += 1
+                    if end is not None and ts >= end:
+                        return
+                    if attribute_id is not None and record_attribute != attribute_id:
+                        continue
+                    if offset + length > log_size:
+                        return
+                    record = json.loads(log[offset : offset + length])
+                    if needle and needle not in record["memory"].lower():
+                        continue
+                    yield ts, record
+            finally:
+                log.close()
+        finally:
+            index.close()
+
+    @staticmethod
+    def _bisect(index: mmap.mmap, count: int, ts: float) -> int:
+        """First index position with a timestamp >= ts."""
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if INDEX_RECORD.unpack_from(index, middle * INDEX_RECORD.size)[0] < ts:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def compact(self, user_id: str, min_segment_bytes: Optional[int] = None) -> int:
+        """
+        Merges a user's small sealed segments into one and drops exact duplicate memories
+        among them. The active segment is left alone.
+
+        :param user_id: The user whose segments are compacted.
+        :param min_segment_bytes: Segments smaller than this are merged (default: half the max size).
+        :return: The number of segment files removed.
+        """
+        min_segment_bytes = min_segment_bytes or self.segment_max_bytes // 2
+        user_log = self._user_log(user_id)
+        with user_log.lock:
+            small = [
+                s
+                for s in user_log.segments()
+                if s != user_log.segment_id
+                and user_log.log_path(s).stat().st_size < min_segment_bytes
+            ]
+            if len(small) < 2:
+                return 0
+            user_log.merge(small)
+            return len(small) - 1
+
+    def close(self) -> None:
+        """Close all open segment files."""
+        with self._lock:
+            for user_log in self._logs.values():
+                with user_log.lock:
+                    user_log.close()
+            self._logs.clear()
+            self._open.clear()
+
+
+if __name__ == "__main__":
+    # Throughput benchmark: episodic appends vs. the semantic read-merge-write profile path
+    import random
+    import tempfile
+
+    n = 20000
+    topics = ["horror", "sci-fi", "rom-coms", "anime", "documentaries", "thrillers"]
+    memories = [f"Likes {random.choice(topics)} movie number {i}" for i in range(n)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = EpisodicMemoryStore(tmp, segment_max_bytes=256 * 1024)
+        began = time.perf_counter()
+        base = time.time() - n * 60
+        for i, memory in enumerate(memories):
+            store.append("bench", memory, attribute="LIKES", timestamp=base + i * 60)
+        episodic_elapsed = time.perf_counter() - began
+
+        began = time.perf_counter()
+        hits = list(store.query("bench", start=base + n * 30, contains="horror"))
+        query_elapsed = time.perf_counter() - began
+        segments_before = len(store._user_log("bench").segments())
+        store.compact("bench", min_segment_bytes=512 * 1024)
+        segments_after = len(store._user_log("bench").segments())
+        store.close()
+
+        # Semantic path: every new memory re-reads, merges and rewrites the whole profile
+        profile_path = Path(tmp) / "profile.json"
+        profile_path.write_text(
+            json.dumps({"user_id": "bench", "memories": {"LIKES": ""}})
+        )
+        m = n // 10
+        began = time.perf_counter()
+        for memory in memories[:m]:
+            profile = json.loads(profile_path.read_text())
+            profile["memories"]["LIKES"] += f"; {memory}"
+            profile_path.write_text(json.dumps(profile))
+        semantic_elapsed = time.perf_counter() - began
+
+    print(f"Episodic appends:   {n / episodic_elapsed:,.0f} memories/s ({n} memories)")
+    print(f"Semantic rewrites:  {m / semantic_elapsed:,.0f} memories/s ({m} memories)")
+    print(f"Range query:        {len(hits)} hits in {query_elapsed * 1000:.1f} ms")
+    print(f"Compaction:         {segments_before} -> {segments_after} segments")
@@ -43,10 +43,10 @@ class ExtractorReviewer:
         - Ensure all relevant details from the user's message are captured.
         
         3. **Check if format is correct**
-        - Ensure the format of the memory is correct. So in the form of a List of all the memories as a json array in the format 
+        - Ensure the format of the memory is correct. So in the form of a List of all the memories as a json array, each with its category, in the format 
             [
-                "memory" : ...,
-                "memory" : ...,
+                {{"memory" : ..., "attribute" : ...}},
+                {{"memory" : ..., "attribute" : ...}},
                 ...
             ]
 
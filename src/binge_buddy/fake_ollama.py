@@ -0,0 +1,118 @@
+"""Minimal stand-in for the Ollama HTTP API with simulated generation latency, for load tests"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+NANOSECONDS_PER_SECOND = 1e9
+
+
+class FakeOllama(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address=("127.0.0.1", 11435),
+        prompt_tokens_per_second: float = 2000,
+        tokens_per_second: float = 40,
+        response_tokens: int = 40,
+        parallel: int = 4,
+    ):
+        """
+        Initializes the fake Ollama server.
+
+        :param address: The (host, port) to listen on.
+        :param prompt_tokens_per_second: Simulated prompt evaluation speed.
+        :param tokens_per_second: Simulated generation speed.
+        :param response_tokens: Number of tokens in every reply.
+        :param parallel: Requests processed at once (like OLLAMA_NUM_PARALLEL); more queue up.
+        """
+        super().__init__(address, FakeOllamaHandler)
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.slots = threading.Semaphore(parallel)
+
+    def generate(self, prompt_chars: int) -> dict:
+        """Sleeps as long as a real generation would take and returns Ollama-style timings."""
+        prompt_tokens = prompt_chars // 4 + 1
+        prompt_eval = prompt_tokens / self.prompt_tokens_per_second
+        eval_ = self.response_tokens / self.tokens_per_second
+        with self.slots:
+            time.sleep(prompt_eval + eval_)
+        return {
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prompt_eval * NANOSECONDS_PER_SECOND),
+            "eval_count": self.response_tokens,
+            "eval_duration": int(eval_ * NANOSECONDS_PER_SECOND),
+            "total_duration": int((prompt_eval + eval_) * NANOSECONDS_PER_SECOND),
+            "load_duration": 0,
+        }
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    reply = "Response: You might enjoy Arrival, a thoughtful sci-fi film. FALSE"
+
+    def do_POST(self):
+        body = json.loads(
+            self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}"
+        )
+        if self.path == "/api/generate":
+            result = self.server.generate(len(body.get("prompt", "")))
+            result.update(model=body.get("model"), response=self.reply, done=True)
+        elif self.path == "/api/chat":
+            chars = sum(len(m.get("content", "")) for m in body.get("messages", []))
+            result = self.server.generate(chars)
+            result.update(
+                model=body.get("model"),
+                message={"role": "assistant", "content": self.reply},
+                done=True,
+            )
+        else:
+            self.send_error(404)
+            return
+
+        payload = json.dumps(result).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int = 11435, **kwargs) -> FakeOllama:
+    """Starts a fake Ollama server in a background thread and returns it."""
+    server = FakeOllama(("127.0.0.1", port), **kwargs)
+    threading.Thread(
+        target=server.serve_forever, name="fake-ollama", daemon=True
+    ).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run a fake Ollama server for load tests."
+    )
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--tokens-per-second", type=float, default=40)
+    parser.add_argument("--response-tokens", type=int, default=40)
+    parser.add_argument("--parallel", type=int, default=4)
+    args = parser.parse_args()
+
+    server = FakeOllama(
+        ("127.0.0.1", args.port),
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        parallel=args.parallel,
+    )
+    print(f"Fake Ollama listening on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -1,56 +1,411 @@
-from flask import Flask, request, jsonify, render_template, session
+from flask import Flask, Request, request, jsonify, render_template, session, g
+import logging
 import os
-from threading import Thread
-from binge_buddy.semantic_agent import ConversationalAgent
+import threading
+import time
+import uuid
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, wait
+from binge_buddy.audio_io import SAMPLE_RATE, AudioDecodeError, decode_audio
+from binge_buddy.context_window import ContextWindow
+from binge_buddy.emotion_classifier import emotion_classifier
+from binge_buddy.enums import Priority
+from binge_buddy.llm_scheduler import OverloadedError, priority, scheduler
+from binge_buddy.memory_compactor import CompactionWorker, MemoryCompactor
+from binge_buddy.semantic_agent import CHAT_MODE, SemanticAgent
 from binge_buddy.message import Message
 from binge_buddy.message_log import MessageLog
+from binge_buddy.message_store import MessageStore
 from binge_buddy.ollama import OllamaLLM
 from binge_buddy.perception_agent import PerceptionAgent
+from binge_buddy.perception_pool import PerceptionPool, parse_cpu_list
+from binge_buddy.response_cache import ResponseCache
+from binge_buddy.session_registry import Session, SessionRegistry
 from langchain.schema import HumanMessage
-import threading
-from binge_buddy.state_handler import app as memory_app
+from binge_buddy.state_handler import GraphHandler, MEMORY_COLLECTION
+from binge_buddy.state_handler import db, memory_index, seed_memory_index
+from binge_buddy.vad import VoiceActivityDetector
+from binge_buddy.tracing import (
+    bind_context,
+    configure_logging,
+    configure_tracing,
+    current_span,
+    parse_traceparent,
+    tracer,
+)
+
+
+configure_logging()
+configure_tracing()
+logger = logging.getLogger(__name__)
+
+
+class InMemoryRequest(Request):
+    """Keeps uploaded files in memory instead of spooling large ones to a temporary file."""
+
+    def _get_file_stream(
+        self, total_content_length, content_type, filename=None, content_length=None
+    ):
+        return BytesIO()
 
 
 # Set up the Flask app
 app = Flask(__name__)
-# Initialize global agent and message log (persistent across requests)
+app.request_class = InMemoryRequest
+# Uploads are held in memory, so bound their size
+app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024
+app.secret_key = os.getenv("FLASK_SECRET_KEY", os.urandom(24))
+# Initialize global agents (shared across requests)
 llm = OllamaLLM()
-agent = PerceptionAgent()
-message_log = MessageLog(user_id="user", session_id="session")
-conversational_agent = ConversationalAgent(llm, message_log)
-
-sample_memory = {
-    "user_id": "kanta_001",
-    "name": "Kanta",
-    "memories": {
-        "LIKES": "Kanta likes sci-fi and action movies but he also enjoys rom-coms.",
-        "DISLIKES": "Kanta hates Japanese movies, especially anime.",
-        "FAVOURITES": "Kanta's favorite movie is Inception, and he loves Christopher Nolan's films.",
-        "GENRE": "Kanta prefers movies with deep storytelling, complex characters, and mind-bending plots.",
-    },
-    "last_updated": "2024-03-09T12:00:00Z",
-}
-
-
-def run_memory_in_background(response, sample_memory):
+# Silence is trimmed before transcription, and silent uploads are not transcribed at all
+vad = None
+if os.getenv("VAD", "1") == "1":
+    vad = VoiceActivityDetector(os.getenv("VAD_BACKEND", "energy"))
+agent = PerceptionAgent(
+    batch_size=int(os.getenv("WHISPER_BATCH_SIZE", "8")),
+    max_wait=float(os.getenv("WHISPER_MAX_WAIT", "0.02")),
+    vad=vad,
+    backend=os.getenv("WHISPER_BACKEND", "torch"),
+    num_threads=int(os.getenv("PERCEPTION_THREADS", "0")) or None,
+)
+# PERCEPTION_PROCESSES > 0 moves upload transcription out of the request threads into
+# worker processes, so that it does not compete with chat turns for the interpreter
+perception_pool = None
+if int(os.getenv("PERCEPTION_PROCESSES", "0")) > 0:
+    perception_pool = PerceptionPool(
+        workers=int(os.getenv("PERCEPTION_PROCESSES")),
+        settings={
+            "backend": agent.backend,
+            "num_threads": agent.num_threads,
+            "vad_backend": vad.backend if vad else None,
+        },
+        cpus=parse_cpu_list(os.getenv("PERCEPTION_CPUS")),
+    )
+# The profile indexes are created by the storage start-up thread below
+memory_app = GraphHandler().run(ensure_indexes=False)
+message_store = MessageStore()
+CONTEXT_TURNS = int(os.getenv("CONTEXT_TURNS", "12"))
+# Background memory pipeline runs, tracked so that shutdown can wait for them
+memory_jobs = ThreadPoolExecutor(
+    max_workers=int(os.getenv("MEMORY_WORKERS", "4")), thread_name_prefix="memory"
+)
+pending_memory_jobs = set()
+
+# Oversized memory values are compacted in the background once chat has been idle for a while
+compaction_worker = None
+if os.getenv("MEMORY_COMPACTION", "1") == "1":
+    compaction_worker = CompactionWorker(
+        MemoryCompactor(llm, db, memory_index=memory_index),
+        interval_seconds=float(os.getenv("COMPACTION_INTERVAL", "3600")),
+        idle_seconds=float(os.getenv("COMPACTION_IDLE", "300")),
+    )
+    compaction_worker.start()
+
+SETTINGS_COLLECTION = "user_settings"
+# Replies to near-identical opening questions, shared by users with the same relevant memories
+response_cache = None
+if os.getenv("RESPONSE_CACHE", "1") == "1":
+    response_cache = ResponseCache(
+        memory_index.embed_fn,
+        threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.92")),
+        max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "5000")),
+        ttl=float(os.getenv("RESPONSE_CACHE_TTL", "86400")),
+        opt_outs_loaded=False,
+    )
+
+# Models load on first use; WARMUP_MODELS=1 loads them in the background at startup instead
+warmup = {"status": "disabled", "seconds": None}
+
+
+def warm_up_models():
+    start = time.perf_counter()
+    try:
+        with tracer.span("startup.warm_up"):
+            memory_index.embedder.embed(["warm up"])
+            agent.warm_up()
+    except Exception:
+        logger.exception("Model warm-up failed")
+        warmup["status"] = "failed"
+        return
+    warmup.update(status="done", seconds=round(time.perf_counter() - start, 2))
+    logger.info("Models warmed up in %.1fs", warmup["seconds"])
+
+
+if os.getenv("WARMUP_MODELS", "0") == "1":
+    warmup["status"] = "running"
+    threading.Thread(target=warm_up_models, name="model-warmup", daemon=True).start()
+
+# Database work is kept off the import path, so that a slow or unreachable database does
+# not hold up startup; /readyz reports its progress
+storage = {"status": "running", "seconds": None, "memory_index": "pending"}
+# Memory pipeline runs write versioned profiles, which need the indexes
+storage_ready = threading.Event()
+
+
+def start_storage():
+    start = time.perf_counter()
+    try:
+        with tracer.span("startup.storage"):
+            db.ensure_indexes(MEMORY_COLLECTION)
+            if response_cache:
+                response_cache.load_opt_outs(
+                    settings["user_id"]
+                    for settings in db.find(
+                        SETTINGS_COLLECTION, {"response_cache_opt_out": True}
+                    )
+                )
+    except Exception:
+        logger.exception("Storage start-up failed")
+        storage["status"] = "failed"
+        return
+    finally:
+        storage_ready.set()
+    storage.update(status="done", seconds=round(time.perf_counter() - start, 2))
+
+    # The memory index lives in memory only: rebuild it from the stored profiles
+    storage["memory_index"] = "running"
+    try:
+        seed_memory_index()
+    except Exception:
+        logger.exception("Seeding the memory index failed")
+        storage["memory_index"] = "failed"
+        return
+    storage["memory_index"] = "done"
+
+
+threading.Thread(target=start_storage, name="storage-startup", daemon=True).start()
+
+
+def create_session(user_id, session_id):
+    """Creates (or lazily reopens) the message log and conversational agent of a chat session."""
+    # Only the tail that fits in the agent's context window, plus the turns its stored
+    # summary does not cover yet, is read back from disk
+    summary = message_store.load_summary(user_id, session_id)
+    tail = max(CONTEXT_TURNS, (summary or {}).get("unsummarized", 0))
+    message_log = MessageLog.rehydrate(
+        message_store, session_id=session_id, user_id=user_id, tail=tail
+    )
+    context_window = ContextWindow(
+        llm, message_log, max_turns=CONTEXT_TURNS, sticky=CHAT_MODE
+    )
+    context_window.restore(summary)
+    conversational_agent = SemanticAgent(
+        llm,
+        message_log,
+        memory_index=memory_index,
+        context_window=context_window,
+        response_cache=response_cache,
+    )
+    return Session(user_id, session_id, message_log, conversational_agent)
+
+
+def close_session_log(chat_session):
+    """
+    Eviction hook: the messages are already persisted, only the context-window summary
+    is stored for when the session is reopened, and the file released.
+    """
+    context_window = chat_session.agent.context_window
+    message_store.save_summary(
+        chat_session.user_id, chat_session.session_id, context_window.snapshot()
+    )
+    context_window.reset()
+    message_store.close_session(chat_session.user_id, chat_session.session_id)
+
+
+# One conversation per (user_id, session_id), evicted when idle or over budget
+session_registry = SessionRegistry(
+    create_session,
+    max_sessions=int(os.getenv("MAX_SESSIONS", "10000")),
+    max_bytes=int(os.getenv("SESSION_MEMORY_MB", "512")) * 1024 * 1024,
+    idle_ttl=float(os.getenv("SESSION_IDLE_TTL", "1800")),
+    on_evict=[close_session_log],
+)
+session_registry.start_sweeper()
+
+
+def get_session_key(data):
+    """Resolves (user_id, session_id) from the request body or the session cookie."""
+    user_id = (data or {}).get("user_id") or session.setdefault(
+        "user_id", uuid.uuid4().hex
+    )
+    session_id = (data or {}).get("session_id") or session.setdefault(
+        "session_id", uuid.uuid4().hex
+    )
+    return user_id, session_id
+
+
+def run_memory_in_background(response, user_id):
     """Runs memory processing in a separate thread after returning response."""
+    # The aggregator reads the user's stored profile itself, right before merging into it
     inputs = {
+        "user_id": user_id,
         "messages": [HumanMessage(content=response)],
-        "memories": sample_memory,
+        "memories": {},
     }
-    memory_thread = threading.Thread(target=run_memory_module, args=(inputs,))
-    memory_thread.daemon = True  # Ensures the thread exits when the main program stops
-    memory_thread.start()
+    # The memory pipeline is traced as part of the request that triggered it
+    job = memory_jobs.submit(bind_context(run_memory_module), inputs)
+    pending_memory_jobs.add(job)
+    job.add_done_callback(pending_memory_jobs.discard)
+
+
+def drain_memory_jobs(timeout=None):
+    """
+    Waits for the queued and running memory pipeline jobs to finish (graceful shutdown).
+
+    :param timeout: Maximum seconds to wait, None waits indefinitely.
+    :return: The number of jobs that did not finish in time.
+    """
+    _, not_done = wait(list(pending_memory_jobs), timeout=timeout)
+    return len(not_done)
+
+
+def chat_turn(user_id, session_id, text):
+    """Appends the user's message to its session, runs the agent and queues the memory pipeline."""
+    # Shed load before the message is logged, so that a retry does not duplicate it
+    scheduler.check_admission(Priority.Interactive)
+    if compaction_worker:
+        compaction_worker.notify_activity()
+    # Requests on the same session are serialized, different sessions run in parallel
+    with session_registry.session(user_id, session_id) as chat_session:
+        user_message_obj = Message(
+            role="user", content=text, user_id=user_id, session_id=session_id
+        )
+        # Written to disk together with the reply: a turn shed by the LLM scheduler
+        # below is taken back, so that the client's retry does not log the message twice
+        chat_session.message_log.add_message(user_message_obj, persist=False)
+        try:
+            response = chat_session.agent.run()
+        except OverloadedError:
+            chat_session.message_log.remove_message(user_message_obj)
+            raise
+    logger.debug("Agent response: %s", response)
+
+    run_memory_in_background(text, user_id)
+    return response
 
 
 def run_memory_module(inputs):
     """Function to process memory pipeline in the background."""
-    for output in memory_app.with_config({"run_name": "Memory"}).stream(inputs):
-        for key, value in output.items():
-            print(f"Output from node '{key}':")
-            print("---")
-            print(value)
-        print("\n---\n")
+    storage_ready.wait()
+    with (
+        tracer.span("memory.pipeline", {"user_id": inputs["user_id"]}),
+        priority(Priority.Background),
+    ):
+        try:
+            for output in memory_app.with_config({"run_name": "Memory"}).stream(inputs):
+                for key, value in output.items():
+                    logger.debug("Output from node '%s': %s", key, value)
+        except OverloadedError as e:
+            logger.warning("Memory pipeline for %s dropped: %s", inputs["user_id"], e)
+
+
+@app.before_request
+def start_request_span():
+    """Opens the root span of the request, continuing the caller's trace if one was sent."""
+    trace_id, parent_id = parse_traceparent(request.headers.get("traceparent"))
+    g.request_span = tracer.span(
+        f"{request.method} {request.path}", trace_id=trace_id, parent_id=parent_id
+    )
+    g.request_span.__enter__()
+
+
+@app.after_request
+def add_trace_header(response):
+    span = current_span()
+    if span is not None:
+        span.set_attribute("http.status_code", response.status_code)
+        response.headers["X-Trace-Id"] = span.trace_id
+    return response
+
+
+@app.teardown_request
+def end_request_span(exc):
+    request_span = g.pop("request_span", None)
+    if request_span is not None:
+        request_span.__exit__(type(exc) if exc else None, exc, None)
+
+
+@app.errorhandler(OverloadedError)
+def handle_overloaded(e):
+    """The LLM is saturated: tell the client to try again instead of queueing indefinitely."""
+    response = jsonify({"error": "Binge Buddy is busy, please try again shortly."})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(int(e.retry_after + 0.5))
+    return response
+
+
+@app.route("/metrics")
+def metrics():
+    return jsonify(
+        {
+            "llm_scheduler": scheduler.stats(),
+            "sessions": session_registry.stats(),
+            "response_cache": (
+                response_cache.stats.snapshot() if response_cache else None
+            ),
+            "whisper_batcher": agent.batcher.stats(),
+            "emotion_batcher": emotion_classifier.batcher.stats(),
+            "vad": agent.vad.snapshot() if agent.vad else None,
+            "perception_pool": perception_pool.stats() if perception_pool else None,
+            "compaction": (
+                str(compaction_worker.last_report)
+                if compaction_worker and compaction_worker.last_report
+                else None
+            ),
+        }
+    )
+
+
+@app.route("/healthz")
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz")
+def readyz():
+    """
+    Readiness: 503 while the warm-up or the storage start-up (indexes, cache opt-outs) is
+    running or after either failed, so a load balancer can hold traffic back. Without
+    warm-up models load on first use. Seeding the memory index does not hold back
+    readiness, it is only reported.
+    """
+    ready = warmup["status"] in ("disabled", "done") and storage["status"] == "done"
+    body = {
+        "ready": ready,
+        "warmup": warmup,
+        "storage": storage,
+        "models": {
+            "whisper": agent.loaded,
+            "emotion": emotion_classifier.loaded,
+            "embedder": memory_index.embedder.loaded,
+        },
+    }
+    return jsonify(body), 200 if ready else 503
+
+
+@app.route("/session")
+def current_session():
+    """The ids of the cookie session, for clients that connect to /ws/transcribe."""
+    user_id, session_id = get_session_key(None)
+    return jsonify({"user_id": user_id, "session_id": session_id})
+
+
+@app.route("/preferences", methods=["POST"])
+def update_preferences():
+    """Lets a user opt out of (or back into) cached replies."""
+    data = request.get_json() or {}
+    user_id, _ = get_session_key(data)
+    if "response_cache" in data:
+        opted_out = not data["response_cache"]
+        db.upsert_many(
+            SETTINGS_COLLECTION,
+            [{"user_id": user_id, "response_cache_opt_out": opted_out}],
+        )
+        if response_cache:
+            response_cache.set_opt_out(user_id, opted_out)
+    enabled = response_cache is not None and user_id not in response_cache.opted_out
+    return jsonify({"user_id": user_id, "response_cache": enabled})
 
 
 @app.route("/")
@@ -64,18 +419,10 @@ def handle_user_message():
     data = request.get_json()
     if "text" in data:
         user_message = data["text"]
-        print(f"User message received: {user_message}")
+        logger.debug("User message received: %s", user_message)
 
-        user_message_obj = Message(
-            role="user", content=user_message, user_id="user", session_id="session"
-        )
-        message_log.add_message(user_message_obj)
-
-        # Run agent response generation in the background
-        response = conversational_agent.run()
-        print(f"Agent response: {response}")
-
-        run_memory_in_background(data["text"], sample_memory)
+        user_id, session_id = get_session_key(data)
+        response = chat_turn(user_id, session_id, user_message)
 
         return jsonify({"response": response})
 
@@ -85,23 +432,24 @@ def upload_audio():
     if "audio" not in request.files:
         return "No audio file uploaded", 400
 
-    audio_file = request.files["audio"]
-    filename = audio_file.filename
-    file_path = os.path.join("./audio", filename)
-
-    # Save the audio file to disk
-    audio_file.save(file_path)
+    # Decode the upload in memory; nothing is written to disk
+    try:
+        with tracer.span("upload.decode") as span:
+            audio = decode_audio(request.files["audio"].read())
+            span.set_attribute("audio.seconds", round(len(audio) / SAMPLE_RATE, 2))
+    except AudioDecodeError as e:
+        return str(e), 400
 
-    # Transcribe the audio file to text
-    transcribed_text = agent.transcribe(file_path)
+    # Transcribe the audio to text
+    transcribed_text = (perception_pool or agent).transcribe_audio(audio)
 
     # Immediately return the transcribed text to the frontend
     return jsonify({"transcribed_text": transcribed_text})
 
 
 def run_flask():
-    """Start the Flask application."""
-    app.run(port=5000, host="0.0.0.0", debug=True)
+    """Start the Flask development server (see binge_buddy.serve for production)."""
+    app.run(port=5000, host="0.0.0.0", debug=os.getenv("FLASK_DEBUG", "0") == "1")
 
 
 if __name__ == "__main__":
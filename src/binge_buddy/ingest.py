@@ -0,0 +1,292 @@
+"""Parallel, resumable bulk transcription of audio files into JSONL"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Set
+
+from binge_buddy.audio_io import SAMPLE_RATE, decode_audio
+from binge_buddy.profile_io import open_jsonl
+
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".m4a", ".ogg", ".opus", ".webm", ".flac", ".aac"}
+
+
+def iter_sources(source: str, user_id: Optional[str] = None) -> Iterator[Dict]:
+    """
+    Yields {"path", "user_id"} for every audio file of a directory (recursively) or of a
+    manifest: a JSONL file of {"path", "user_id"} records, or a text file of one path per line.
+    Relative manifest paths are resolved against the manifest's directory.
+    """
+    root = Path(source)
+    if root.is_dir():
+        for path in sorted(root.rglob("*")):
+            if path.is_file() and path.suffix.lower() in AUDIO_EXTENSIONS:
+                yield {"path": str(path), "user_id": user_id}
+        return
+    with open_jsonl(source, "r") as manifest:
+        for line in manifest:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            entry = json.loads(line) if line.startswith("{") else {"path": line}
+            path = Path(entry["path"])
+            if not path.is_absolute():
+                path = root.parent / path
+            yield {"path": str(path), "user_id": entry.get("user_id", user_id)}
+
+
+def _ends_mid_line(path: str) -> bool:
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return False
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+
+def load_done(path: str) -> Set[str]:
+    """Content hashes already transcribed successfully by earlier runs into ``path``."""
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as results:
+        for line in results:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short when an earlier run was killed
+            if "error" not in record:
+                done.add(record["sha256"])
+    return done
+
+
+class Progress:
+    def __init__(self, every: int):
+        self.every = every
+        self.processed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.audio_seconds = 0.0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, record: Optional[Dict]) -> None:
+        with self._lock:
+            if record is None:
+                self.skipped += 1
+                return
+            if "error" in record:
+                self.failed += 1
+            else:
+                self.processed += 1
+                self.audio_seconds += record["duration"]
+            if (self.processed + self.failed) % self.every == 0:
+                print(self)
+
+    def __str__(self):
+        minutes = (time.perf_counter() - self.started) / 60
+        rate = self.processed / minutes if minutes else 0.0
+        speed = self.audio_seconds / 60 / minutes if minutes else 0.0
+        return (
+            f"Transcribed {self.processed} files ({rate:,.1f} files/min, {speed:.1f}x real time), "
+            f"{self.skipped} skipped, {self.failed} failed"
+        )
+
+
+class Ingestor:
+    def __init__(
+        self,
+        output: str,
+        concurrency: int = 4,
+        processes: int = 0,
+        backend: str = "torch",
+        use_vad: bool = True,
+        memory: bool = False,
+        report_every: int = 25,
+    ):
+        """
+        Initializes the ingestor.
+
+        :param output: JSONL results file; appended to, so an interrupted run can resume.
+            It cannot be gzipped: a run killed mid-write would leave it unreadable.
+        :param concurrency: Files read, decoded and transcribed at the same time.
+        :param processes: Worker processes for transcription (0 transcribes in this process,
+            batching the concurrent files into shared Whisper calls).
+        :param backend: Whisper inference backend (see PerceptionAgent).
+        :param use_vad: Trim silence before transcription.
+        :param memory: Feed each transcript through the memory pipeline of its user.
+        :param report_every: Print progress every this many files.
+        """
+        from binge_buddy.emotion_classifier import emotion_classifier
+        from binge_buddy.perception_agent import PerceptionAgent
+        from binge_buddy.perception_pool import PerceptionPool
+        from binge_buddy.vad import VoiceActivityDetector
+
+        if output.endswith(".gz"):
+            raise ValueError(
+                "The results file is appended to line by line, it cannot be gzipped"
+            )
+        self.output = output
+        self.concurrency = concurrency
+        self.progress = Progress(report_every)
+        self.done = load_done(output)
+        self._lock = threading.Lock()
+        if processes:
+            settings = {
+                "backend": backend,
+                "vad_backend": "energy" if use_vad else None,
+            }
+            self.transcriber = PerceptionPool(processes, settings=settings)
+            self.classify = lambda text: self.transcriber.extract_emotions([text])[0]
+        else:
+            vad = VoiceActivityDetector() if use_vad else None
+            self.transcriber = PerceptionAgent(
+                backend=backend, batch_size=concurrency, vad=vad
+            )
+            self.classify = emotion_classifier
+        self.memory_app = None
+        if memory:
+            from binge_buddy.state_handler import GraphHandler
+
+            self.memory_app = GraphHandler().run()
+
+    def _run_memory(self, user_id: str, transcript: str) -> None:
+        from langchain.schema import HumanMessage
+
+        inputs = {
+            "user_id": user_id,
+            "messages": [HumanMessage(content=transcript)],
+            "memories": {},
+        }
+        for _ in self.memory_app.with_config({"run_name": "Memory"}).stream(inputs):
+            pass
+
+    def process(self, source: Dict) -> Optional[Dict]:
+        """Transcribes one file; returns None when its content was already transcribed."""
+        try:
+            data = Path(source["path"]).read_bytes()
+        except OSError as e:
+            return {**source, "error": f"{type(e).__name__}: {e}"}
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if digest in self.done:
+                return None
+            # Also skips copies of the same recording within this run
+            self.done.add(digest)
+        record = {
+            "path": source["path"],
+            "sha256": digest,
+            "user_id": source["user_id"],
+        }
+        start = time.perf_counter()
+        try:
+            audio = decode_audio(data)
+            del data
+            record["duration"] = round(len(audio) / SAMPLE_RATE, 2)
+            record["transcript"] = self.transcriber.transcribe_audio(audio).strip()
+            record["emotion"] = (
+                self.classify(record["transcript"]) if record["transcript"] else None
+            )
+            if (
+                self.memory_app is not None
+                and record["transcript"]
+                and source["user_id"]
+            ):
+                self._run_memory(source["user_id"], record["transcript"])
+        except Exception as e:
+            with self._lock:
+                self.done.discard(digest)  # retried by the next run
+            record["error"] = f"{type(e).__name__}: {e}"
+        record["seconds"] = round(time.perf_counter() - start, 2)
+        return record
+
+    def run(self, sources: Iterator[Dict]) -> Progress:
+        """Processes every source, writing each result as soon as it is ready."""
+        # Start on a fresh line if an earlier run was killed mid-write
+        cut_short = _ends_mid_line(self.output)
+        with (
+            open(self.output, "a", encoding="utf-8") as out,
+            ThreadPoolExecutor(self.concurrency) as pool,
+        ):
+            if cut_short:
+                out.write("\n")
+            pending = set()
+            try:
+                for source in sources:
+                    if len(pending) >= 2 * self.concurrency:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        self._write(out, finished)
+                    pending.add(pool.submit(self.process, source))
+                self._write(out, pending)
+            except KeyboardInterrupt:
+                for future in pending:
+                    future.cancel()
+                print("Interrupted; run the same command again to resume.")
+                raise
+        return self.progress
+
+    def _write(self, out, futures) -> None:
+        for future in futures:
+            record = future.result()
+            if record is not None:
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+            self.progress.add(record)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Bulk transcription of audio files into JSONL."
+    )
+    parser.add_argument(
+        "source", help="Directory of audio files, or a manifest (JSONL or text)."
+    )
+    parser.add_argument(
+        "output", help="JSONL results file; rerun with the same file to resume."
+    )
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument(
+        "--processes", type=int, default=0, help="Transcription worker processes."
+    )
+    parser.add_argument(
+        "--backend", choices=["torch", "int8", "ctranslate2"], default="torch"
+    )
+    parser.add_argument("--no-vad", action="store_true", help="Do not trim silence.")
+    parser.add_argument(
+        "--user-id", default=None, help="User of files without one in the manifest."
+    )
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="Run each transcript through the memory pipeline.",
+    )
+    parser.add_argument("--report-every", type=int, default=25)
+    args = parser.parse_args()
+    if args.output.endswith(".gz"):
+        parser.error(
+            "the results file cannot be gzipped (compress it once the run is done)"
+        )
+
+    ingestor = Ingestor(
+        args.output,
+        concurrency=args.concurrency,
+        processes=args.processes,
+        backend=args.backend,
+        use_vad=not args.no_vad,
+        memory=args.memory,
+        report_every=args.report_every,
+    )
+    try:
+        progress = ingestor.run(iter_sources(args.source, args.user_id))
+    finally:
+        if args.processes:
+            ingestor.transcriber.close()
+    print(progress)
+
+
+if __name__ == "__main__":
+    main()
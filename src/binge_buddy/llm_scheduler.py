@@ -0,0 +1,314 @@
+"""Priority admission control in front of the LLM: interactive turns first, background work deferred"""
+
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from binge_buddy.enums import Priority
+
+_current_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar(
+    "llm_priority", default=Priority.Interactive
+)
+# Set when the background call holding the slot of this context should give it up
+_preempt_event: contextvars.ContextVar[Optional[threading.Event]] = (
+    contextvars.ContextVar("llm_preempt_event", default=None)
+)
+
+
+class OverloadedError(Exception):
+    """Raised when an LLM call is shed instead of queued; retry after ``retry_after`` seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@contextmanager
+def priority(value: Priority) -> Iterator[None]:
+    """Runs the LLM calls made inside the block (in this context) with the given priority."""
+    token = _current_priority.set(value)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority() -> Priority:
+    return _current_priority.get()
+
+
+def preempted() -> bool:
+    """Whether the background call running in this context should give up its slot."""
+    event = _preempt_event.get()
+    return event is not None and event.is_set()
+
+
+class ClassMetrics:
+    """Queue wait statistics of one priority class."""
+
+    def __init__(self, window: int = 1000):
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.preempted = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._recent = deque(maxlen=window)
+
+    def record_wait(self, seconds: float) -> None:
+        self.admitted += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+        self._recent.append(seconds)
+
+    def snapshot(self) -> Dict:
+        recent = sorted(self._recent)
+        percentile = lambda q: recent[int(q * (len(recent) - 1))] if recent else 0.0
+        return {
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "preempted": self.preempted,
+            "wait_avg_ms": (
+                1000 * self.wait_total / self.admitted if self.admitted else 0.0
+            ),
+            "wait_p50_ms": 1000 * percentile(0.5),
+            "wait_p95_ms": 1000 * percentile(0.95),
+            "wait_max_ms": 1000 * self.wait_max,
+        }
+
+
+class LLMScheduler:
+    def __init__(
+        self,
+        max_concurrent: int = 1,
+        max_background: Optional[int] = None,
+        max_queue: Optional[Dict[Priority, int]] = None,
+        max_wait: Optional[Dict[Priority, Optional[float]]] = None,
+        initial_service_time: float = 5.0,
+    ):
+        """
+        Initializes the scheduler.
+
+        :param max_concurrent: LLM calls in flight at once (match OLLAMA_NUM_PARALLEL).
+        :param max_background: Slots background calls may take (defaults to all but one, so
+            an interactive call never waits behind background calls). If background calls
+            may take every slot (always the case with a single one), a waiting interactive
+            call preempts them instead: see ``preempted``.
+        :param max_queue: Queue depth limit per priority class; calls beyond it are rejected.
+        :param max_wait: Queue wait SLO per priority class (None: wait indefinitely). Calls
+            whose estimated wait exceeds it are rejected up front, waits that run over it
+            are abandoned.
+        :param initial_service_time: Seconds per call assumed until calls have been measured.
+        """
+        self.max_concurrent = max_concurrent
+        self.max_background = max_background or max(1, max_concurrent - 1)
+        self.preempt_background = self.max_background >= max_concurrent
+        self.max_queue = {
+            Priority.Interactive: 32,
+            Priority.Background: 512,
+            **(max_queue or {}),
+        }
+        self.max_wait = {
+            Priority.Interactive: 15.0,
+            Priority.Background: None,
+            **(max_wait or {}),
+        }
+        self.metrics = {p: ClassMetrics() for p in Priority}
+
+        self._cond = threading.Condition()
+        self._running = {p: 0 for p in Priority}
+        self._waiting = []  # heap of (priority, sequence)
+        self._background_calls = set()  # preemption events of running background calls
+        self._sequence = itertools.count()
+        self._service_time = initial_service_time  # moving average of call durations
+
+    def _has_capacity(self, priority: Priority) -> bool:
+        if sum(self._running.values()) >= self.max_concurrent:
+            return False
+        return priority == Priority.Interactive or (
+            self._running[Priority.Background] < self.max_background
+        )
+
+    def estimated_wait(self, priority: Priority) -> float:
+        """Rough queue wait of a new call: the work ahead of it spread over the slots."""
+        ahead = sum(1 for p, _ in self._waiting if p <= priority)
+        busy = sum(self._running.values())
+        return (ahead + busy) * self._service_time / self.max_concurrent
+
+    def _reject(
+        self, priority: Priority, reason: str, retry_after: float
+    ) -> OverloadedError:
+        self.metrics[priority].rejected += 1
+        return OverloadedError(reason, retry_after=max(1.0, retry_after))
+
+    def _admit(self, priority: Priority) -> None:
+        depth = sum(1 for p, _ in self._waiting if p == priority)
+        if depth >= self.max_queue[priority]:
+            raise self._reject(
+                priority,
+                f"{priority.name} LLM queue is full",
+                self.estimated_wait(priority),
+            )
+        slo = self.max_wait[priority]
+        estimate = self.estimated_wait(priority)
+        if slo is not None and estimate > slo:
+            raise self._reject(
+                priority,
+                f"Estimated LLM wait {estimate:.1f}s exceeds the SLO",
+                estimate,
+            )
+
+    def check_admission(self, priority: Optional[Priority] = None) -> None:
+        """
+        Raises OverloadedError right away if a call of this priority would be shed, so that
+        a request can be turned away before any work is done for it.
+        """
+        priority = priority if priority is not None else current_priority()
+        with self._cond:
+            if self._waiting or not self._has_capacity(priority):
+                self._admit(priority)
+
+    def _acquire(self, priority: Priority) -> float:
+        enqueued = time.monotonic()
+        with self._cond:
+            if not self._waiting and self._has_capacity(priority):
+                self._running[priority] += 1
+                self.metrics[priority].record_wait(0.0)
+                return 0.0
+
+            self._admit(priority)
+            slo = self.max_wait[priority]
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+            deadline = enqueued + slo if slo is not None else None
+            while not (self._waiting[0] == ticket and self._has_capacity(priority)):
+                if priority == Priority.Interactive and self.preempt_background:
+                    # No slot is reserved for interactive calls: take one back
+                    for event in self._background_calls:
+                        event.set()
+                remaining = (
+                    deadline - time.monotonic() if deadline is not None else None
+                )
+                if remaining is not None and remaining <= 0:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                    self.metrics[priority].timed_out += 1
+                    self._cond.notify_all()
+                    raise self._reject(
+                        priority,
+                        "LLM queue wait exceeded the SLO",
+                        self.estimated_wait(priority),
+                    )
+                self._cond.wait(remaining)
+
+            heapq.heappop(self._waiting)
+            self._running[priority] += 1
+            waited = time.monotonic() - enqueued
+            self.metrics[priority].record_wait(waited)
+            # The next waiter may fit in a remaining slot as well
+            self._cond.notify_all()
+            return waited
+
+    def _release(self, priority: Priority, duration: float) -> None:
+        with self._cond:
+            self._running[priority] -= 1
+            self._service_time = 0.8 * self._service_time + 0.2 * duration
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: Optional[Priority] = None) -> Iterator[float]:
+        """
+        Waits for an LLM slot. Yields the time spent queueing.
+
+        :param priority: The priority class (defaults to the one set with ``priority()``).
+        :raises OverloadedError: If the call is shed because of queue depth or wait SLO.
+        """
+        priority = priority if priority is not None else current_priority()
+        waited = self._acquire(priority)
+        start = time.monotonic()
+        event = threading.Event()
+        if priority == Priority.Background:
+            with self._cond:
+                self._background_calls.add(event)
+        token = _preempt_event.set(event)
+        try:
+            yield waited
+        finally:
+            _preempt_event.reset(token)
+            with self._cond:
+                self._background_calls.discard(event)
+                if event.is_set():
+                    self.metrics[priority].preempted += 1
+            self._release(priority, time.monotonic() - start)
+
+    def stats(self) -> Dict:
+        """Queue depth, in-flight calls and wait statistics per priority class."""
+        with self._cond:
+            return {
+                "service_time_ms": 1000 * self._service_time,
+                **{
+                    p.name.lower(): {
+                        "queued": sum(1 for q, _ in self._waiting if q == p),
+                        "running": self._running[p],
+                        **self.metrics[p].snapshot(),
+                    }
+                    for p in Priority
+                },
+            }
+
+
+def _optional_float(value: str) -> Optional[float]:
+    return float(value) if value else None
+
+
+scheduler = LLMScheduler(
+    max_concurrent=int(os.getenv("OLLAMA_NUM_PARALLEL", "1")),
+    max_queue={
+        Priority.Interactive: int(os.getenv("LLM_INTERACTIVE_QUEUE", "32")),
+        Priority.Background: int(os.getenv("LLM_BACKGROUND_QUEUE", "512")),
+    },
+    max_wait={
+        Priority.Interactive: _optional_float(os.getenv("LLM_INTERACTIVE_SLO", "15")),
+        Priority.Background: _optional_float(os.getenv("LLM_BACKGROUND_SLO", "")),
+    },
+)
+
+
+if __name__ == "__main__":
+    # Simulated saturation: a backlog of memory jobs plus a burst of chat turns
+    demo = LLMScheduler(
+        max_concurrent=2,
+        max_wait={Priority.Interactive: 0.15},
+        initial_service_time=0.05,
+    )
+    results = {p: [] for p in Priority}
+
+    def call(p: Priority):
+        try:
+            with demo.slot(p):
+                time.sleep(0.05)
+            results[p].append("ok")
+        except OverloadedError as e:
+            results[p].append(f"503 (retry after {e.retry_after:.0f}s)")
+
+    threads = [
+        threading.Thread(target=call, args=(Priority.Background,)) for _ in range(40)
+    ]
+    threads += [
+        threading.Thread(target=call, args=(Priority.Interactive,)) for _ in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.005)
+    for thread in threads:
+        thread.join()
+
+    for name, values in demo.stats().items():
+        print(f"{name}: {values}")
@@ -1,4 +1,5 @@
 import json
+from typing import Dict, List, Optional
 
 from langchain.prompts import (
     ChatPromptTemplate,
@@ -8,17 +9,24 @@ from langchain.prompts import (
 from langchain_core.runnables import RunnableLambda
 
 from binge_buddy import utils
+from binge_buddy.memory_index import MemoryIndex
 from binge_buddy.ollama import OllamaLLM
 
 
 class MemoryAggregator:
-    def __init__(self, llm: OllamaLLM):
+    def __init__(
+        self, llm: OllamaLLM, memory_index: Optional[MemoryIndex] = None, top_k: int = 8
+    ):
         """
         Initializes the MemoryAggregator agent.
 
         :param llm: The LLM model to use (e.g., OllamaLLM).
+        :param memory_index: Optional index to retrieve only the relevant existing memories from.
+        :param top_k: Number of existing memories to retrieve from the index.
         """
         self.llm = llm
+        self.memory_index = memory_index
+        self.top_k = top_k
 
         # System prompt for the memory aggregator to know what needs to be done
         self.system_prompt_initial = """
@@ -116,7 +124,46 @@ class MemoryAggregator:
         self.llm_runnable = RunnableLambda(lambda x: self.llm._call(x))
         self.memory_aggregator_runnable = self.prompt | self.llm_runnable
 
+    def select_existing(
+        self,
+        existing_memories: Dict[str, str],
+        extracted_knowledge,
+        user_id: Optional[str] = None,
+    ) -> List[Dict[str, str]]:
+        """
+        Returns the stored facts the aggregation is given: with an index, only the ones
+        relevant to the new knowledge, otherwise all of them. Either way they are taken
+        from ``existing_memories``, the profile the write is versioned against, not from
+        what this process's index last saw.
+
+        :param existing_memories: The stored profile's mapping of attribute to value.
+        :param extracted_knowledge: The new knowledge to aggregate.
+        :param user_id: The user the profile belongs to.
+        """
+        facts = MemoryIndex.profile_facts(existing_memories or {})
+        if not (self.memory_index and user_id and facts):
+            return facts
+        # Another process may have written the profile: bring the index up to date with
+        # it (only new facts are embedded) and keep only hits that are in it
+        self.memory_index.add_profile(user_id, existing_memories)
+        stored = {(fact["attribute"], fact["value"]) for fact in facts}
+        return [
+            {"attribute": fact["attribute"], "value": fact["value"]}
+            for fact in self.memory_index.search(
+                user_id, str(extracted_knowledge), k=self.top_k
+            )
+            if (fact["attribute"], fact["value"]) in stored
+        ]
+
     def run(self, existing_memories, extracted_knowledge):
+        """
+        :param existing_memories: The stored facts to aggregate into, as returned by
+            ``select_existing`` (or already rendered for the prompt).
+        :param extracted_knowledge: The new knowledge to aggregate.
+        """
+        if isinstance(existing_memories, list):
+            existing_memories = MemoryIndex.format_facts(existing_memories)
+
         response = self.memory_aggregator_runnable.invoke(
             {
                 "existing_memories": existing_memories,
@@ -156,9 +203,7 @@ if __name__ == "__main__":
     ]
     """
 
-
     response = memory_aggregator.run(
         extracted_knowledge=extracted_knowledge, existing_memories=existing_memories
     )
     print(response)
-
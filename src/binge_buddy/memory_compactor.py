@@ -0,0 +1,370 @@
+"""Offline compaction of oversized long-term memory attribute values"""
+
+import argparse
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate
+from langchain_core.runnables import RunnableLambda
+
+from binge_buddy import utils
+from binge_buddy.enums import Priority
+from binge_buddy.llm_scheduler import priority
+from binge_buddy.memory_db import MemoryDB, VersionConflictError, get_memory_db
+from binge_buddy.memory_index import MemoryIndex
+from binge_buddy.ollama import OllamaLLM
+
+logger = logging.getLogger(__name__)
+
+LEASE_COLLECTION = "leases"
+
+
+@dataclass
+class CompactionReport:
+    profiles_scanned: int = 0
+    attributes_compacted: int = 0
+    chars_before: int = 0
+    chars_after: int = 0
+    details: List[Dict] = field(default_factory=list)
+
+    @property
+    def reduction(self) -> float:
+        """Relative reduction of the compacted memory text (0.0 - 1.0)."""
+        if not self.chars_before:
+            return 0.0
+        return 1 - self.chars_after / self.chars_before
+
+    def __str__(self):
+        # ~4 characters per token is close enough for prompt-size reporting
+        return (
+            f"Compacted {self.attributes_compacted} attribute(s) across "
+            f"{self.profiles_scanned} profile(s): {self.chars_before} -> {self.chars_after} chars "
+            f"(~{self.chars_before // 4} -> ~{self.chars_after // 4} prompt tokens, "
+            f"{self.reduction:.0%} smaller)"
+        )
+
+
+def deduplicate(value: str) -> str:
+    """
+    Drops repeated clauses from a merged memory value while keeping their order.
+
+    :param value: The stored attribute value (clauses separated by ';', newlines or sentences).
+    :return: The value with exact/near-exact duplicate clauses removed.
+    """
+    clauses = [c.strip() for c in re.split(r";|\n|(?<=[.!?])\s+", value) if c.strip()]
+    seen = set()
+    unique = []
+    for clause in clauses:
+        normalized = re.sub(r"[^a-z0-9 ]", "", clause.lower()).strip()
+        if normalized and normalized not in seen:
+            seen.add(normalized)
+            unique.append(clause.rstrip(".;"))
+    return "; ".join(unique)
+
+
+def _parse_timestamp(value) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    return None
+
+
+class MemoryCompactor:
+    def __init__(
+        self,
+        llm: OllamaLLM,
+        db: MemoryDB,
+        collection_name: str = "memories",
+        history_collection: str = "memory_history",
+        max_value_chars: int = 600,
+        max_attributes_per_run: int = 20,
+        min_idle_seconds: float = 600,
+        memory_index: Optional[MemoryIndex] = None,
+    ):
+        """
+        Initializes the MemoryCompactor.
+
+        :param llm: The LLM model to summarize oversized values with.
+        :param db: The database holding the user profiles.
+        :param collection_name: Collection with the user profiles.
+        :param history_collection: Collection receiving the pre-compaction snapshots.
+        :param max_value_chars: Attribute values longer than this are compacted.
+        :param max_attributes_per_run: Upper bound on attributes compacted by one run.
+        :param min_idle_seconds: Profiles updated more recently than this are skipped.
+        :param memory_index: Optional index the compacted attributes are re-indexed in.
+        """
+        self.llm = llm
+        self.db = db
+        self.collection_name = collection_name
+        self.history_collection = history_collection
+        self.max_value_chars = max_value_chars
+        self.max_attributes_per_run = max_attributes_per_run
+        self.min_idle_seconds = min_idle_seconds
+        self.memory_index = memory_index
+
+        self.system_prompt_initial = """
+        You are maintaining the long-term memory of a movie recommendation assistant.
+
+        Over time, the memory stored for a single attribute of a user's profile has grown long and repetitive.
+        Rewrite it so that it is as short as possible while keeping every distinct fact.
+
+        ## Attribute
+        {attribute}
+
+        ## Stored memory
+        {value}
+
+        Rules:
+        - Never drop a movie, show, genre, platform or person that is mentioned.
+        - Merge repeated or overlapping statements into one.
+        - If a preference changed over time, keep only the most recent state and note the change briefly.
+        - Do not add anything that is not in the stored memory.
+
+        Write the final output under the title "Compaction Result:" as a single line of plain text.
+        """
+
+        self.prompt = ChatPromptTemplate.from_messages(
+            [SystemMessagePromptTemplate.from_template(self.system_prompt_initial)]
+        )
+        self.llm_runnable = RunnableLambda(lambda x: self.llm._call(x))
+        self.memory_compactor_runnable = self.prompt | self.llm_runnable
+
+    def summarize(self, attribute: str, value: str) -> str:
+        """Asks the LLM for a condensed version of an attribute value."""
+        response = utils.remove_think_tags(
+            self.memory_compactor_runnable.invoke(
+                {"attribute": attribute, "value": value}
+            )
+        )
+        return response.split("Compaction Result:", 1)[-1].strip()
+
+    def compact_value(self, attribute: str, value: str) -> str:
+        """
+        Compacts one attribute value: cheap deduplication first, LLM summary only if the
+        value is still above the size threshold.
+        """
+        compacted = deduplicate(value)
+        if len(compacted) > self.max_value_chars:
+            summary = self.summarize(attribute, compacted)
+            # Never replace a value with an empty or longer "summary"
+            if summary and len(summary) < len(compacted):
+                compacted = summary
+        return compacted
+
+    def _is_idle(self, profile: Dict) -> bool:
+        last_updated = _parse_timestamp(profile.get("last_updated"))
+        if last_updated is None:
+            return True
+        idle_for = (datetime.now(timezone.utc) - last_updated).total_seconds()
+        return idle_for >= self.min_idle_seconds
+
+    def run(self) -> CompactionReport:
+        """
+        Runs a single compaction pass over all profiles.
+
+        :return: A report with the number of compacted attributes and the size reduction.
+        """
+        report = CompactionReport()
+        budget = self.max_attributes_per_run
+
+        for profile in self.db.find(self.collection_name):
+            if budget <= 0:
+                break
+            report.profiles_scanned += 1
+            if not self._is_idle(profile):
+                continue
+
+            updates, details, history = {}, [], []
+            for attribute, value in (profile.get("memories") or {}).items():
+                if budget <= 0:
+                    break
+                if not isinstance(value, str) or len(value) <= self.max_value_chars:
+                    continue
+
+                compacted = self.compact_value(attribute, value)
+                budget -= 1
+                if len(compacted) >= len(value):
+                    continue
+
+                # Keep the original value so nothing is lost by compaction
+                history.append(
+                    {
+                        "user_id": profile.get("user_id"),
+                        "attribute": attribute,
+                        "value": value,
+                        "compacted_at": datetime.now(timezone.utc).isoformat(),
+                    }
+                )
+                updates[f"memories.{attribute}"] = compacted
+                details.append(
+                    {
+                        "user_id": profile.get("user_id"),
+                        "attribute": attribute,
+                        "chars_before": len(value),
+                        "chars_after": len(compacted),
+                    }
+                )
+
+            if not updates:
+                continue
+            try:
+                self.db.update_one(
+                    self.collection_name,
+                    {"_id": profile["_id"]},
+                    updates,
+                    expected_version=profile.get("version", 0),
+                )
+            except VersionConflictError:
+                # A conversation updated the profile meanwhile; it is no longer idle and
+                # gets compacted by a later run, from its new values
+                logger.info(
+                    "Profile %s changed during compaction, skipped",
+                    profile.get("user_id"),
+                )
+                continue
+            # Only snapshots of values that were actually replaced are kept
+            for snapshot in history:
+                self.db.insert_one(self.history_collection, snapshot)
+            if self.memory_index is not None and profile.get("user_id"):
+                # Replaces the indexed facts of the compacted attributes
+                self.memory_index.add_profile(
+                    profile["user_id"],
+                    {
+                        d["attribute"]: updates[f"memories.{d['attribute']}"]
+                        for d in details
+                    },
+                )
+            report.attributes_compacted += len(details)
+            report.chars_before += sum(d["chars_before"] for d in details)
+            report.chars_after += sum(d["chars_after"] for d in details)
+            report.details.extend(details)
+
+        return report
+
+    def acquire_lease(
+        self, holder: str, ttl: float, name: str = "memory-compaction"
+    ) -> bool:
+        """
+        Takes (or renews) a lease in the database, so that only one of several server
+        processes compacts at a time.
+
+        :param holder: Identifies the caller (e.g. host and process id).
+        :param ttl: Seconds the lease is held unless renewed; a crashed holder's lease
+            is taken over after this.
+        :return: Whether the caller holds the lease.
+        """
+        lease = self.db.find_one(LEASE_COLLECTION, {"_id": name})
+        now = time.time()
+        if lease and lease.get("holder") != holder and lease.get("expires", 0) > now:
+            return False
+        try:
+            self.db.update_one(
+                LEASE_COLLECTION,
+                {"_id": name},
+                {"holder": holder, "expires": now + ttl},
+                expected_version=lease.get("version", 0) if lease else 0,
+            )
+        except VersionConflictError:
+            return False
+        return True
+
+
+class CompactionWorker(threading.Thread):
+    """
+    Runs the MemoryCompactor periodically, only while the system is idle and only in the
+    process holding the compaction lease.
+    """
+
+    def __init__(
+        self,
+        compactor: MemoryCompactor,
+        interval_seconds: float = 3600,
+        idle_seconds: float = 300,
+    ):
+        """
+        Initializes the compaction worker.
+
+        :param compactor: The compactor to run.
+        :param interval_seconds: Time between compaction attempts.
+        :param idle_seconds: Required time without chat activity before a run starts.
+        """
+        super().__init__(name="memory-compaction", daemon=True)
+        self.compactor = compactor
+        self.interval_seconds = interval_seconds
+        self.idle_seconds = idle_seconds
+        self.last_report: Optional[CompactionReport] = None
+        self._last_activity = time.monotonic()
+        self._stop_event = threading.Event()
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+
+    def notify_activity(self) -> None:
+        """Records chat activity so that compaction is postponed."""
+        self._last_activity = time.monotonic()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval_seconds):
+            if time.monotonic() - self._last_activity < self.idle_seconds:
+                continue
+            # One failed pass (LLM or database error) must not end the worker
+            try:
+                if not self.compactor.acquire_lease(
+                    self.holder, ttl=2 * self.interval_seconds
+                ):
+                    continue
+                with priority(Priority.Background):
+                    self.last_report = self.compactor.run()
+            except Exception:
+                logger.exception("Memory compaction pass failed")
+                continue
+            logger.info("%s", self.last_report)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compact oversized long-term memories."
+    )
+    parser.add_argument(
+        "--once", action="store_true", help="Run a single pass and exit."
+    )
+    parser.add_argument("--interval", type=float, default=3600)
+    parser.add_argument("--max-value-chars", type=int, default=600)
+    parser.add_argument("--max-attributes", type=int, default=20)
+    parser.add_argument("--min-idle", type=float, default=600)
+    args = parser.parse_args()
+
+    compactor = MemoryCompactor(
+        llm=OllamaLLM(),
+        db=get_memory_db(),
+        max_value_chars=args.max_value_chars,
+        max_attributes_per_run=args.max_attributes,
+        min_idle_seconds=args.min_idle,
+    )
+
+    if args.once:
+        print(compactor.run())
+    else:
+        # A separate process never sees chat activity: rely on the per-profile idle check
+        worker = CompactionWorker(
+            compactor, interval_seconds=args.interval, idle_seconds=0
+        )
+        worker.start()
+        try:
+            while worker.is_alive():
+                worker.join(1)
+        except KeyboardInterrupt:
+            worker.stop()
@@ -1,22 +1,33 @@
 """Database interface to interact with the mongoDB instance"""
 
+import copy
+import json
+import logging
 import os
 import sys
+import threading
+import uuid
 from pathlib import Path
 
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import ASCENDING, MongoClient, ReplaceOne
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables from the root `.env`
 BASE_DIR = Path(__file__).resolve().parent.parent
-print(BASE_DIR)
 ENV_PATH = BASE_DIR / "../.env"
 
 # Load environment variables safely
 if ENV_PATH.exists():
     load_dotenv(ENV_PATH)
 else:
-    print("Warning: `.env` file not found! Using default values.")
+    logger.warning("`.env` file not found at %s! Using default values.", ENV_PATH)
+
+
+class VersionConflictError(Exception):
+    """Raised when a versioned update finds the document changed since it was read."""
 
 
 class MemoryDB:
@@ -36,7 +47,7 @@ class MemoryDB:
             self.client = MongoClient(self.uri)
             self.db = self.client[self.db_name]
         except Exception as e:
-            print(f"Error connecting to MongoDB: {e}")
+            logger.error("Error connecting to MongoDB: %s", e)
             sys.exit()
 
     def get_collection(self, collection_name):
@@ -51,12 +62,64 @@ class MemoryDB:
         """Find a single document."""
         return self.get_collection(collection_name).find_one(query)
 
-    def update_one(self, collection_name, query, update_data):
-        """Update a single document."""
-        return self.get_collection(collection_name).update_one(
-            query, {"$set": update_data}
+    def find(
+        self, collection_name, query=None, projection=None, sort=None, batch_size=None
+    ):
+        """Find all documents matching the query (returns a lazy cursor)."""
+        cursor = self.get_collection(collection_name).find(query or {}, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        return cursor
+
+    def insert_many(self, collection_name, documents, ordered=False):
+        """Insert a batch of documents in a single round trip."""
+        return self.get_collection(collection_name).insert_many(
+            documents, ordered=ordered
+        )
+
+    def upsert_many(self, collection_name, documents, key="user_id"):
+        """Replace a batch of documents by key (inserting missing ones) in one bulk write."""
+        requests = [ReplaceOne({key: doc[key]}, doc, upsert=True) for doc in documents]
+        return self.get_collection(collection_name).bulk_write(requests, ordered=False)
+
+    def ensure_indexes(self, collection_name="memories"):
+        """Create the unique user_id index that versioned profile upserts rely on."""
+        self.get_collection(collection_name).create_index(
+            [("user_id", ASCENDING)], unique=True
         )
 
+    def update_one(self, collection_name, query, update_data, expected_version=None):
+        """
+        Update a single document.
+
+        With ``expected_version`` the update is a compare-and-swap: it only applies if the
+        document's ``version`` still equals the expected one (a missing document counts as
+        version 0 and is created), and the version is incremented. Otherwise a
+        VersionConflictError is raised.
+        """
+        if expected_version is None:
+            return self.get_collection(collection_name).update_one(
+                query, {"$set": update_data}
+            )
+
+        versioned_query = {**query, "version": expected_version or {"$in": [0, None]}}
+        try:
+            result = self.get_collection(collection_name).update_one(
+                versioned_query,
+                {"$set": update_data, "$inc": {"version": 1}},
+                upsert=expected_version == 0,
+            )
+        except DuplicateKeyError as e:
+            # Version 0 upsert raced with an existing document
+            raise VersionConflictError(f"{query} was created concurrently") from e
+        if result.matched_count == 0 and result.upserted_id is None:
+            raise VersionConflictError(
+                f"{query} is no longer at version {expected_version}"
+            )
+        return result
+
     def delete_one(self, collection_name, query):
         """Delete a single document."""
         return self.get_collection(collection_name).delete_one(query)
@@ -64,3 +127,254 @@ class MemoryDB:
     def close(self):
         """Close the database connection."""
         self.client.close()
+
+
+class LocalMemoryDB:
+    """
+    File-backed stand-in for MemoryDB, for local development. Each collection is a JSON
+    snapshot plus a journal of the documents written since, so batch writes only append.
+    """
+
+    # Comparison operators understood in queries
+    OPERATORS = {
+        "$gt": lambda a, b: a is not None and a > b,
+        "$gte": lambda a, b: a is not None and a >= b,
+        "$lt": lambda a, b: a is not None and a < b,
+        "$lte": lambda a, b: a is not None and a <= b,
+        "$in": lambda a, b: a in b,
+    }
+
+    def __init__(self, root=None):
+        self.root = Path(root or os.getenv("LOCAL_DB_DIR", "local_db"))
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._collections = {}
+        # Per collection: position of each document by _id, and journal lines since the snapshot
+        self._positions = {}
+        self._journaled = {}
+        # Per (collection, key): _id of each document by key value, built on first upsert
+        self._key_ids = {}
+        self._lock = threading.RLock()
+
+    def get_collection(self, collection_name):
+        """Get the list of documents of a collection (loaded on first access)."""
+        with self._lock:
+            if collection_name not in self._collections:
+                path = self.root / f"{collection_name}.json"
+                collection = json.loads(path.read_text()) if path.exists() else []
+                positions = {doc["_id"]: i for i, doc in enumerate(collection)}
+                journaled = 0
+                journal = self._journal_path(collection_name)
+                if journal.exists():
+                    with open(journal, encoding="utf-8") as f:
+                        for line in f:
+                            try:
+                                document = json.loads(line)
+                            except json.JSONDecodeError:
+                                break  # the last write was cut short
+                            self._put(collection, positions, document)
+                            journaled += 1
+                self._collections[collection_name] = collection
+                self._positions[collection_name] = positions
+                self._journaled[collection_name] = journaled
+            return self._collections[collection_name]
+
+    def _journal_path(self, collection_name):
+        return self.root / f"{collection_name}.journal.jsonl"
+
+    @staticmethod
+    def _put(collection, positions, document):
+        if document["_id"] in positions:
+            collection[positions[document["_id"]]] = document
+        else:
+            positions[document["_id"]] = len(collection)
+            collection.append(document)
+
+    def _forget_keys(self, collection_name):
+        for cached in [k for k in self._key_ids if k[0] == collection_name]:
+            del self._key_ids[cached]
+
+    def _save(self, collection_name):
+        path = self.root / f"{collection_name}.json"
+        tmp = path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(self._collections[collection_name], default=str))
+        os.replace(tmp, path)
+        # Replaying the journal over the new snapshot would be harmless, so order is safe
+        self._journal_path(collection_name).unlink(missing_ok=True)
+        self._journaled[collection_name] = 0
+
+    def _append(self, collection_name, documents):
+        """Journals written documents; the snapshot is rewritten once the journal outgrows it."""
+        with open(self._journal_path(collection_name), "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(d, default=str) + "\n" for d in documents))
+        self._journaled[collection_name] += len(documents)
+        if self._journaled[collection_name] > max(
+            1000, len(self._collections[collection_name])
+        ):
+            self._save(collection_name)
+
+    @staticmethod
+    def _get_path(document, dotted_key):
+        value = document
+        for part in dotted_key.split("."):
+            if not isinstance(value, dict) or part not in value:
+                return None
+            value = value[part]
+        return value
+
+    @classmethod
+    def _matches(cls, document, query):
+        for key, condition in (query or {}).items():
+            value = cls._get_path(document, key)
+            if (
+                isinstance(condition, dict)
+                and condition
+                and all(op in cls.OPERATORS for op in condition)
+            ):
+                try:
+                    if not all(
+                        cls.OPERATORS[op](value, arg) for op, arg in condition.items()
+                    ):
+                        return False
+                except TypeError:
+                    return (
+                        False  # values of different types never compare, as in MongoDB
+                    )
+            elif value != condition:
+                return False
+        return True
+
+    @staticmethod
+    def _sort_key(value):
+        # MongoDB's order across types: missing/null, numbers, strings, everything else
+        if value is None:
+            return (0, 0)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return (1, value)
+        if isinstance(value, str):
+            return (2, value)
+        return (3, str(value))
+
+    def insert_one(self, collection_name, data):
+        """Insert a single document."""
+        return self.insert_many(collection_name, [data])
+
+    def insert_many(self, collection_name, documents, ordered=False):
+        """Insert a batch of documents."""
+        with self._lock:
+            collection = self.get_collection(collection_name)
+            positions = self._positions[collection_name]
+            written = []
+            for document in documents:
+                document.setdefault("_id", uuid.uuid4().hex)
+                written.append(copy.deepcopy(document))
+                self._put(collection, positions, written[-1])
+            self._forget_keys(collection_name)
+            self._append(collection_name, written)
+        return len(documents)
+
+    def upsert_many(self, collection_name, documents, key="user_id"):
+        """Replace a batch of documents by key, inserting missing ones."""
+        with self._lock:
+            collection = self.get_collection(collection_name)
+            positions = self._positions[collection_name]
+            ids = self._key_ids.get((collection_name, key))
+            if ids is None:
+                ids = {doc.get(key): doc["_id"] for doc in collection}
+                self._key_ids[collection_name, key] = ids
+            written = []
+            for document in documents:
+                document = copy.deepcopy(document)
+                document.setdefault("_id", ids.get(document[key]) or uuid.uuid4().hex)
+                ids[document[key]] = document["_id"]
+                self._put(collection, positions, document)
+                written.append(document)
+            self._append(collection_name, written)
+        return len(documents)
+
+    def find_one(self, collection_name, query):
+        """Find a single document."""
+        return next(self.find(collection_name, query), None)
+
+    def find(
+        self, collection_name, query=None, projection=None, sort=None, batch_size=None
+    ):
+        """Find all documents matching the query."""
+        with self._lock:
+            documents = [
+                copy.deepcopy(doc)
+                for doc in self.get_collection(collection_name)
+                if self._matches(doc, query)
+            ]
+        for key, direction in reversed(sort or []):
+            documents.sort(
+                key=lambda d: self._sort_key(self._get_path(d, key)),
+                reverse=direction < 0,
+            )
+        return iter(documents)
+
+    def ensure_indexes(self, collection_name="memories"):
+        """Nothing to index for the local stand-in."""
+
+    @staticmethod
+    def _set(document, update_data):
+        for dotted_key, value in update_data.items():
+            *parents, leaf = dotted_key.split(".")
+            target = document
+            for part in parents:
+                target = target.setdefault(part, {})
+            target[leaf] = copy.deepcopy(value)
+
+    def update_one(self, collection_name, query, update_data, expected_version=None):
+        """Update a single document ($set semantics, dotted keys allowed, optional CAS)."""
+        with self._lock:
+            collection = self.get_collection(collection_name)
+            document = next((d for d in collection if self._matches(d, query)), None)
+
+            if expected_version is not None:
+                if document is None and expected_version == 0:
+                    document = {"_id": uuid.uuid4().hex, **copy.deepcopy(query)}
+                    self._put(collection, self._positions[collection_name], document)
+                elif document is None or document.get("version", 0) != expected_version:
+                    raise VersionConflictError(
+                        f"{query} is no longer at version {expected_version}"
+                    )
+                document["version"] = expected_version + 1
+
+            if document is None:
+                return 0
+            self._set(document, update_data)
+            self._forget_keys(collection_name)
+            self._append(collection_name, [document])
+            return 1
+
+    def delete_one(self, collection_name, query):
+        """Delete a single document."""
+        with self._lock:
+            collection = self.get_collection(collection_name)
+            for i, document in enumerate(collection):
+                if self._matches(document, query):
+                    del collection[i]
+                    self._forget_keys(collection_name)
+                    self._positions[collection_name] = {
+                        doc["_id"]: j for j, doc in enumerate(collection)
+                    }
+                    self._save(collection_name)
+                    return 1
+        return 0
+
+    def close(self):
+        """Fold the journals into the snapshots."""
+        with self._lock:
+            for collection_name, journaled in self._journaled.items():
+                if journaled:
+                    self._save(collection_name)
+
+
+def get_memory_db(backend=None):
+    """Create the memory database for the configured backend ("mongo" or "local")."""
+    backend = backend or os.getenv("MEMORY_DB_BACKEND", "mongo")
+    if backend == "mongo":
+        return MemoryDB()
+    if backend == "local":
+        return LocalMemoryDB()
+    raise ValueError(f"Unsupported memory db backend: {backend}")
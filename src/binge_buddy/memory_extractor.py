@@ -1,3 +1,4 @@
+import logging
 from typing import Dict, List, Optional
 
 from langchain.prompts import (
@@ -13,6 +14,8 @@ from binge_buddy.message import Message
 from binge_buddy.message_log import MessageLog
 from binge_buddy.ollama import OllamaLLM
 
+logger = logging.getLogger(__name__)
+
 
 class MemoryExtractor:
     def __init__(self, llm: OllamaLLM, message_log: MessageLog):
@@ -89,10 +92,10 @@ class MemoryExtractor:
         I will tip you $20 if you are perfect, and I will fine you $40 if you miss any important information.
 
         Take a deep breath, think step by step and in the end simply return a list of new information extracted under the title "Memory Extractor Result:" Be concrete with your final result.
-        List out all the memories as a json array in the format 
+        List out all the memories as a json array, each with the category (from the list above) it belongs to, in the format 
             [
-                "memory" : ...,
-                "memory" : ...,
+                {{"memory" : ..., "attribute" : ...}},
+                {{"memory" : ..., "attribute" : ...}},
                 ...
             ]
         """
@@ -124,11 +127,11 @@ class MemoryExtractor:
             return None
 
         messages = []
-        for message in self.message_log:
+        for message in self.message_log.iter_history():
             if message.role == "user":
                 messages.append(message.to_langchain_message())
 
-        print(messages)
+        logger.debug("Extracting memories from %d user messages", len(messages))
         # Run the pipeline and get the response
         response = utils.remove_think_tags(
             self.memory_extractor_runnable.invoke({"messages": messages})
@@ -0,0 +1,330 @@
+"""Per-user vector index over stored memory facts for relevance-ranked retrieval"""
+
+import hashlib
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+logger = logging.getLogger(__name__)
+
+
+class Embedder:
+    """Local CPU sentence embedder (mean-pooled transformer encoder)."""
+
+    def __init__(self, model_name: str = DEFAULT_EMBEDDING_MODEL, batch_size: int = 32):
+        """
+        Initializes the embedder. The model is only loaded on first use.
+
+        :param model_name: The Hugging Face model to embed text with.
+        :param batch_size: Number of texts encoded per forward pass.
+        """
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._tokenizer = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                from transformers import AutoModel, AutoTokenizer
+
+                self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                self._model = AutoModel.from_pretrained(self.model_name).to("cpu")
+                self._model.eval()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Embeds a list of texts into L2-normalised float32 vectors.
+
+        :param texts: The texts to embed.
+        :return: An array of shape (len(texts), dim).
+        """
+        import torch
+
+        if self._model is None:
+            self._load()
+
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start : start + self.batch_size]
+            encoded = self._tokenizer(
+                batch, padding=True, truncation=True, return_tensors="pt"
+            )
+            with torch.no_grad():
+                output = self._model(**encoded).last_hidden_state
+            # Mean pooling over the non-padding tokens
+            mask = encoded["attention_mask"].unsqueeze(-1).to(output.dtype)
+            pooled = (output * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            vectors.append(pooled.numpy())
+
+        vectors = np.concatenate(vectors).astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class NumpyBackend:
+    """Brute-force inner-product search over a growable matrix."""
+
+    def __init__(self, dim: int, capacity: int = 64):
+        self.dim = dim
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._labels: List[int] = []
+        self._rows: Dict[int, int] = {}  # label -> row in self._vectors
+
+    def __len__(self) -> int:
+        return len(self._labels)
+
+    def add(self, label: int, vector: np.ndarray) -> None:
+        if label in self._rows:
+            self._vectors[self._rows[label]] = vector
+            return
+        if len(self._labels) == self._vectors.shape[0]:
+            # Amortised doubling keeps incremental inserts O(1)
+            grown = np.zeros((2 * self._vectors.shape[0], self.dim), dtype=np.float32)
+            grown[: len(self._labels)] = self._vectors[: len(self._labels)]
+            self._vectors = grown
+        self._rows[label] = len(self._labels)
+        self._vectors[len(self._labels)] = vector
+        self._labels.append(label)
+
+    def remove(self, label: int) -> None:
+        row = self._rows.pop(label, None)
+        if row is None:
+            return
+        # Swap the last row into the hole so the matrix stays dense
+        last = len(self._labels) - 1
+        if row != last:
+            self._vectors[row] = self._vectors[last]
+            self._labels[row] = self._labels[last]
+            self._rows[self._labels[row]] = row
+        self._labels.pop()
+
+    def query(self, vector: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        n = len(self._labels)
+        if n == 0:
+            return []
+        scores = self._vectors[:n] @ vector
+        k = min(k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._labels[i], float(scores[i])) for i in top]
+
+
+class HnswBackend:
+    """Approximate nearest-neighbour search backed by hnswlib (optional dependency)."""
+
+    def __init__(self, dim: int, capacity: int = 1024, ef: int = 64, m: int = 16):
+        import hnswlib
+
+        self.dim = dim
+        self._index = hnswlib.Index(space="ip", dim=dim)
+        self._index.init_index(
+            max_elements=capacity, ef_construction=200, M=m, allow_replace_deleted=True
+        )
+        self._index.set_ef(ef)
+        self._labels = set()
+
+    def __len__(self) -> int:
+        return len(self._labels)
+
+    def add(self, label: int, vector: np.ndarray) -> None:
+        if label in self._labels:
+            self._index.mark_deleted(label)
+            self._labels.discard(label)
+        if len(self._labels) >= self._index.get_max_elements():
+            self._index.resize_index(2 * self._index.get_max_elements())
+        self._index.add_items(
+            vector.reshape(1, -1), np.array([label]), replace_deleted=True
+        )
+        self._labels.add(label)
+
+    def remove(self, label: int) -> None:
+        if label in self._labels:
+            self._index.mark_deleted(label)
+            self._labels.discard(label)
+
+    def query(self, vector: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        k = min(k, len(self._labels))
+        if k == 0:
+            return []
+        labels, distances = self._index.knn_query(vector.reshape(1, -1), k=k)
+        # hnswlib reports inner-product distance as 1 - similarity
+        return [(int(l), 1.0 - float(d)) for l, d in zip(labels[0], distances[0])]
+
+
+BACKENDS = {"numpy": NumpyBackend, "hnsw": HnswBackend}
+
+
+def fact_key(attribute: str, value: str) -> int:
+    """Stable 63-bit label for an (attribute, value) fact."""
+    digest = hashlib.blake2b(
+        f"{attribute.upper()}\x00{value.strip().lower()}".encode("utf-8"), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "big") >> 1
+
+
+class MemoryIndex:
+    """Long-term memory facts of every user, embedded and searchable per user"""
+
+    def __init__(
+        self,
+        embedder: Optional[Embedder] = None,
+        backend: str = "numpy",
+        embed_fn: Optional[Callable[[List[str]], np.ndarray]] = None,
+    ):
+        """
+        Initializes the memory index.
+
+        :param embedder: The embedder to use (a default local model is created if omitted).
+        :param backend: "numpy" for exact brute-force search or "hnsw" for hnswlib ANN search.
+        :param embed_fn: Optional replacement for ``embedder.embed`` (e.g. a remote embedder).
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unsupported index backend: {backend}")
+        if backend == "hnsw":
+            try:
+                import hnswlib  # noqa: F401
+            except ImportError:
+                logger.warning("hnswlib is not installed, falling back to numpy index.")
+                backend = "numpy"
+
+        self.backend = backend
+        self.embedder = embedder or Embedder()
+        self.embed_fn = embed_fn or self.embedder.embed
+        self._indexes: Dict[str, object] = {}
+        self._facts: Dict[str, Dict[int, Dict[str, str]]] = {}
+        self._lock = threading.Lock()
+
+    def _user_index(self, user_id: str, dim: int):
+        if user_id not in self._indexes:
+            self._indexes[user_id] = BACKENDS[self.backend](dim)
+            self._facts[user_id] = {}
+        return self._indexes[user_id]
+
+    def add_facts(self, user_id: str, facts: List[Dict[str, str]]) -> int:
+        """
+        Incrementally indexes facts. The facts given for an attribute replace the ones
+        indexed for it before (a stored attribute holds its whole current value), so
+        superseded values do not outrank current ones. Facts that are already indexed
+        are not re-embedded.
+
+        :param user_id: The user the facts belong to.
+        :param facts: List of {"attribute": ..., "value": ...} dictionaries.
+        :return: The number of newly indexed facts.
+        """
+        known = self._facts.get(user_id, {})
+        attributes = set()
+        current = set()
+        new_facts = {}
+        for fact in facts:
+            attribute, value = str(fact["attribute"]), str(fact["value"]).strip()
+            attributes.add(attribute.upper())
+            if not value:
+                continue
+            key = fact_key(attribute, value)
+            current.add(key)
+            if key not in known:
+                new_facts[key] = {"attribute": attribute, "value": value}
+
+        vectors = None
+        if new_facts:
+            vectors = self.embed_fn(
+                [f"{fact['attribute']}: {fact['value']}" for fact in new_facts.values()]
+            )
+        with self._lock:
+            known = self._facts.get(user_id, {})
+            for key, fact in list(known.items()):
+                if fact["attribute"].upper() in attributes and key not in current:
+                    self._indexes[user_id].remove(key)
+                    del known[key]
+            if vectors is not None:
+                index = self._user_index(user_id, vectors.shape[1])
+                for (key, fact), vector in zip(new_facts.items(), vectors):
+                    index.add(key, vector)
+                    self._facts[user_id][key] = fact
+        return len(new_facts)
+
+    def add_profile(self, user_id: str, memories: Dict[str, str]) -> int:
+        """
+        Indexes a stored profile's ``memories`` mapping of attribute to value. Values
+        holding several facts joined with "; " are indexed fact by fact, as they were
+        aggregated.
+
+        :param user_id: The user the profile belongs to.
+        :param memories: Mapping of attribute name to stored value.
+        :return: The number of newly indexed facts.
+        """
+        return self.add_facts(user_id, self.profile_facts(memories))
+
+    @staticmethod
+    def profile_facts(memories: Dict[str, str]) -> List[Dict[str, str]]:
+        """Splits a stored ``memories`` mapping into its {"attribute", "value"} facts."""
+        return [
+            {"attribute": attribute, "value": value.strip()}
+            for attribute, joined in memories.items()
+            for value in str(joined).split("; ")
+            if value.strip()
+        ]
+
+    def remove_fact(self, user_id: str, attribute: str, value: str) -> None:
+        """Removes a single fact from a user's index."""
+        key = fact_key(attribute, value)
+        with self._lock:
+            if user_id in self._indexes and key in self._facts[user_id]:
+                self._indexes[user_id].remove(key)
+                del self._facts[user_id][key]
+
+    def search(self, user_id: str, query: str, k: int = 5) -> List[Dict]:
+        """
+        Returns the top-k facts of a user most relevant to the query.
+
+        :param user_id: The user whose facts are searched.
+        :param query: Text to rank the facts against (e.g. the current message).
+        :param k: Maximum number of facts to return.
+        :return: List of {"attribute", "value", "score"} dictionaries, best first.
+        """
+        if not self._facts.get(user_id):
+            return []
+        vector = self.embed_fn([query])[0]
+        with self._lock:
+            hits = self._indexes[user_id].query(vector, k)
+            facts = self._facts[user_id]
+            return [
+                {**facts[label], "score": score}
+                for label, score in hits
+                if label in facts
+            ]
+
+    def count(self, user_id: str) -> int:
+        """Number of facts indexed for a user."""
+        return len(self._facts.get(user_id, {}))
+
+    @staticmethod
+    def format_facts(facts: List[Dict]) -> str:
+        """Renders retrieved facts as prompt lines."""
+        return "\n".join(f"- {fact['attribute']}: {fact['value']}" for fact in facts)
+
+
+if __name__ == "__main__":
+    index = MemoryIndex()
+    index.add_profile(
+        "kanta_001",
+        {
+            "LIKES": "Kanta likes sci-fi and action movies but he also enjoys rom-coms.",
+            "DISLIKES": "Kanta hates Japanese movies, especially anime.",
+            "FAVOURITES": "Kanta's favorite movie is Inception, and he loves Christopher Nolan's films.",
+            "PLATFORM": "Kanta watches mostly on Netflix.",
+        },
+    )
+
+    for fact in index.search("kanta_001", "Can you recommend an anime series?", k=2):
+        print(fact)
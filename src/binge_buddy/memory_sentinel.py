@@ -1,3 +1,4 @@
+import logging
 from typing import Optional
 
 from langchain.prompts import (
@@ -12,6 +13,8 @@ from binge_buddy.message import Message
 from binge_buddy.message_log import MessageLog
 from binge_buddy.ollama import OllamaLLM
 
+logger = logging.getLogger(__name__)
+
 
 class MemorySentinel:
     def __init__(self, llm: OllamaLLM, message_log: MessageLog):
@@ -93,7 +96,7 @@ class MemorySentinel:
         if not message:
             return None
 
-        print(message.to_langchain_message())
+        logger.debug("Assessing %s", message)
 
         # Run the pipeline and get the response
         response = self.memory_sentinel_runnable.invoke(
@@ -1,18 +1,34 @@
+import sys
+import time
 import uuid
 from datetime import datetime
-from typing import Optional, Union
+from typing import Any, Dict, Optional, Union
 
 from langchain.schema import HumanMessage, SystemMessage
 
+from binge_buddy.tracing import current_trace_id
+
 
 class Message:
+    # No per-instance __dict__: large logs hold millions of these
+    __slots__ = (
+        "content",
+        "role",
+        "user_id",
+        "session_id",
+        "ts",
+        "_message_id",
+        "trace_id",
+    )
+
     def __init__(
         self,
         content: str,
         role: str,
         user_id: str,
         session_id: str,
-        timestamp: Optional[datetime] = None,
+        timestamp: Optional[Union[datetime, float]] = None,
+        trace_id: Optional[str] = None,
     ):
         """
         Initialize a message.
@@ -21,16 +37,43 @@ class Message:
         :param role: The role of the sender (user/agent).
         :param user_id: The unique ID of the user (for accessing long-term memory in MongoDB).
         :param session_id: The unique ID of the current session (to track this conversation).
-        :param timestamp: Timestamp when the message was created (defaults to now).
+        :param timestamp: Timestamp when the message was created, as a datetime or epoch
+            seconds (defaults to now).
+        :param trace_id: The trace of the request that produced the message (defaults to the current one).
         """
-        self.message_id = str(uuid.uuid4())  # Unique message identifier
+        self._message_id = None  # Generated on first access
         self.content = content
-        self.role = role  # Can be 'user' or 'agent'
-        self.user_id = user_id
-        self.session_id = session_id
-        self.timestamp = (
-            timestamp if timestamp else datetime.now()
-        )  # Default to current time
+        # Ids and roles repeat across every message of a session, so share one copy
+        self.role = sys.intern(role)  # Can be 'user' or 'agent'
+        self.user_id = sys.intern(user_id)
+        self.session_id = sys.intern(session_id)
+        self.trace_id = trace_id or current_trace_id()
+        if timestamp is None:
+            self.ts = time.time()  # Default to current time
+        elif isinstance(timestamp, datetime):
+            self.ts = timestamp.timestamp()
+        else:
+            self.ts = float(timestamp)
+
+    @property
+    def message_id(self) -> str:
+        """Unique message identifier (generated lazily)."""
+        if self._message_id is None:
+            self._message_id = str(uuid.uuid4())
+        return self._message_id
+
+    @message_id.setter
+    def message_id(self, value: str) -> None:
+        self._message_id = value
+
+    @property
+    def timestamp(self) -> datetime:
+        """Creation time as a (local, naive) datetime."""
+        return datetime.fromtimestamp(self.ts)
+
+    @timestamp.setter
+    def timestamp(self, value: datetime) -> None:
+        self.ts = value.timestamp()
 
     def __repr__(self):
         return f"Message(user_id={self.user_id}, session_id={self.session_id}, role={self.role}, timestamp={self.timestamp})"
@@ -49,3 +92,83 @@ class Message:
             return SystemMessage(content=self.content)
         else:
             raise ValueError(f"Unsupported message role: {self.role}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Serializes the message into a JSON-compatible dictionary.
+        """
+        return {
+            "message_id": self.message_id,
+            "content": self.content,
+            "role": self.role,
+            "user_id": self.user_id,
+            "session_id": self.session_id,
+            "timestamp": self.timestamp.isoformat(),
+            "trace_id": self.trace_id,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Message":
+        """
+        Restores a message serialized with to_dict, keeping its message id.
+        """
+        message = cls(
+            content=data["content"],
+            role=data["role"],
+            user_id=data["user_id"],
+            session_id=data["session_id"],
+            timestamp=datetime.fromisoformat(data["timestamp"]),
+        )
+        message._message_id = data.get("message_id")
+        # Not the current trace: the message was produced by the one it was stored with
+        message.trace_id = data.get("trace_id")
+        return message
+
+
+if __name__ == "__main__":
+    # Memory benchmark: 1M messages in one log, compared with the previous dict-backed layout
+    import gc
+    import tracemalloc
+
+    from binge_buddy.message_log import MessageLog
+
+    class DictMessage:
+        def __init__(self, content, role, user_id, session_id):
+            self.message_id = str(uuid.uuid4())
+            self.content = content
+            self.role = role
+            self.user_id = user_id
+            self.session_id = session_id
+            self.timestamp = datetime.now()
+
+    n = 1_000_000
+    contents = [f"Can you recommend something like movie {i % 5000}?" for i in range(n)]
+
+    for label, make in [
+        (
+            "dict-backed",
+            lambda i: DictMessage(
+                contents[i], "user", f"user-{i % 1000}", f"session-{i % 1000}"
+            ),
+        ),
+        (
+            "slotted",
+            lambda i: Message(
+                contents[i], "user", f"user-{i % 1000}", f"session-{i % 1000}"
+            ),
+        ),
+    ]:
+        gc.collect()
+        tracemalloc.start()
+        message_log = MessageLog(session_id="bench", user_id="bench")
+        began = time.perf_counter()
+        for i in range(n):
+            message_log.add_message(make(i))
+        elapsed = time.perf_counter() - began
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            f"{label:>12}: {current / 1e6:7.1f} MB for {n} messages "
+            f"({current / n:.0f} B/message, {elapsed:.1f}s to build)"
+        )
+        del message_log
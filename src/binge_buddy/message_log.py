@@ -1,35 +1,104 @@
-from typing import Iterator, List, Optional
+from typing import TYPE_CHECKING, Iterator, List, Optional
 
 from .message import Message
 
+if TYPE_CHECKING:
+    from .message_store import MessageStore
+
 
 class MessageLog:
-    def __init__(self, session_id: str, user_id: str):
+    def __init__(
+        self, session_id: str, user_id: str, store: Optional["MessageStore"] = None
+    ):
         """
         Initialize the message log for the current session.
 
         :param session_id: The unique session identifier.
         :param user_id: The unique user identifier.
+        :param store: Optional durable store every added message is appended to.
         """
         self.session_id = session_id
         self.user_id = user_id
+        self.store = store
         self.messages: List[Message] = []  # List of Message objects for this session
+        # Added with persist=False and not yet written to the store
+        self._unpersisted: List[Message] = []
+
+    @classmethod
+    def rehydrate(
+        cls, store: "MessageStore", session_id: str, user_id: str, tail: int
+    ) -> "MessageLog":
+        """
+        Reopens a persisted session, loading only its last ``tail`` messages into memory.
+        The full history stays available through iter_history().
+
+        :param store: The store the session was persisted to.
+        :param session_id: The unique session identifier.
+        :param user_id: The unique user identifier.
+        :param tail: Number of most recent messages to load.
+        """
+        message_log = cls(session_id=session_id, user_id=user_id, store=store)
+        message_log.messages = store.load_tail(user_id, session_id, tail)
+        return message_log
 
-    def add_message(self, message: Message) -> None:
+    @staticmethod
+    def render(message: Message) -> str:
+        """
+        Renders a message as a "role: content" history line.
+        """
+        return f"{message.role}: {message.content}"
+
+    def add_message(self, message: Message, persist: bool = True) -> None:
         """
         Adds a Message object to the session log.
 
         :param message: The Message object to be added to the log.
+        :param persist: Write it to the store now. Otherwise it is written, in order, with
+            the next persisted message, and can still be taken back with remove_message.
         """
         self.messages.append(message)
+        if not self.store:
+            return
+        if not persist:
+            self._unpersisted.append(message)
+            return
+        for pending in self._unpersisted:
+            self.store.append(pending)
+        self._unpersisted.clear()
+        self.store.append(message)
 
-    def get_history(self) -> List[str]:
+    def remove_message(self, message: Message) -> None:
+        """
+        Takes back a message added with persist=False (e.g. a user message whose turn was
+        rejected, so that the client's retry does not log it twice).
+        """
+        if message in self._unpersisted:
+            self._unpersisted.remove(message)
+        for i in range(len(self.messages) - 1, -1, -1):
+            if self.messages[i] is message:
+                del self.messages[i]
+                return
+
+    def iter_history(self) -> Iterator[Message]:
+        """
+        Streams the complete session history, including messages that were never loaded
+        into memory, for full-history consumers such as memory extraction.
+        """
+        if self.store:
+            return self.store.iter_messages(self.user_id, self.session_id)
+        return iter(self.messages)
+
+    def get_history(self, last: Optional[int] = None) -> List[str]:
         """
         Returns the conversation history as a list of message contents, including roles.
 
+        :param last: Only return the last ``last`` messages (costs O(last) instead of O(log)).
         :return: A list of message contents with role information.
         """
-        return [f"{message.role}: {message.content}" for message in self.messages]
+        # Rendered on demand, so that the log holds no second copy of every content
+        if last is None:
+            return [self.render(m) for m in self.messages]
+        return [self.render(m) for m in self.messages[-last:]] if last > 0 else []
 
     def get_last_message(self) -> Optional[Message]:
         """
@@ -46,6 +115,7 @@ class MessageLog:
         Clears the message log (resets the log for a new session or scenario).
         """
         self.messages.clear()
+        self._unpersisted.clear()
 
     def get_message_count(self) -> int:
         """
@@ -69,38 +139,52 @@ class MessageLog:
 
         :return: A string representation of the log with roles and contents.
         """
-        return "\n".join(
-            f"{message.role}: {message.content}" for message in self.messages
-        )
+        return "\n".join(self.get_history())
 
     def __iter__(self) -> Iterator[Message]:
         """
-        Returns a new iterator for the messages each time __iter__ is called.
-        """
-        return MessageLogIterator(self.messages)
-
-
-class MessageLogIterator:
-    def __init__(self, messages: List[Message]):
-        """
-        Initialize the iterator with a list of messages.
-        """
-        self.messages = messages
-        self._index = 0  # Initialize index to start from the first message
-
-    def __iter__(self):
-        """
-        Return the iterator itself.
-        """
-        return self
-
-    def __next__(self) -> Message:
-        """
-        Return the next message in the list, or raise StopIteration if done.
-        """
-        if self._index < len(self.messages):
-            message = self.messages[self._index]
-            self._index += 1
-            return message
-        else:
-            raise StopIteration
+        Returns a new iterator over the in-memory messages each time __iter__ is called.
+        """
+        return iter(self.messages)
+
+
+if __name__ == "__main__":
+    # Per-turn cost of building the prompt context against the log length
+    import time
+
+    window = 12
+    for length in [1_000, 10_000, 100_000]:
+        message_log = MessageLog(session_id="bench", user_id="bench")
+        for i in range(length):
+            message_log.add_message(
+                Message(
+                    content=f"Message number {i} about some movie",
+                    role="user" if i % 2 else "system",
+                    user_id="bench",
+                    session_id="bench",
+                )
+            )
+
+        turns = 200
+        began = time.perf_counter()
+        for _ in range(turns):
+            "\n".join(f"{m.role}: {m.content}" for m in message_log.messages)
+        rebuild = (time.perf_counter() - began) / turns
+
+        began = time.perf_counter()
+        for i in range(turns):
+            message_log.add_message(
+                Message(
+                    content=f"Turn {i}",
+                    role="user",
+                    user_id="bench",
+                    session_id="bench",
+                )
+            )
+            "\n".join(message_log.get_history(last=window))
+        incremental = (time.perf_counter() - began) / turns
+
+        print(
+            f"{length:>7} messages: full rebuild {rebuild * 1e6:9.1f} us/turn, "
+            f"append + window {incremental * 1e6:6.1f} us/turn"
+        )
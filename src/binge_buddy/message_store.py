@@ -0,0 +1,193 @@
+"""Durable, append-only storage of chat messages (one JSONL file per session)"""
+
+import base64
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from binge_buddy.message import Message
+
+SessionKey = Tuple[str, str]
+
+
+class MessageStore:
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        fsync_interval: float = 0.05,
+        max_open_files: int = 256,
+    ):
+        """
+        Initializes the message store.
+
+        :param root: Directory holding <user_id>/<session_id>.jsonl files (ids base64-encoded).
+        :param fsync_interval: Seconds between batched fsyncs of all written sessions.
+            0 fsyncs every append synchronously.
+        :param max_open_files: Session files kept open for appending; the least recently
+            written are synced and closed beyond that, and reopened on their next append.
+        """
+        self.root = Path(root or os.getenv("MESSAGE_STORE_DIR", "message_logs"))
+        self.fsync_interval = fsync_interval
+        self.max_open_files = max_open_files
+        self._files: "OrderedDict[SessionKey, object]" = OrderedDict()
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._flusher = None
+        if fsync_interval > 0:
+            self._flusher = threading.Thread(
+                target=self._flush_periodically, name="message-store-fsync", daemon=True
+            )
+            self._flusher.start()
+
+    @staticmethod
+    def _filename(value: str) -> str:
+        # Reversible, so distinct ids never share a file, and never a path separator or dot
+        if value in ("", ".", ".."):
+            raise ValueError(f"Invalid id for a message file: {value!r}")
+        return (
+            base64.urlsafe_b64encode(value.encode("utf-8")).decode("ascii").rstrip("=")
+        )
+
+    def path(self, user_id: str, session_id: str) -> Path:
+        return (
+            self.root / self._filename(user_id) / f"{self._filename(session_id)}.jsonl"
+        )
+
+    def _file(self, key: SessionKey):
+        if key in self._files:
+            self._files.move_to_end(key)
+            return self._files[key]
+        path = self.path(*key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._files[key] = open(path, "ab")
+        while len(self._files) > self.max_open_files:
+            evicted, f = self._files.popitem(last=False)
+            self._dirty.discard(evicted)
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+        return self._files[key]
+
+    def append(self, message: Message) -> None:
+        """
+        Appends a message to its session file. The write is made durable by the next
+        batched fsync (or immediately if fsync_interval is 0).
+        """
+        line = json.dumps(message.to_dict()).encode("utf-8") + b"\n"
+        key = (message.user_id, message.session_id)
+        with self._lock:
+            f = self._file(key)
+            f.write(line)
+            if self.fsync_interval > 0:
+                self._dirty.add(key)
+            else:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def flush(self) -> None:
+        """Flushes and fsyncs every session written since the last flush (group commit)."""
+        with self._lock:
+            dirty = [self._files[key] for key in self._dirty if key in self._files]
+            self._dirty.clear()
+            for f in dirty:
+                f.flush()
+        for f in dirty:
+            try:
+                os.fsync(f.fileno())
+            except (OSError, ValueError):
+                # The session was closed (and therefore synced) concurrently
+                pass
+
+    def _flush_periodically(self) -> None:
+        while not self._stop_event.wait(self.fsync_interval):
+            self.flush()
+
+    def _flush_session(self, key: SessionKey) -> None:
+        # Buffered writes of the session must be visible before reading its file
+        with self._lock:
+            if key in self._files:
+                self._files[key].flush()
+
+    def load_tail(self, user_id: str, session_id: str, count: int) -> List[Message]:
+        """
+        Loads the last ``count`` messages of a session, reading the file backwards so that
+        only the tail is read.
+        """
+        self._flush_session((user_id, session_id))
+        path = self.path(user_id, session_id)
+        if count <= 0 or not path.exists():
+            return []
+
+        block_size = 64 * 1024
+        with open(path, "rb") as f:
+            position = f.seek(0, os.SEEK_END)
+            data = b""
+            # One more newline than records needed so the first record is complete
+            while position > 0 and data.count(b"\n") <= count:
+                read = min(block_size, position)
+                position -= read
+                f.seek(position)
+                data = f.read(read) + data
+
+        lines = [line for line in data.split(b"\n") if line.strip()]
+        if position > 0:
+            lines = lines[1:]
+        return [Message.from_dict(json.loads(line)) for line in lines[-count:]]
+
+    def summary_path(self, user_id: str, session_id: str) -> Path:
+        return self.path(user_id, session_id).with_suffix(".summary.json")
+
+    def save_summary(self, user_id: str, session_id: str, summary: Dict) -> None:
+        """
+        Stores the context-window summary of a session next to its messages, replacing
+        the previous one atomically.
+        """
+        path = self.summary_path(user_id, session_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(summary, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def load_summary(self, user_id: str, session_id: str) -> Optional[Dict]:
+        """Loads the summary stored by ``save_summary``, if any."""
+        path = self.summary_path(user_id, session_id)
+        if not path.exists():
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def iter_messages(self, user_id: str, session_id: str) -> Iterator[Message]:
+        """Streams the full history of a session from disk, one message at a time."""
+        self._flush_session((user_id, session_id))
+        path = self.path(user_id, session_id)
+        if not path.exists():
+            return
+        with open(path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield Message.from_dict(json.loads(line))
+
+    def close_session(self, user_id: str, session_id: str) -> None:
+        """Syncs and closes the file of a session (e.g. when it is evicted from memory)."""
+        with self._lock:
+            f = self._files.pop((user_id, session_id), None)
+            self._dirty.discard((user_id, session_id))
+            if f:
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+
+    def close(self) -> None:
+        """Stops the fsync thread and syncs and closes all session files."""
+        self._stop_event.set()
+        if self._flusher:
+            self._flusher.join()
+        for key in list(self._files):
+            self.close_session(*key)
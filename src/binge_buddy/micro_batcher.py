@@ -0,0 +1,104 @@
+"""Collects concurrent single-item requests into batches for one model call"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Generic, List, Optional, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_STOP = object()
+
+
+class MicroBatcher(Generic[T, R]):
+    def __init__(
+        self,
+        fn: Callable[[List[T]], List[R]],
+        max_batch: int = 32,
+        max_wait: float = 0.01,
+        name: str = "micro-batcher",
+    ):
+        """
+        Initializes the micro-batcher.
+
+        :param fn: Processes a batch of items and returns one result per item, in order.
+        :param max_batch: Largest batch passed to fn.
+        :param max_wait: Seconds the first item of a batch waits for more items to arrive.
+        :param name: Name of the worker thread.
+        """
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name=self.name, daemon=True
+                )
+                self._worker.start()
+
+    def submit(self, item: T) -> "Future[R]":
+        """Queues an item; the returned future resolves once its batch has been processed."""
+        future: "Future[R]" = Future()
+        self._ensure_worker()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item: T, timeout: Optional[float] = None) -> R:
+        return self.submit(item).result(timeout)
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    pending = self._queue.get(
+                        timeout=max(0.0, deadline - time.monotonic())
+                    )
+                except queue.Empty:
+                    break
+                if pending is _STOP:
+                    self._queue.put(_STOP)
+                    break
+                batch.append(pending)
+            self._process(batch)
+
+    def _process(self, batch) -> None:
+        items = [item for item, _ in batch]
+        try:
+            results = self.fn(items)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.items += len(batch)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+        }
+
+    def close(self) -> None:
+        """Processes what is already queued, then stops the worker thread."""
+        if self._worker is not None:
+            self._queue.put(_STOP)
+            self._worker.join()
@@ -1,33 +1,172 @@
+import json
+import os
+from typing import Dict, List, Tuple
+
 import requests
 from langchain.llms.base import LLM
 from langchain.schema import PromptValue  # Import ChatPromptValue
 
+from binge_buddy.enums import Priority
+from binge_buddy.llm_scheduler import current_priority, preempted, scheduler
+from binge_buddy.tracing import tracer
+
+NANOSECONDS_PER_MS = 1e6
+
+
+class PreemptedError(Exception):
+    """Raised when a streamed background call gave up its slot to an interactive call."""
+
+
+def extract_timings(body: Dict) -> Dict[str, float]:
+    """
+    Pulls the server-side timings out of an Ollama response (durations in milliseconds).
+    A prompt_eval_count of 0 means the whole prompt was served from the KV cache.
+    """
+    return {
+        "prompt_eval_count": body.get("prompt_eval_count", 0),
+        "prompt_eval_ms": body.get("prompt_eval_duration", 0) / NANOSECONDS_PER_MS,
+        "eval_count": body.get("eval_count", 0),
+        "eval_ms": body.get("eval_duration", 0) / NANOSECONDS_PER_MS,
+        "load_ms": body.get("load_duration", 0) / NANOSECONDS_PER_MS,
+        "total_ms": body.get("total_duration", 0) / NANOSECONDS_PER_MS,
+    }
+
 
 class OllamaLLM(LLM):  # Inherit from the LLM base class
     # model: str = "llama2:7b"  # Default model
     model: str = "deepseek-r1:8b"  # Default model
     temperature: float = 0.0  # Default temperature
+    base_url: str = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+    # How long Ollama keeps the model (and its KV cache) loaded after a request
+    keep_alive: str = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+    # Seconds to wait for Ollama's response (the whole generation, as nothing is streamed)
+    request_timeout: float = float(os.getenv("OLLAMA_TIMEOUT", "300"))
 
     def _call(self, prompt: str, **kwargs) -> str:
         """
         Call the Ollama API with the given prompt and return the response.
         """
+        return self.call_with_timings(prompt)[0]
+
+    def call_with_timings(self, prompt: str) -> Tuple[str, Dict[str, float]]:
+        """
+        Like _call, but also returns the server-side timings of this call. They are
+        returned rather than stored, as the LLM is shared by concurrent requests.
+        """
         # Convert ChatPromptValue to a string if necessary
         if isinstance(prompt, PromptValue):
             prompt = str(prompt)  # Convert ChatPromptValue to a string
 
-        url = "http://localhost:11434/api/generate"
+        url = f"{self.base_url}/api/generate"
         payload = {
             "model": self.model,
             "prompt": prompt,  # Use the stringified prompt
             "stream": False,
             "temperature": self.temperature,
+            "keep_alive": self.keep_alive,
         }
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            return response.json()["response"]
-        else:
-            raise Exception(f"Error: {response.status_code}, {response.text}")
+        with tracer.span(
+            "ollama.generate",
+            {"llm.model": self.model, "llm.prompt_chars": len(prompt)},
+        ) as span:
+            body = self._post(url, payload, span)
+            timings = extract_timings(body)
+            span.set_attributes({f"llm.{k}": v for k, v in timings.items()})
+            return body["response"], timings
+
+    def chat(
+        self, messages: List[Dict[str, str]], **kwargs
+    ) -> Tuple[str, Dict[str, float]]:
+        """
+        Call the Ollama chat API with a list of {"role", "content"} messages.
+
+        Unlike _call, the conversation is sent as separate messages, so a request whose
+        leading messages match the previous one reuses Ollama's KV cache for that prefix.
+
+        :param messages: The chat messages (roles: system, user or assistant).
+        :return: The response text and the server-side timings of the call.
+        """
+        url = f"{self.base_url}/api/chat"
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "stream": False,
+            "options": {"temperature": self.temperature},
+            "keep_alive": self.keep_alive,
+        }
+        with tracer.span(
+            "ollama.chat", {"llm.model": self.model, "llm.messages": len(messages)}
+        ) as span:
+            body = self._post(url, payload, span)
+            timings = extract_timings(body)
+            span.set_attributes({f"llm.{k}": v for k, v in timings.items()})
+            return body["message"]["content"], timings
+
+    def _post(self, url: str, payload: Dict, span) -> Dict:
+        """
+        Sends a request to Ollama once an LLM slot is free and returns the response body.
+        Background calls that may be preempted are streamed, so that they can stop (Ollama
+        aborts a generation whose client disconnects) and free the slot for an
+        interactive call; they are retried once they get a slot again.
+        """
+        while True:
+            with scheduler.slot() as queued:
+                span.set_attributes(
+                    {
+                        "llm.priority": current_priority().name,
+                        "llm.queue_ms": queued * 1000,
+                    }
+                )
+                if not (
+                    scheduler.preempt_background
+                    and current_priority() == Priority.Background
+                ):
+                    response = requests.post(
+                        url, json=payload, timeout=self.request_timeout
+                    )
+                    span.set_attribute("http.status_code", response.status_code)
+                    if response.status_code != 200:
+                        raise Exception(
+                            f"Error: {response.status_code}, {response.text}"
+                        )
+                    return response.json()
+                try:
+                    return self._stream(url, payload, span)
+                except PreemptedError:
+                    span.set_attribute("llm.preempted", True)
+
+    def _stream(self, url: str, payload: Dict, span) -> Dict:
+        """
+        Streams a response, giving up as soon as the call is preempted. Returns the last
+        chunk (with the timings), holding the full response text.
+        """
+        with requests.post(
+            url,
+            json={**payload, "stream": True},
+            stream=True,
+            timeout=self.request_timeout,
+        ) as response:
+            span.set_attribute("http.status_code", response.status_code)
+            if response.status_code != 200:
+                raise Exception(f"Error: {response.status_code}, {response.text}")
+            parts = []
+            for line in response.iter_lines():
+                if preempted():
+                    raise PreemptedError(url)
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "message" in chunk:
+                    parts.append(chunk["message"].get("content", ""))
+                else:
+                    parts.append(chunk.get("response", ""))
+                if chunk.get("done"):
+                    if "message" in chunk:
+                        chunk["message"]["content"] = "".join(parts)
+                    else:
+                        chunk["response"] = "".join(parts)
+                    return chunk
+        raise Exception(f"Error: incomplete response from {url}")
 
     @property
     def _llm_type(self) -> str:
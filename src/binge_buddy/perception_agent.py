@@ -1,28 +1,372 @@
-import whisper
+import itertools
+import threading
+from dataclasses import dataclass
+from typing import List
+
+from binge_buddy.emotion_classifier import emotion_classifier
+from binge_buddy.long_form import SAMPLE_RATE, Stitcher, iter_windows, parse_segments
+from binge_buddy.micro_batcher import MicroBatcher
+from binge_buddy.tracing import traced
+
+# Whisper decodes 30 second windows
+WINDOW_SAMPLES = 30 * SAMPLE_RATE
+WINDOW_FRAMES = 3000
+
+# "torch": the fp32 openai-whisper model; "int8": the same model with its linear layers
+# dynamically quantized; "ctranslate2": an int8 CTranslate2 conversion (faster-whisper)
+WHISPER_BACKENDS = ("torch", "int8", "ctranslate2")
+
+
+@dataclass
+class WindowResult:
+    """The decoded text and tokens of one window, for backends other than openai-whisper."""
+
+    text: str
+    tokens: List[int]
 
-from transformers import pipeline
 
 class PerceptionAgent:
-    def __init__(self):
-        # Load the pre-trained model for English
-        self.model = whisper.load_model("small.en")
+    def __init__(
+        self,
+        model_name="small.en",
+        window_seconds=30.0,
+        overlap_seconds=5.0,
+        batch_size=8,
+        max_wait=0.02,
+        vad=None,
+        backend="torch",
+        num_threads=None,
+    ):
+        if backend not in WHISPER_BACKENDS:
+            raise ValueError(f"Unsupported Whisper backend: {backend}")
+        # The Whisper model (and torch) are only imported and loaded on first use, so
+        # text-only traffic never waits for them
+        self.model_name = model_name
+        self.backend = backend
+        # CPU threads for inference; torch's setting is process-wide
+        self.num_threads = num_threads
+        self._model = None
+        self._tokenizer = None
+        self._lock = threading.Lock()
+        # Audio longer than one Whisper window is decoded in overlapping windows
+        self.window_seconds = window_seconds
+        self.overlap_seconds = overlap_seconds
+        # Optional VoiceActivityDetector; silence is cut before it reaches Whisper
+        self.vad = vad
+        # Windows from concurrent requests are stacked and decoded in one Whisper call
+        self.batcher = MicroBatcher(
+            self._decode_batch,
+            max_batch=batch_size,
+            max_wait=max_wait,
+            name="whisper-batcher",
+        )
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                if self.backend == "ctranslate2":
+                    self._model, self._tokenizer = self._load_ctranslate2()
+                else:
+                    self._model, self._tokenizer = self._load_torch()
+        return self._model
+
+    def _load_torch(self):
+        import torch
+        import whisper
+        from whisper.tokenizer import get_tokenizer
+
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+        model = whisper.load_model(self.model_name, device="cpu")
+        if self.backend == "int8":
+            # whisper's Linear subclass only casts the weights to the input dtype, which is a
+            # no-op in fp32; make it a plain nn.Linear so dynamic quantization picks it up
+            for module in model.modules():
+                if isinstance(module, whisper.model.Linear):
+                    module.__class__ = torch.nn.Linear
+            model = torch.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        tokenizer = get_tokenizer(
+            model.is_multilingual, language="en", task="transcribe"
+        )
+        return model, tokenizer
 
+    def _load_ctranslate2(self):
+        from faster_whisper import WhisperModel
+        from faster_whisper.tokenizer import Tokenizer
+
+        model = WhisperModel(
+            self.model_name,
+            device="cpu",
+            compute_type="int8",
+            cpu_threads=self.num_threads or 0,
+        )
+        tokenizer = Tokenizer(
+            model.hf_tokenizer,
+            model.model.is_multilingual,
+            task="transcribe",
+            language="en",
+        )
+        return model, tokenizer
+
+    @property
+    def model(self):
+        return self._model or self._load()
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            self._load()
+        return self._tokenizer
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def warm_up(self):
+        """Loads Whisper and the emotion model ahead of the first request."""
+        self._load()
+        emotion_classifier.classify(["warm up"])
+
+    @traced("perception.transcribe")
     def transcribe(self, audio_file):
+        import whisper
+
         # Load the audio file
         audio = whisper.load_audio(audio_file)
-        # trim the audio to 30 seconds (just for testing, comment this out for production)
+        return self.transcribe_audio(audio)
+
+    def transcribe_audio(self, audio):
+        """Transcribes 16 kHz mono float32 samples of any length."""
+        if self.vad is not None:
+            audio = self.vad.trim(audio)
+            if not len(audio):
+                # Nothing was said; Whisper tends to hallucinate text on silence
+                return ""
+        if len(audio) <= WINDOW_SAMPLES:
+            return self.decode_window(audio).text
+        return self.transcribe_long(audio)
+
+    def decode_window(self, audio, with_timestamps=False):
+        """Decodes up to 30 seconds of audio, batched with concurrent requests."""
+        return self.submit_window(audio, with_timestamps).result()
+
+    def submit_window(self, audio, with_timestamps=False):
+        """
+        Computes the log-Mel spectrogram of up to 30 seconds of audio in the calling thread
+        and queues it for batched decoding.
+
+        :return: A future resolving to the window's whisper DecodingResult.
+        """
+        import whisper
+
+        # pad to the 30 second window Whisper expects
         audio = whisper.pad_or_trim(audio)
+        model = self.model
+        if self.backend == "ctranslate2":
+            mel = model.feature_extractor(audio)[:, :WINDOW_FRAMES]
+        else:
+            mel = whisper.log_mel_spectrogram(audio, model.dims.n_mels)
+        return self.batcher.submit((mel, with_timestamps))
+
+    def _decode_batch(self, items):
+        """Decodes a batch of (mel, with_timestamps) in one call per decoding option."""
+        results = [None] * len(items)
+        for with_timestamps in (False, True):
+            indices = [i for i, item in enumerate(items) if item[1] == with_timestamps]
+            if not indices:
+                continue
+            mels = [items[i][0] for i in indices]
+            if self.backend == "ctranslate2":
+                decoded = self._generate_ctranslate2(mels, with_timestamps)
+            else:
+                decoded = self._decode_torch(mels, with_timestamps)
+            for i, result in zip(indices, decoded):
+                results[i] = result
+        return results
+
+    def _decode_torch(self, mels, with_timestamps):
+        import torch
+        import whisper
 
-        # make log-Mel spectrogram and move to the same device as the model
-        mel = whisper.log_mel_spectrogram(audio).to(self.model.device)
+        model = self.model
+        mel = torch.stack(mels).to(model.device)
+        # fp16 is only used on GPU anyway; asking for it on CPU just logs a warning
+        options = whisper.DecodingOptions(
+            language="en", without_timestamps=not with_timestamps, fp16=False
+        )
+        return whisper.decode(model, mel, options)
 
-        # decode the audio
-        options = whisper.DecodingOptions(language="en")
-        result = whisper.decode(self.model, mel, options)
+    def _generate_ctranslate2(self, mels, with_timestamps):
+        import ctranslate2
+        import numpy as np
 
-        return result.text
+        tokenizer = self.tokenizer
+        features = ctranslate2.StorageView.from_array(
+            np.ascontiguousarray(np.stack(mels))
+        )
+        prompt = list(tokenizer.sot_sequence)
+        if not with_timestamps:
+            prompt.append(tokenizer.no_timestamps)
+        # Greedy decoding, as whisper.decode does by default
+        generated = self.model.model.generate(
+            features, [prompt] * len(mels), beam_size=1
+        )
+        results = []
+        for result in generated:
+            tokens = [
+                token for token in result.sequences_ids[0] if token != tokenizer.eot
+            ]
+            text = tokenizer.decode(
+                [token for token in tokens if token < tokenizer.timestamp_begin]
+            )
+            results.append(WindowResult(text.strip(), tokens))
+        return results
 
+    @traced("perception.transcribe_long")
+    def transcribe_long(self, audio):
+        """
+        Transcribes long audio one batch of windows at a time (memory stays bounded by one
+        batch) and stitches the windows using the segment timestamps to drop the overlapping
+        speech.
+        """
+        stitcher = Stitcher(self.overlap_seconds)
+        duration = len(audio) / SAMPLE_RATE
+        windows = iter_windows(audio, self.window_seconds, self.overlap_seconds)
+        while True:
+            group = list(itertools.islice(windows, self.batcher.max_batch))
+            if not group:
+                break
+            futures = [
+                self.submit_window(samples, with_timestamps=True)
+                for _, samples in group
+            ]
+            for (offset, samples), future in zip(group, futures):
+                window_end = offset + len(samples) / SAMPLE_RATE
+                segments = parse_segments(
+                    future.result().tokens,
+                    self.tokenizer.timestamp_begin,
+                    self.tokenizer.decode,
+                    offset,
+                    window_end,
+                )
+                stitcher.add_window(
+                    offset, window_end, segments, last=window_end >= duration
+                )
+        return stitcher.text
+
+    @traced("perception.extract_emotion")
     def extract_emotion(self, message):
-        emotion_analyzer = pipeline("text-classification", model="bhadresh-savani/distilbert-base-uncased-emotion")
-        result = emotion_analyzer(message)
-        return result
\ No newline at end of file
+        # The classifier is shared; concurrent calls are batched into one forward pass
+        return [emotion_classifier(message)]
+
+    @traced("perception.extract_emotions")
+    def extract_emotions(self, messages, batch_size=None):
+        return emotion_classifier.classify(messages, batch_size=batch_size)
+
+
+if __name__ == "__main__":
+    import argparse
+    import statistics
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from pathlib import Path
+
+    from binge_buddy.audio_io import decode_audio
+    from binge_buddy.emotion_classifier import EmotionClassifier
+
+    parser = argparse.ArgumentParser(description="Perception benchmarks.")
+    parser.add_argument("--clips", default=str(Path(__file__).parent / "audio"))
+    parser.add_argument(
+        "--backends",
+        action="store_true",
+        help="Compare inference backends instead of batching.",
+    )
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    clips = [
+        decode_audio(path.read_bytes()) for path in sorted(Path(args.clips).iterdir())
+    ]
+
+    def word_error_rate(reference: str, hypothesis: str) -> float:
+        ref, hyp = reference.lower().split(), hypothesis.lower().split()
+        distances = list(range(len(hyp) + 1))
+        for i, word in enumerate(ref, 1):
+            previous, distances[0] = distances[0], i
+            for j, other in enumerate(hyp, 1):
+                previous, distances[j] = distances[j], min(
+                    distances[j] + 1, distances[j - 1] + 1, previous + (word != other)
+                )
+        return distances[-1] / max(1, len(ref))
+
+    if args.backends:
+        # Accuracy relative to the fp32 torch model, and latency per clip
+        transcripts = {}
+        for backend in WHISPER_BACKENDS:
+            try:
+                agent = PerceptionAgent(backend=backend, num_threads=args.threads)
+                agent.transcribe_audio(clips[0])  # load the model
+            except ImportError as e:
+                print(f"{backend:>12}: skipped ({e})")
+                continue
+            start = time.perf_counter()
+            transcripts[backend] = [agent.transcribe_audio(clip) for clip in clips]
+            elapsed = (time.perf_counter() - start) / len(clips)
+            pairs = zip(transcripts["torch"], transcripts[backend])
+            wer = statistics.mean(word_error_rate(ref, hyp) for ref, hyp in pairs)
+            print(
+                f"{backend:>12}: {elapsed * 1000:7.0f} ms/clip, WER vs fp32 {wer:.1%}"
+            )
+            agent.batcher.close()
+
+        texts = [text for text in transcripts["torch"] if text] + [
+            "I absolutely loved that movie, it made my day!",
+            "That ending was so sad, I cried for an hour.",
+            "Why would they cancel the show, this is infuriating.",
+            "The jump scares in that film were terrifying.",
+        ]
+        labels = {}
+        for quantize in (False, True):
+            classifier = EmotionClassifier(quantize=quantize, num_threads=args.threads)
+            classifier.classify(texts[:1])  # load the model
+            start = time.perf_counter()
+            labels[quantize] = [
+                result["label"] for result in classifier.classify(texts)
+            ]
+            elapsed = (time.perf_counter() - start) / len(texts)
+            agreement = statistics.mean(
+                a == b for a, b in zip(labels[False], labels[quantize])
+            )
+            name = "emotion int8" if quantize else "emotion fp32"
+            print(
+                f"{name:>12}: {elapsed * 1000:7.1f} ms/text, agreement with fp32 {agreement:.0%}"
+            )
+    else:
+        # Throughput against latency of concurrent short clips, with and without batching
+        clip = clips[0][: 10 * SAMPLE_RATE]
+
+        def timed(agent):
+            start = time.perf_counter()
+            agent.transcribe_audio(clip)
+            return time.perf_counter() - start
+
+        for batch_size in (1, 4, 8, 16):
+            agent = PerceptionAgent(batch_size=batch_size, num_threads=args.threads)
+            agent.transcribe_audio(clip)  # load the model
+            for concurrency in (1, 4, 8, 16):
+                requests = concurrency * 4
+                start = time.perf_counter()
+                with ThreadPoolExecutor(concurrency) as pool:
+                    latencies = sorted(
+                        pool.map(lambda _: timed(agent), range(requests))
+                    )
+                elapsed = time.perf_counter() - start
+                print(
+                    f"batch {batch_size:>2}, {concurrency:>2} concurrent: "
+                    f"{requests / elapsed:5.2f} clips/s, p50 {statistics.median(latencies):5.2f} s, "
+                    f"p95 {latencies[int(len(latencies) * 0.95) - 1]:5.2f} s, "
+                    f"avg batch {agent.batcher.stats()['avg_batch_size']:.1f}"
+                )
+            agent.batcher.close()
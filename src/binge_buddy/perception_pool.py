@@ -0,0 +1,185 @@
+"""Perception work (Whisper, emotion) in a pool of worker processes"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Deque, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# The PerceptionAgent of a worker process
+_agent = None
+
+
+def parse_cpu_list(value: Optional[str]) -> Optional[List[int]]:
+    """Parses a CPU list such as "2-5,8" (the taskset/cgroups notation)."""
+    if not value:
+        return None
+    cpus: List[int] = []
+    for part in value.split(","):
+        first, _, last = part.strip().partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def _init_worker(settings: Dict, cpus: Optional[List[int]]) -> None:
+    global _agent
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+
+    from binge_buddy.perception_agent import PerceptionAgent
+    from binge_buddy.vad import VoiceActivityDetector
+
+    settings = dict(settings)
+    vad_backend = settings.pop("vad_backend", None)
+    vad = VoiceActivityDetector(vad_backend) if vad_backend else None
+    # One request at a time reaches a worker, so there is nothing to wait for to batch
+    _agent = PerceptionAgent(max_wait=0.0, vad=vad, **settings)
+    # The worker exists to run these models: load them once, before its first task
+    _agent.warm_up()
+
+
+def _timed(fn, *args):
+    started = time.time()
+    result = fn(*args)
+    return result, started, time.time()
+
+
+def _transcribe_shared(name: str, length: int) -> str:
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        audio = np.ndarray((length,), dtype=np.float32, buffer=block.buf)
+        text = _agent.transcribe_audio(audio)
+        del audio  # the mapping cannot be closed while a view of it exists
+        return text
+    finally:
+        try:
+            block.close()
+        except BufferError:
+            # A traceback still holds a view; the mapping goes away with the worker
+            pass
+
+
+def _classify_emotions(texts: List[str]) -> List[Dict]:
+    return _agent.extract_emotions(texts)
+
+
+class PerceptionPool:
+    def __init__(
+        self,
+        workers: int = 2,
+        settings: Optional[Dict] = None,
+        cpus: Optional[List[int]] = None,
+        history: int = 1000,
+    ):
+        """
+        Initializes the pool. Worker processes start (and load their models) on first use.
+
+        :param workers: Number of worker processes, each with its own copy of the models.
+        :param settings: PerceptionAgent keyword arguments for the workers (e.g. backend,
+            num_threads), plus "vad_backend" to trim silence in the workers.
+        :param cpus: CPUs the workers are pinned to, leaving the others to the web server.
+        :param history: Number of recent requests the wait and service times are kept for.
+        """
+        self.workers = workers
+        self.settings = settings or {}
+        self.cpus = cpus
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self._waits: Deque[float] = deque(maxlen=history)
+        self._service_times: Deque[float] = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._executor = self._create_executor()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # Forking a process that already runs threads (and torch) is unsafe
+        return ProcessPoolExecutor(
+            self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.settings, self.cpus),
+        )
+
+    def _run(self, fn, *args):
+        submitted = time.time()
+        with self._lock:
+            self.submitted += 1
+            self.in_flight += 1
+            executor = self._executor
+        try:
+            result, started, finished = executor.submit(_timed, fn, *args).result()
+        except BrokenProcessPool:
+            with self._lock:
+                self.failed += 1
+                # Every request on the broken pool fails: only the first one replaces it
+                replace = self._executor is executor
+                if replace:
+                    self._executor = self._create_executor()
+            if replace:
+                # A worker died (e.g. killed for memory); start over with fresh workers
+                logger.error("Perception worker died, restarting the pool")
+                executor.shutdown(wait=False)
+            raise
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        with self._lock:
+            self.completed += 1
+            self._waits.append(started - submitted)
+            self._service_times.append(finished - started)
+        return result
+
+    def transcribe_audio(self, audio: np.ndarray) -> str:
+        """
+        Transcribes 16 kHz mono float32 samples in a worker. The samples are handed over in
+        shared memory rather than pickled through the pool's pipe.
+        """
+        audio = np.ascontiguousarray(audio, dtype=np.float32)
+        if not len(audio):
+            return ""
+        block = shared_memory.SharedMemory(create=True, size=audio.nbytes)
+        try:
+            np.ndarray(audio.shape, dtype=np.float32, buffer=block.buf)[:] = audio
+            return self._run(_transcribe_shared, block.name, len(audio))
+        finally:
+            block.close()
+            block.unlink()
+
+    def extract_emotions(self, texts: List[str]) -> List[Dict]:
+        return self._run(_classify_emotions, list(texts))
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            waits, service_times = sorted(self._waits), sorted(self._service_times)
+            stats = {
+                "workers": self.workers,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "in_flight": self.in_flight,
+                "queued": max(0, self.in_flight - self.workers),
+            }
+        for name, samples in (("wait", waits), ("service", service_times)):
+            for q in (50, 95, 99):
+                index = min(len(samples) - 1, int(q / 100 * len(samples)))
+                stats[f"{name}_p{q}_ms"] = (
+                    round(samples[index] * 1000, 1) if samples else 0.0
+                )
+        return stats
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
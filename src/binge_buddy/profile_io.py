@@ -0,0 +1,231 @@
+"""Streaming bulk import/export of user memory profiles as (gzipped) JSONL"""
+
+import argparse
+import gzip
+import json
+import os
+import time
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from bson import json_util
+
+from binge_buddy.memory_db import get_memory_db
+
+
+def open_jsonl(path: str, mode: str):
+    """Open a JSONL file as text, transparently (de)compressing ``.gz`` files."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Checkpoint:
+    """Progress through a given file (records processed plus resume state), persisted atomically."""
+
+    def __init__(self, path: Optional[str], source: str):
+        self.path = Path(path) if path else None
+        self.source = source
+        self.processed = 0
+        self.state: Dict = {}
+        if self.path and self.path.exists():
+            state = json.loads(self.path.read_text())
+            if state.get("source") == source:
+                self.processed = state["processed"]
+                self.state = state.get("state", {})
+
+    def save(self, processed: int, **state) -> None:
+        self.processed = processed
+        self.state = state
+        if self.path:
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(
+                json.dumps(
+                    {"source": self.source, "processed": processed, "state": state}
+                )
+            )
+            os.replace(tmp, self.path)
+
+    def clear(self) -> None:
+        if self.path and self.path.exists():
+            self.path.unlink()
+
+
+class Throughput:
+    def __init__(self, label: str, every: int):
+        self.label = label
+        self.every = every
+        self.count = 0
+        self.started = time.perf_counter()
+        self._next_report = every
+
+    def add(self, count: int) -> None:
+        self.count += count
+        if self.count >= self._next_report:
+            self._next_report += self.every
+            print(self)
+
+    def __str__(self):
+        elapsed = time.perf_counter() - self.started
+        rate = self.count / elapsed if elapsed else 0.0
+        return f"{self.label}: {self.count} profiles in {elapsed:.1f}s ({rate:,.0f} profiles/s)"
+
+
+def _serializable(document: Dict) -> Dict:
+    # Profiles are keyed by user_id, the database id is not carried across stores
+    return {k: v for k, v in document.items() if k != "_id"}
+
+
+def export_profiles(
+    db,
+    path: str,
+    collection_name: str = "memories",
+    batch_size: int = 1000,
+    checkpoint_path: Optional[str] = None,
+    report_every: int = 10000,
+) -> int:
+    """
+    Streams all profiles of a collection into a JSONL file.
+
+    :param db: MemoryDB or LocalMemoryDB to read from.
+    :param path: Output file (gzip compressed if it ends with .gz).
+    :param collection_name: Collection holding the profiles.
+    :param batch_size: Cursor batch size and checkpoint interval.
+    :param checkpoint_path: Optional checkpoint file to resume an interrupted export.
+    :param report_every: Print throughput every this many profiles.
+    :return: The number of profiles exported by this run.
+    """
+    checkpoint = Checkpoint(checkpoint_path, f"export:{collection_name}:{path}")
+    throughput = Throughput("Exported", report_every)
+    # Resume right after the last exported document, so the cursor does not walk the
+    # exported ones again. Documents are read in _id order: _id is unique and always
+    # indexed, unlike user_id (history collections, --insert imports)
+    last_id = checkpoint.state.get("last_id") if checkpoint.processed else None
+    # json_util keeps the type of the id (an ObjectId in MongoDB) through the checkpoint
+    query = {"_id": {"$gt": json_util.loads(last_id)}} if last_id is not None else None
+    cursor = db.find(collection_name, query, sort=[("_id", 1)], batch_size=batch_size)
+
+    # Every batch is written as a whole (as its own gzip member for .gz files, which gzip
+    # readers concatenate) and the checkpoint holds the file size after it: a resumed run
+    # cuts off whatever an interrupted run wrote after its last checkpoint
+    compress = path.endswith(".gz")
+    with open(path, "r+b" if checkpoint.processed else "wb") as out:
+        out.truncate(checkpoint.state.get("offset", 0))
+        out.seek(0, os.SEEK_END)
+        for batch in batched(cursor, batch_size):
+            data = "".join(
+                json.dumps(_serializable(document), default=str) + "\n"
+                for document in batch
+            ).encode("utf-8")
+            out.write(gzip.compress(data) if compress else data)
+            out.flush()
+            os.fsync(out.fileno())
+            checkpoint.save(
+                checkpoint.processed + len(batch),
+                last_id=json_util.dumps(batch[-1]["_id"]),
+                offset=out.tell(),
+            )
+            throughput.add(len(batch))
+
+    checkpoint.clear()
+    print(throughput)
+    return throughput.count
+
+
+def import_profiles(
+    db,
+    path: str,
+    collection_name: str = "memories",
+    batch_size: int = 1000,
+    upsert: bool = True,
+    key: str = "user_id",
+    checkpoint_path: Optional[str] = None,
+    report_every: int = 10000,
+) -> int:
+    """
+    Streams profiles from a JSONL file into a collection in batches.
+
+    :param db: MemoryDB or LocalMemoryDB to write to.
+    :param path: Input file (gzip compressed if it ends with .gz).
+    :param collection_name: Collection receiving the profiles.
+    :param batch_size: Number of profiles per insert_many / bulk_write.
+    :param upsert: Replace existing profiles by key instead of inserting duplicates.
+    :param key: Field identifying a profile when upserting.
+    :param checkpoint_path: Optional checkpoint file to resume an interrupted import.
+    :param report_every: Print throughput every this many profiles.
+    :return: The number of profiles imported by this run.
+    """
+    checkpoint = Checkpoint(checkpoint_path, f"import:{collection_name}:{path}")
+    throughput = Throughput("Imported", report_every)
+
+    with open_jsonl(path, "r") as source:
+        lines = islice(source, checkpoint.processed, None)
+        for batch in batched(lines, batch_size):
+            documents = [json.loads(line) for line in batch if line.strip()]
+            if documents:
+                if upsert:
+                    db.upsert_many(collection_name, documents, key=key)
+                else:
+                    db.insert_many(collection_name, documents)
+            checkpoint.save(checkpoint.processed + len(batch))
+            throughput.add(len(documents))
+
+    checkpoint.clear()
+    print(throughput)
+    return throughput.count
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Bulk import/export of memory profiles."
+    )
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", help="JSONL file (use a .gz suffix for gzip).")
+    parser.add_argument("--backend", choices=["mongo", "local"], default=None)
+    parser.add_argument("--collection", default="memories")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--checkpoint", default=None, help="Checkpoint file for resuming."
+    )
+    parser.add_argument(
+        "--insert",
+        action="store_true",
+        help="Plain insert_many instead of upserting by user_id.",
+    )
+    parser.add_argument("--report-every", type=int, default=10000)
+    args = parser.parse_args()
+
+    db = get_memory_db(args.backend)
+    try:
+        if args.command == "export":
+            export_profiles(
+                db,
+                args.path,
+                collection_name=args.collection,
+                batch_size=args.batch_size,
+                checkpoint_path=args.checkpoint,
+                report_every=args.report_every,
+            )
+        else:
+            import_profiles(
+                db,
+                args.path,
+                collection_name=args.collection,
+                batch_size=args.batch_size,
+                upsert=not args.insert,
+                checkpoint_path=args.checkpoint,
+                report_every=args.report_every,
+            )
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Semantic cache of agent replies to the opening question of a conversation, keyed by query
+embedding and the user's relevant profile
+"""
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from binge_buddy.memory_index import NumpyBackend
+
+# Openers that still point at something outside the query ("that one", "like you said")
+REFERENTIAL = re.compile(
+    r"\b((that|this|which|the (first|second|third|last|previous|other)) ones?|"
+    r"you (said|mentioned|suggested|recommended)|something else|another one|"
+    r"(more|something) like (that|this|it|those|these|them))\b",
+    re.IGNORECASE,
+)
+
+
+def profile_key(memories: str) -> str:
+    """Hash of the profile facts the reply was conditioned on."""
+    return hashlib.blake2b(
+        memories.strip().lower().encode("utf-8"), digest_size=8
+    ).hexdigest()
+
+
+def is_cacheable(query: str, conversation_started: bool = False) -> bool:
+    """
+    Only the opening question of a conversation is answered from the cache: a later reply
+    also depends on the (private) history and summary of the session, which the cache key
+    does not cover.
+    """
+    return not conversation_started and not REFERENTIAL.search(query)
+
+
+@dataclass
+class CacheStats:
+    lookups: int = 0
+    hits: int = 0
+    stores: int = 0
+    evictions: int = 0
+    skipped: int = 0
+    lookup_seconds: float = 0.0
+    generation_seconds: float = 0.0
+    generations: int = 0
+    similarities: List[float] = field(default_factory=list)
+
+    def snapshot(self) -> Dict:
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "skipped": self.skipped,
+            "lookup_avg_ms": (
+                1000 * self.lookup_seconds / self.lookups if self.lookups else 0.0
+            ),
+            "generation_avg_ms": (
+                1000 * self.generation_seconds / self.generations
+                if self.generations
+                else 0.0
+            ),
+            "hit_similarity_avg": (
+                sum(self.similarities) / len(self.similarities)
+                if self.similarities
+                else 0.0
+            ),
+        }
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], np.ndarray],
+        threshold: float = 0.92,
+        max_entries: int = 5000,
+        ttl: float = 24 * 3600,
+        opt_outs_loaded: bool = True,
+    ):
+        """
+        Initializes the response cache.
+
+        :param embed_fn: Embeds a list of texts into L2-normalised vectors.
+        :param threshold: Minimum cosine similarity for a cached reply to be served.
+        :param max_entries: Upper bound on cached replies (least recently used are evicted).
+        :param ttl: Seconds after which a cached reply is no longer served.
+        :param opt_outs_loaded: False if the stored opt-outs are still to be passed to
+            ``load_opt_outs``; until then every user misses.
+        """
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.opted_out: Set[str] = set()
+        self.opt_outs_loaded = opt_outs_loaded
+        self.stats = CacheStats()
+
+        # One index per profile key, so only users with the same relevant facts share replies
+        self._indexes: Dict[str, NumpyBackend] = {}
+        self._entries: "OrderedDict[Tuple[str, int], Dict]" = OrderedDict()
+        self._labels = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def set_opt_out(self, user_id: str, opted_out: bool = True) -> None:
+        """Users who opt out are neither served cached replies nor have theirs cached."""
+        if opted_out:
+            self.opted_out.add(user_id)
+        else:
+            self.opted_out.discard(user_id)
+
+    def load_opt_outs(self, user_ids: Iterable[str]) -> None:
+        """Adds the stored opt-outs and starts serving cached replies."""
+        self.opted_out.update(user_ids)
+        self.opt_outs_loaded = True
+
+    def _skips(self, user_id: str) -> bool:
+        return not self.opt_outs_loaded or user_id in self.opted_out
+
+    def _evict(self, key: Tuple[str, int]) -> None:
+        profile, label = key
+        self._entries.pop(key, None)
+        index = self._indexes.get(profile)
+        if index is not None:
+            index.remove(label)
+            if not len(index):
+                del self._indexes[profile]
+
+    def lookup(
+        self,
+        user_id: str,
+        query: str,
+        memories: str,
+        conversation_started: bool = False,
+    ) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Returns the cached reply to a near-identical query (or None) together with the query
+        embedding (None if the query was not looked up), which ``store`` reuses after a miss.
+
+        :param user_id: The user asking (opted-out users always miss).
+        :param query: The user's message.
+        :param memories: The profile facts the reply would be conditioned on.
+        :param conversation_started: Whether earlier messages (or a summary of them) are
+            part of the prompt; such turns always miss.
+        """
+        if self._skips(user_id) or not is_cacheable(query, conversation_started):
+            with self._lock:
+                self.stats.skipped += 1
+            return None, None
+
+        start = time.perf_counter()
+        vector = self.embed_fn([query])[0]
+        profile = profile_key(memories)
+        reply = None
+        with self._lock:
+            index = self._indexes.get(profile)
+            hits = index.query(vector, 1) if index is not None else []
+            if hits and hits[0][1] >= self.threshold:
+                key = (profile, hits[0][0])
+                entry = self._entries[key]
+                if time.time() - entry["created"] > self.ttl:
+                    self._evict(key)
+                    self.stats.evictions += 1
+                else:
+                    self._entries.move_to_end(key)
+                    entry["hits"] += 1
+                    reply = entry["response"]
+                    self.stats.hits += 1
+                    self.stats.similarities = self.stats.similarities[-999:] + [
+                        hits[0][1]
+                    ]
+            self.stats.lookups += 1
+            self.stats.lookup_seconds += time.perf_counter() - start
+        return reply, vector
+
+    def store(
+        self,
+        user_id: str,
+        query: str,
+        memories: str,
+        response: str,
+        vector: Optional[np.ndarray] = None,
+        generation_seconds: Optional[float] = None,
+        conversation_started: bool = False,
+    ) -> None:
+        """
+        Caches a freshly generated reply.
+
+        :param vector: The query embedding returned by ``lookup`` (embedded again if omitted).
+        :param generation_seconds: How long the reply took to generate, for the stats.
+        :param conversation_started: As for ``lookup``; such replies are not cached.
+        """
+        if generation_seconds is not None:
+            with self._lock:
+                self.stats.generations += 1
+                self.stats.generation_seconds += generation_seconds
+        if (
+            self._skips(user_id)
+            or not is_cacheable(query, conversation_started)
+            or not response
+        ):
+            return
+        if vector is None:
+            vector = self.embed_fn([query])[0]
+
+        profile = profile_key(memories)
+        with self._lock:
+            self._labels += 1
+            index = self._indexes.get(profile)
+            if index is None:
+                index = self._indexes[profile] = NumpyBackend(
+                    vector.shape[0], capacity=16
+                )
+            index.add(self._labels, vector)
+            self._entries[(profile, self._labels)] = {
+                "query": query,
+                "response": response,
+                "created": time.time(),
+                "hits": 0,
+            }
+            self.stats.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries)))
+                self.stats.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._indexes.clear()
+            self._entries.clear()
+
+
+if __name__ == "__main__":
+    from binge_buddy.memory_index import Embedder
+
+    cache = ResponseCache(Embedder().embed)
+    memories = "- LIKES: sci-fi and action movies"
+    queries = [
+        "Recommend a good sci-fi movie",
+        "Can you recommend a good sci-fi film?",
+        "recommend me a good science fiction movie",
+        "What's a good horror movie?",
+        "What about the second one?",
+        "Something like that, but funnier",
+    ]
+    for query in queries:
+        reply, vector = cache.lookup("kanta_001", query, memories)
+        if reply is None:
+            cache.store("kanta_001", query, memories, f"(reply to: {query})", vector)
+        print(f"{query!r:45} -> {reply or 'miss'}")
+    print(cache.stats.snapshot())
@@ -1,4 +1,8 @@
-from typing import Optional
+import logging
+import os
+import random
+import time
+from typing import Dict, Optional
 
 from langchain.prompts import (
     ChatPromptTemplate,
@@ -8,23 +12,65 @@ from langchain.prompts import (
 from langchain_core.runnables import RunnableLambda
 
 from binge_buddy import utils
+from binge_buddy.context_window import ContextWindow
+from binge_buddy.memory_index import MemoryIndex
 from binge_buddy.message import Message
 from binge_buddy.message_log import MessageLog
 from binge_buddy.ollama import OllamaLLM
+from binge_buddy.response_cache import ResponseCache
+from binge_buddy.tracing import current_span, traced
+
+logger = logging.getLogger(__name__)
+
+# Fraction of turns whose prompt context is written to the debug log
+HISTORY_LOG_SAMPLE_RATE = float(os.getenv("HISTORY_LOG_SAMPLE_RATE", "0.05"))
+
+# Use the Ollama chat API (KV-cache friendly) instead of a single rendered prompt
+CHAT_MODE = os.getenv("OLLAMA_CHAT_MODE", "0") == "1"
+
+# Agent replies are logged with the "system" role, the chat API calls them "assistant"
+CHAT_ROLES = {"user": "user", "system": "assistant"}
 
 
 class SemanticAgent:
-    def __init__(self, llm: OllamaLLM, message_log: MessageLog):
+    def __init__(
+        self,
+        llm: OllamaLLM,
+        message_log: MessageLog,
+        memory_index: Optional[MemoryIndex] = None,
+        top_k: int = 5,
+        context_window: Optional[ContextWindow] = None,
+        chat_mode: bool = CHAT_MODE,
+        response_cache: Optional[ResponseCache] = None,
+    ):
         """
-        Initializes the MemorySentinel agent.
+        Initializes the conversational agent.
 
         :param llm: The LLM model to use (e.g., OllamaLLM).
         :param message_log: The message_log that it needs to be observing
+        :param memory_index: Optional index of the user's long-term memories to retrieve from.
+        :param top_k: Number of memories relevant to the current message to put in the prompt.
+        :param context_window: Sliding window + rolling summary over the message log
+            (a default one is created if omitted).
+        :param chat_mode: Use the Ollama chat API with a static system prompt prefix and the
+            history as separate messages, so that Ollama can reuse its KV cache across turns.
+        :param response_cache: Optional cache of replies to near-identical opening questions
+            from users with the same relevant memories.
         """
         self.llm = llm
         self.message_log = message_log
+        self.memory_index = memory_index
+        self.top_k = top_k
+        self.chat_mode = chat_mode
+        self.response_cache = response_cache
+        self.context_window = context_window or ContextWindow(
+            llm, message_log, sticky=chat_mode
+        )
+        self.last_timings = {}
+        # Chat mode: the memories sent before each user message in the window, by its id
+        self._turn_context: Dict[str, str] = {}
 
-        # System prompt for the memory sentinel to decide whether to store information
+        # System prompt of the conversational agent
         self.system_prompt_initial = """
             You are a conversational movie and TV show recommendation assistant "Binge Buddy". Your goal is to provide users with natural, engaging, and concise recommendations based on their preferences. Keep responses friendly and to the point—avoid long-winded explanations.
             You only have to introduce yourself once at the beginnig.
@@ -37,7 +83,13 @@ class SemanticAgent:
             No Spoilers: Avoid revealing major plot points unless explicitly asked.
             If the user is unsure what to watch, guide them with simple questions (e.g., "Do you want something lighthearted or intense?"). If they ask for specific genres, moods, or themes, match them accordingly.
 
-            Message Logs for context:
+            What you remember about the user (most relevant first):
+            {memories}
+
+            Summary of the earlier conversation:
+            {conversation_summary}
+
+            Most recent messages for context:
             {message_logs}
 
             Current message to respond to (Only write respond to this message):
@@ -51,10 +103,92 @@ class SemanticAgent:
                 MessagesPlaceholder(variable_name="messages"),
             ]
         )
-        self.llm_runnable = RunnableLambda(lambda x: self.llm._call(x))
+        # Returns (response, timings) of the call, for last_timings
+        self.llm_runnable = RunnableLambda(lambda x: self.llm.call_with_timings(x))
 
         self.conversational_agent_runnable = self.prompt | self.llm_runnable
 
+        # Chat mode: this prompt never changes, so it stays a cacheable prefix
+        self.chat_system_prompt = """
+            You are a conversational movie and TV show recommendation assistant "Binge Buddy". Your goal is to provide users with natural, engaging, and concise recommendations based on their preferences. Keep responses friendly and to the point—avoid long-winded explanations.
+            You only have to introduce yourself once at the beginnig.
+
+            Guidelines:
+            Personalized Suggestions: Ask clarifying questions if needed to tailor recommendations.
+            Concise Responses: Keep answers short but informative, focusing on why a show or movie fits the user’s taste.
+            Natural Conversation: Respond casually and naturally, like a movie-savvy friend.
+            Diverse Picks: Offer a mix of well-known and hidden gems, ensuring variety.
+            No Spoilers: Avoid revealing major plot points unless explicitly asked.
+            If the user is unsure what to watch, guide them with simple questions (e.g., "Do you want something lighthearted or intense?"). If they ask for specific genres, moods, or themes, match them accordingly.
+
+            Your goal is to make discovering movies and shows fun and effortless! Do not ask too many questions and suggest movies where possible.
+        """
+
+    def _chat(self, message, recent_messages, memories, summary) -> str:
+        """
+        Builds the chat request as [static system prompt, summary, history..., current
+        message], where each user message is preceded by the memories first retrieved for
+        it. A turn only appends to the previous request, so Ollama reuses its KV cache for
+        all of it; the summary only changes when the window moves on.
+        """
+        messages = [{"role": "system", "content": self.chat_system_prompt}]
+        if summary:
+            messages.append(
+                {
+                    "role": "system",
+                    "content": f"Summary of the earlier conversation:\n{summary}",
+                }
+            )
+
+        window = {previous.message_id for previous in recent_messages}
+        self._turn_context = {
+            message_id: context
+            for message_id, context in self._turn_context.items()
+            if message_id in window
+        }
+        shown = set()
+        for previous in recent_messages[:-1]:
+            context = self._turn_context.get(previous.message_id)
+            if context:
+                messages.append({"role": "system", "content": context})
+                shown.update(context.splitlines())
+            messages.append(
+                {
+                    "role": CHAT_ROLES.get(previous.role, "user"),
+                    "content": previous.content,
+                }
+            )
+
+        # Only the memories that are not already in the window, as a short message
+        new_memories = [
+            line
+            for line in memories.splitlines()
+            if line.startswith("- ") and line not in shown
+        ]
+        if new_memories:
+            context = "What you remember about the user:\n" + "\n".join(new_memories)
+            self._turn_context[message.message_id] = context
+            messages.append({"role": "system", "content": context})
+        messages.append({"role": "user", "content": message.content})
+
+        response, self.last_timings = self.llm.chat(messages)
+        return utils.remove_think_tags(response)
+
+    def _cache_response(
+        self, message, memories, response, query_vector, start, conversation_started
+    ) -> None:
+        if self.response_cache:
+            self.response_cache.store(
+                self.message_log.user_id,
+                message.content,
+                memories,
+                response,
+                vector=query_vector,
+                generation_seconds=time.perf_counter() - start,
+                conversation_started=conversation_started,
+            )
+
+    @traced("semantic_agent.run")
     def run(self) -> Optional[str]:
         """
         Analyzes the current message and provide a response.
@@ -63,34 +197,81 @@ class SemanticAgent:
         # Get the latest message from the log
         message = self.message_log.get_last_message()
 
-        print("\n Printing message histories:")
+        if not message:
+            return None
 
-        for msg in self.message_log:
-            print("-", str(msg))
+        logger.debug("Responding to %s", message)
 
-        print("\n")
+        # Retrieve only the top-k memories relevant to the current message
+        memories = "None"
+        if self.memory_index:
+            facts = self.memory_index.search(
+                self.message_log.user_id, message.content, k=self.top_k
+            )
+            if facts:
+                memories = MemoryIndex.format_facts(facts)
 
-        if not message:
-            return None
+        # Only the recent turns go in verbatim, older ones are in the rolling summary
+        summary, recent_messages = self.context_window.get_context()
+        recent_history = "\n".join(
+            self.message_log.get_history(last=len(recent_messages))
+        )
+
+        if (
+            logger.isEnabledFor(logging.DEBUG)
+            and random.random() < HISTORY_LOG_SAMPLE_RATE
+        ):
+            logger.debug(
+                "Context for %s/%s (%d of %d messages):\n%s",
+                self.message_log.user_id,
+                self.message_log.session_id,
+                len(recent_messages),
+                len(self.message_log),
+                recent_history,
+            )
 
-        print(message.to_langchain_message())
+        response, query_vector = None, None
+        # Replies that depend on earlier turns are neither served from nor put in the cache
+        conversation_started = bool(summary) or len(recent_messages) > 1
+        if self.response_cache:
+            response, query_vector = self.response_cache.lookup(
+                self.message_log.user_id,
+                message.content,
+                memories,
+                conversation_started,
+            )
+            span = current_span()
+            if span:
+                span.set_attribute("response_cache.hit", response is not None)
 
-        # Run the pipeline and get the response
-        response = utils.remove_think_tags(
-            self.conversational_agent_runnable.invoke(
+        if response is not None:
+            self.last_timings = {}
+        elif self.chat_mode:
+            start = time.perf_counter()
+            response = self._chat(message, recent_messages, memories, summary)
+            self._cache_response(
+                message, memories, response, query_vector, start, conversation_started
+            )
+        else:
+            start = time.perf_counter()
+            # Run the pipeline and get the response
+            response, self.last_timings = self.conversational_agent_runnable.invoke(
                 {
                     "messages": [message.to_langchain_message()],
-                    "message_logs": list(
-                        map(
-                            lambda message: message.to_langchain_message(),
-                            self.message_log,
-                        )
-                    ),
+                    "memories": memories,
+                    "conversation_summary": summary or "None",
+                    "message_logs": recent_history,
                 }
             )
-        )
+            response = utils.remove_think_tags(response)
+            self._cache_response(
+                message, memories, response, query_vector, start, conversation_started
+            )
         agent_message = Message(
-            role="system", content=response, user_id="user", session_id="session"
+            role="system",
+            content=response,
+            user_id=self.message_log.user_id,
+            session_id=self.message_log.session_id,
         )
 
         self.message_log.add_message(agent_message)
@@ -98,7 +279,62 @@ class SemanticAgent:
         return response
 
 
+def benchmark_prompt_eval(turns: int = 30) -> None:
+    """
+    Runs the same conversation in prompt mode and chat mode and prints Ollama's
+    prompt-eval time per turn.
+    """
+    questions = [
+        "I love watching sci-fi movies like The Matrix!",
+        "Something a bit more recent maybe?",
+        "I've seen that one already, what else?",
+        "Any series instead of a movie?",
+        "What about something lighter for the weekend?",
+    ]
+    results = {}
+    for chat_mode in (False, True):
+        llm = OllamaLLM()
+        message_log = MessageLog("bench", "bench")
+        agent = SemanticAgent(
+            llm=llm,
+            message_log=message_log,
+            chat_mode=chat_mode,
+            context_window=ContextWindow(
+                llm, message_log, background=False, sticky=chat_mode
+            ),
+        )
+        results[chat_mode] = []
+        for turn in range(turns):
+            message_log.add_message(
+                Message(
+                    content=questions[turn % len(questions)],
+                    role="user",
+                    session_id="bench",
+                    user_id="bench",
+                )
+            )
+            agent.run()
+            results[chat_mode].append(agent.last_timings)
+
+    print(
+        f"{'turn':>4} | {'prompt mode (ms / tokens)':>26} | {'chat mode (ms / tokens)':>24}"
+    )
+    for turn, (prompt_timings, chat_timings) in enumerate(
+        zip(results[False], results[True])
+    ):
+        print(
+            f"{turn + 1:>4} | {prompt_timings['prompt_eval_ms']:>15.0f} / {prompt_timings['prompt_eval_count']:>6}"
+            f" | {chat_timings['prompt_eval_ms']:>13.0f} / {chat_timings['prompt_eval_count']:>6}"
+        )
+
+
 if __name__ == "__main__":
+    import sys
+
+    if "--benchmark" in sys.argv:
+        benchmark_prompt_eval()
+        sys.exit()
+
     # Initialize the message log and LLM (for now, using a mock LLM)
     llm = OllamaLLM()
     message_log = MessageLog("user", "session")
@@ -0,0 +1,463 @@
+"""Production ASGI serving of the chat front end (uvicorn workers, async chat turns, graceful drain)"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from io import BytesIO
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from binge_buddy.audio_io import pcm_to_float32
+from binge_buddy.llm_scheduler import OverloadedError
+from binge_buddy.tracing import bind_context, parse_traceparent, tracer
+
+logger = logging.getLogger(__name__)
+
+
+class ChatServer:
+    """
+    ASGI app in front of the Flask app. Chat turns are handled natively: the connection
+    waits on the event loop (idle keep-alive connections cost no thread) and only the
+    blocking agent call runs on a bounded thread pool. Everything else is served by Flask,
+    on a thread pool of its own so that these requests run in parallel.
+    """
+
+    def __init__(
+        self,
+        wsgi_app,
+        chat_turn: Callable[[str, str, str], str],
+        drain_jobs: Callable[[float], int],
+        on_shutdown: Optional[List[Callable[[], None]]] = None,
+        max_concurrency: int = 32,
+        drain_timeout: float = 30,
+        transcriber_factory: Optional[Callable[[], object]] = None,
+        perception_workers: int = 2,
+        max_body_bytes: Optional[int] = None,
+        wsgi_workers: int = 16,
+    ):
+        """
+        Initializes the ASGI chat server.
+
+        :param wsgi_app: The Flask app serving all other routes.
+        :param chat_turn: Runs one chat turn (user_id, session_id, text) and returns the reply.
+        :param drain_jobs: Waits up to the given seconds for background jobs, returns how
+            many are still unfinished.
+        :param on_shutdown: Called after draining (e.g. to close the message store).
+        :param max_concurrency: Chat turns processed at once per worker (more wait on the loop).
+        :param drain_timeout: Seconds shutdown waits for in-flight turns and memory jobs.
+        :param transcriber_factory: Creates a StreamingTranscriber for each live audio stream
+            (None disables the /ws/transcribe endpoint).
+        :param perception_workers: Threads decoding live audio.
+        :param max_body_bytes: Larger request bodies are rejected with 413 before they are
+            buffered (the limit Flask applies to the routes it serves).
+        :param wsgi_workers: Threads serving the Flask routes (uploads, /readyz, ...).
+        """
+        self.wsgi_app = wsgi_app
+        self.wsgi_executor = ThreadPoolExecutor(wsgi_workers, thread_name_prefix="wsgi")
+        self.chat_turn = chat_turn
+        self.drain_jobs = drain_jobs
+        self.on_shutdown = list(on_shutdown or [])
+        self.executor = ThreadPoolExecutor(max_concurrency, thread_name_prefix="chat")
+        self.transcriber_factory = transcriber_factory
+        self.perception_executor = ThreadPoolExecutor(
+            perception_workers, thread_name_prefix="perception"
+        )
+        self.drain_timeout = drain_timeout
+        self.max_body_bytes = max_body_bytes
+        self.draining = False
+        self.in_flight = 0
+        self._user_locks: Dict[str, asyncio.Lock] = {}
+        self._user_waiters: Dict[str, int] = defaultdict(int)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif (
+            scope["type"] == "http"
+            and scope["path"] == "/send_message"
+            and scope["method"] == "POST"
+        ):
+            await self._send_message(scope, receive, send)
+        elif scope["type"] == "websocket" and scope["path"] == "/ws/transcribe":
+            await self._transcribe_stream(scope, receive, send)
+        elif scope["type"] == "websocket":
+            await receive()  # websocket.connect
+            await send({"type": "websocket.close", "code": 1008})
+        else:
+            body = await self._read_body(scope, receive)
+            if body is None:
+                await _send_json(send, 413, {"error": "Request body too large"})
+                return
+            await self._call_wsgi(scope, body, send)
+
+    async def _call_wsgi(self, scope, body: bytes, send) -> None:
+        """Serves a request with the Flask app on the WSGI thread pool."""
+        loop = asyncio.get_running_loop()
+        status, headers, content = await loop.run_in_executor(
+            self.wsgi_executor, _run_wsgi, self.wsgi_app, _wsgi_environ(scope, body)
+        )
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (name.lower().encode("latin-1"), value.encode("latin-1"))
+                    for name, value in headers
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": content})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.drain()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def drain(self) -> None:
+        """Rejects new chat turns, then waits for running turns and queued memory jobs."""
+        self.draining = True
+        deadline = time.monotonic() + self.drain_timeout
+        while self.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        loop = asyncio.get_running_loop()
+        remaining = max(0.0, deadline - time.monotonic())
+        unfinished = await loop.run_in_executor(None, self.drain_jobs, remaining)
+        if self.in_flight or unfinished:
+            logger.warning(
+                "Shutdown deadline reached with %d chat turn(s) and %d memory job(s) pending",
+                self.in_flight,
+                unfinished,
+            )
+        self.executor.shutdown(wait=False)
+        self.perception_executor.shutdown(wait=False)
+        self.wsgi_executor.shutdown(wait=False)
+        for hook in self.on_shutdown:
+            hook()
+
+    @asynccontextmanager
+    async def _user_turn(self, user_id: str):
+        """Serializes the turns of one user without holding a thread while waiting."""
+        lock = self._user_locks.setdefault(user_id, asyncio.Lock())
+        self._user_waiters[user_id] += 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._user_waiters[user_id] -= 1
+            if not self._user_waiters[user_id]:
+                del self._user_waiters[user_id]
+                del self._user_locks[user_id]
+
+    async def _run_turn(self, user_id: str, session_id: str, text: str) -> str:
+        """Runs a chat turn on the thread pool, after earlier turns of the same user."""
+        self.in_flight += 1
+        try:
+            async with self._user_turn(user_id):
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    self.executor,
+                    bind_context(self.chat_turn),
+                    user_id,
+                    session_id,
+                    text,
+                )
+        finally:
+            self.in_flight -= 1
+
+    async def _transcribe_stream(self, scope, receive, send):
+        """
+        Live transcription: binary frames carry raw PCM (query parameters format=s16le|f32,
+        sample_rate, channels), a {"type": "end"} text frame ends the utterance. Partial
+        transcripts are pushed as the audio arrives; the final one is sent and then answered
+        as a chat turn.
+        """
+        query = parse_qs(scope["query_string"].decode())
+        params = {key: values[-1] for key, values in query.items()}
+        await receive()  # websocket.connect
+        if self.transcriber_factory is None or not (
+            params.get("user_id") and params.get("session_id")
+        ):
+            await send({"type": "websocket.close", "code": 1008})
+            return
+        if self.draining:
+            await send({"type": "websocket.close", "code": 1013})
+            return
+        await send({"type": "websocket.accept"})
+
+        pcm_format = params.get("format", "s16le")
+        sample_rate = int(params.get("sample_rate", "16000"))
+        channels = int(params.get("channels", "1"))
+        transcriber = self.transcriber_factory()
+        loop = asyncio.get_running_loop()
+        decoding = None
+
+        async def send_event(event_type: str, text: str) -> None:
+            event = json.dumps({"type": event_type, "text": text})
+            await send({"type": "websocket.send", "text": event})
+
+        with tracer.span("ws /transcribe", {"user_id": params["user_id"]}):
+            try:
+                while True:
+                    message = await receive()
+                    if message["type"] == "websocket.disconnect":
+                        return
+                    if message.get("bytes"):
+                        transcriber.feed(
+                            pcm_to_float32(
+                                message["bytes"], pcm_format, sample_rate, channels
+                            )
+                        )
+                    elif message.get("text"):
+                        if json.loads(message["text"]).get("type") == "end":
+                            break
+
+                    # At most one partial decode per stream; a slow decode skips steps
+                    if decoding is not None and decoding.done():
+                        await send_event("partial", decoding.result())
+                        decoding = None
+                    if decoding is None and transcriber.due:
+                        decoding = loop.run_in_executor(
+                            self.perception_executor, bind_context(transcriber.partial)
+                        )
+
+                if decoding is not None:
+                    await decoding
+                text = await loop.run_in_executor(
+                    self.perception_executor, bind_context(transcriber.finish)
+                )
+                await send_event("final", text)
+                if text:
+                    response = await self._run_turn(
+                        params["user_id"], params["session_id"], text
+                    )
+                    await send_event("response", response)
+            except OverloadedError:
+                await send_event(
+                    "error", "Binge Buddy is busy, please try again shortly."
+                )
+            except Exception:
+                logger.exception("Live transcription failed")
+                await send_event("error", "Transcription failed")
+        await send({"type": "websocket.close", "code": 1000})
+
+    async def _read_body(self, scope, receive) -> Optional[bytes]:
+        """The request body, or None if it is larger than max_body_bytes."""
+        limit = self.max_body_bytes
+        headers = dict(scope.get("headers") or [])
+        declared = headers.get(b"content-length")
+        if limit is not None and declared is not None and int(declared) > limit:
+            return None
+        chunks, size = [], 0
+        more = True
+        while more:
+            message = await receive()
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if limit is not None and size > limit:
+                return None
+            chunks.append(chunk)
+            more = message.get("more_body", False)
+        return b"".join(chunks)
+
+    async def _send_message(self, scope, receive, send):
+        body = await self._read_body(scope, receive)
+        if body is None:
+            await _send_json(send, 413, {"error": "Request body too large"})
+            return
+
+        try:
+            data = json.loads(body or b"{}")
+        except ValueError:
+            await _send_json(send, 400, {"error": "Invalid JSON"})
+            return
+        if not data.get("user_id") or not data.get("session_id") or "text" not in data:
+            # Cookie-based sessions are resolved by Flask
+            await self._call_wsgi(scope, body, send)
+            return
+        if self.draining:
+            await _send_json(send, 503, {"error": "Server is shutting down"})
+            return
+
+        headers = dict(scope.get("headers") or [])
+        trace_id, parent_id = parse_traceparent(
+            headers.get(b"traceparent", b"").decode()
+        )
+        try:
+            with tracer.span(
+                "POST /send_message", trace_id=trace_id, parent_id=parent_id
+            ) as span:
+                response = await self._run_turn(
+                    data["user_id"], data["session_id"], data["text"]
+                )
+            await _send_json(send, 200, {"response": response}, trace_id=span.trace_id)
+        except OverloadedError as e:
+            await _send_json(
+                send,
+                503,
+                {"error": "Binge Buddy is busy, please try again shortly."},
+                retry_after=e.retry_after,
+            )
+        except Exception:
+            logger.exception("Chat turn failed")
+            await _send_json(send, 500, {"error": "Internal server error"})
+
+
+def _wsgi_environ(scope, body: bytes) -> Dict:
+    """The WSGI environ of an ASGI HTTP request whose body was already read."""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers") or []:
+        name, value = name.decode("latin-1"), value.decode("latin-1")
+        if name == "content-length":
+            continue
+        key = (
+            "CONTENT_TYPE"
+            if name == "content-type"
+            else f"HTTP_{name.upper().replace('-', '_')}"
+        )
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _run_wsgi(app, environ: Dict) -> Tuple[int, List[Tuple[str, str]], bytes]:
+    """Calls a WSGI app and returns its status code, headers and buffered body."""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = headers
+
+    chunks = app(environ, start_response)
+    try:
+        content = b"".join(chunks)
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+    return response["status"], response["headers"], content
+
+
+async def _send_json(
+    send,
+    status: int,
+    payload: Dict,
+    trace_id: Optional[str] = None,
+    retry_after: Optional[float] = None,
+):
+    body = json.dumps(payload).encode("utf-8")
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+    ]
+    if trace_id:
+        headers.append((b"x-trace-id", trace_id.encode()))
+    if retry_after is not None:
+        headers.append((b"retry-after", str(int(retry_after + 0.5)).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+def create_app() -> ChatServer:
+    """Builds the ASGI app around the front end (called once in every worker)."""
+    from binge_buddy import front_end
+    from binge_buddy.streaming import StreamingTranscriber
+
+    return ChatServer(
+        front_end.app,
+        chat_turn=front_end.chat_turn,
+        drain_jobs=front_end.drain_memory_jobs,
+        on_shutdown=[
+            front_end.session_registry.close,
+            front_end.message_store.close,
+            *([front_end.perception_pool.close] if front_end.perception_pool else []),
+            *(
+                [front_end.compaction_worker.stop]
+                if front_end.compaction_worker
+                else []
+            ),
+        ],
+        max_concurrency=int(os.getenv("CHAT_CONCURRENCY", "32")),
+        drain_timeout=float(os.getenv("DRAIN_TIMEOUT", "30")),
+        transcriber_factory=lambda: StreamingTranscriber(front_end.agent),
+        perception_workers=int(os.getenv("PERCEPTION_WORKERS", "2")),
+        max_body_bytes=front_end.app.config["MAX_CONTENT_LENGTH"],
+        wsgi_workers=int(os.getenv("WSGI_THREADS", "16")),
+    )
+
+
+def run(host: str = "0.0.0.0", port: int = 5000, workers: int = 1) -> None:
+    """
+    Serves the app with uvicorn in a single worker process. Conversation state, the
+    per-user turn locks and (without FLASK_SECRET_KEY) the cookie signing key live in the
+    process, and uvicorn's workers share one socket, so a user's requests could not be
+    kept on one worker: scale out with several instances behind a sticky load balancer.
+    """
+    if workers != 1:
+        raise ValueError(
+            "Conversation state is per process: run one worker per instance"
+        )
+    import uvicorn
+
+    uvicorn.run(
+        "binge_buddy.serve:create_app",
+        factory=True,
+        host=host,
+        port=port,
+        workers=workers,
+        backlog=4096,
+        timeout_keep_alive=int(os.getenv("KEEP_ALIVE_TIMEOUT", "75")),
+        timeout_graceful_shutdown=int(os.getenv("DRAIN_TIMEOUT", "30")),
+        log_config=None,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve the chat front end with uvicorn."
+    )
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("WEB_CONCURRENCY", "1")),
+        help="Must be 1: conversation state lives in the worker process.",
+    )
+    args = parser.parse_args()
+    if args.workers != 1:
+        parser.error(
+            "--workers must be 1 (conversation state is per process); "
+            "run several instances behind a sticky load balancer instead"
+        )
+
+    run(args.host, args.port, args.workers)
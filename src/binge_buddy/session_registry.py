@@ -0,0 +1,222 @@
+"""Registry of per-(user, session) conversation state with TTL and LRU eviction"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from binge_buddy.message_log import MessageLog
+
+SessionKey = Tuple[str, str]
+
+# Rough per-message overhead (object, attributes, ids, timestamp) on top of the content
+MESSAGE_OVERHEAD_BYTES = 120
+SESSION_OVERHEAD_BYTES = 2048
+
+
+@dataclass
+class Session:
+    user_id: str
+    session_id: str
+    message_log: MessageLog
+    agent: Any = None
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    last_access: float = field(default_factory=time.monotonic)
+    estimated_bytes: int = SESSION_OVERHEAD_BYTES
+    _sized_messages: int = 0
+
+    def update_size(self) -> int:
+        """Adds the size of messages appended since the last call to the estimate."""
+        messages = self.message_log.messages
+        if len(messages) < self._sized_messages:
+            # The log was cleared
+            self.estimated_bytes = SESSION_OVERHEAD_BYTES
+            self._sized_messages = 0
+        for message in messages[self._sized_messages :]:
+            self.estimated_bytes += (
+                sys.getsizeof(message.content) + MESSAGE_OVERHEAD_BYTES
+            )
+        self._sized_messages = len(messages)
+        return self.estimated_bytes
+
+
+class SessionRegistry:
+    def __init__(
+        self,
+        factory: Callable[[str, str], Session],
+        max_sessions: int = 10000,
+        max_bytes: Optional[int] = None,
+        idle_ttl: float = 1800,
+        on_evict: Optional[List[Callable[[Session], None]]] = None,
+    ):
+        """
+        Initializes the session registry.
+
+        :param factory: Creates a new Session for a (user_id, session_id) pair.
+        :param max_sessions: Upper bound on sessions kept in memory (LRU beyond that).
+        :param max_bytes: Optional upper bound on the estimated memory of all sessions.
+        :param idle_ttl: Sessions idle for longer than this many seconds are evicted.
+        :param on_evict: Hooks called with every evicted session (e.g. to flush its log).
+        """
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.on_evict = list(on_evict or [])
+        self._sessions: "OrderedDict[SessionKey, Session]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    @property
+    def estimated_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, user_id: str, session_id: str) -> Session:
+        """Returns the session for the key, creating it if needed, and marks it as recently used."""
+        key = (user_id, session_id)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                self._sessions.move_to_end(key)
+                session.last_access = time.monotonic()
+                return session
+
+        # Creating a session reads its log back from disk: keep other sessions unblocked
+        created = self.factory(user_id, session_id)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._sessions[key] = created
+                self._bytes += session.estimated_bytes
+            else:
+                # Another request created it first; use that one
+                self._sessions.move_to_end(key)
+            session.last_access = time.monotonic()
+        return session
+
+    @contextmanager
+    def session(self, user_id: str, session_id: str) -> Iterator[Session]:
+        """
+        Serializes requests on one session: holds the session lock for the duration of the
+        block, then updates its size estimate and enforces the registry bounds.
+        """
+        while True:
+            session = self.get(user_id, session_id)
+            session.lock.acquire()
+            # Evicted between get() and taking its lock: a locked session is never
+            # evicted, so a session still registered now stays registered
+            with self._lock:
+                registered = self._sessions.get((user_id, session_id)) is session
+            if registered:
+                break
+            session.lock.release()
+        try:
+            yield session
+            before = session.estimated_bytes
+            session.update_size()
+            session.last_access = time.monotonic()
+        finally:
+            session.lock.release()
+        with self._lock:
+            if self._sessions.get((user_id, session_id)) is session:
+                self._bytes += session.estimated_bytes - before
+        self.evict()
+
+    def evict(self) -> List[Session]:
+        """
+        Evicts idle sessions and then least recently used ones until the registry is within
+        its bounds. Sessions that are currently in use are skipped.
+
+        :return: The evicted sessions.
+        """
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            for key, session in list(self._sessions.items()):
+                over_budget = len(self._sessions) > self.max_sessions or (
+                    self.max_bytes is not None and self._bytes > self.max_bytes
+                )
+                idle = now - session.last_access > self.idle_ttl
+                if not (over_budget or idle):
+                    # Oldest first: once a session is neither idle nor over budget, stop
+                    break
+                if session.lock.locked():
+                    continue
+                del self._sessions[key]
+                self._bytes -= session.estimated_bytes
+                evicted.append(session)
+
+        for session in evicted:
+            for hook in self.on_evict:
+                hook(session)
+        return evicted
+
+    def close(self) -> None:
+        """Evicts every session, running the eviction hooks."""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+            self._bytes = 0
+        for session in sessions:
+            for hook in self.on_evict:
+                hook(session)
+
+    def start_sweeper(self, interval: float = 60) -> threading.Thread:
+        """Evicts idle sessions periodically in a daemon thread."""
+
+        def sweep():
+            while True:
+                time.sleep(interval)
+                self.evict()
+
+        sweeper = threading.Thread(target=sweep, name="session-sweeper", daemon=True)
+        sweeper.start()
+        return sweeper
+
+    def stats(self) -> Dict[str, int]:
+        return {"sessions": len(self._sessions), "estimated_bytes": self._bytes}
+
+
+if __name__ == "__main__":
+    # Memory footprint of 10k sessions with a short conversation each
+    import tracemalloc
+
+    from binge_buddy.message import Message
+
+    def create_session(user_id, session_id):
+        return Session(
+            user_id, session_id, MessageLog(session_id=session_id, user_id=user_id)
+        )
+
+    tracemalloc.start()
+    registry = SessionRegistry(create_session, max_sessions=10000)
+    for i in range(10000):
+        user_id, session_id = f"user-{i}", f"session-{i}"
+        with registry.session(user_id, session_id) as session:
+            for turn in range(5):
+                session.message_log.add_message(
+                    Message(
+                        content=f"Can you recommend something like Inception? ({turn})",
+                        role="user",
+                        user_id=user_id,
+                        session_id=session_id,
+                    )
+                )
+                session.message_log.add_message(
+                    Message(
+                        content="Sure! Try Interstellar, Tenet or The Prestige.",
+                        role="system",
+                        user_id=user_id,
+                        session_id=session_id,
+                    )
+                )
+    current, peak = tracemalloc.get_traced_memory()
+    print(registry.stats())
+    print(f"Traced memory: {current / 1e6:.1f} MB (peak {peak / 1e6:.1f} MB)")
+    print(f"Per session: {current / len(registry) / 1024:.1f} KiB")
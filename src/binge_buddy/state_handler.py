@@ -1,4 +1,6 @@
 import json
+import logging
+from datetime import datetime, timezone
 from typing import Dict, Optional, Sequence, TypedDict, List
 
 from langchain.tools import StructuredTool
@@ -11,14 +13,25 @@ from binge_buddy.aggregator_reviewer import AggregatorReviewer
 from binge_buddy.enums import Action, Attribute
 from binge_buddy.extractor_reviewer import ExtractorReviewer
 from binge_buddy.memory_aggregator import MemoryAggregator
-from binge_buddy.memory_db import MemoryDB
+from binge_buddy.memory_db import VersionConflictError, get_memory_db
 from binge_buddy.memory_extractor import MemoryExtractor
+from binge_buddy.memory_index import MemoryIndex
 from binge_buddy.memory_sentinel import MemorySentinel
 from binge_buddy.message_log import MessageLog
 from binge_buddy.ollama import OllamaLLM
+from binge_buddy.tracing import traced
+
+logger = logging.getLogger(__name__)
 
 llm = OllamaLLM()
-# db = MemoryDB()
+memory_index = MemoryIndex()
+db = get_memory_db()
+
+MEMORY_COLLECTION = "memories"
+# Number of times a conflicting aggregation is redone against the fresh profile
+MAX_WRITE_RETRIES = 3
+# Number of times a reviewer may send the extraction or aggregation back before giving up
+MAX_REVIEW_ROUNDS = 3
 
 
 # defines argument type
@@ -32,26 +45,43 @@ class AddKnowledge(BaseModel):
         description="If updating, the complete, exact phrase of the existing knowledge to modify",
     )
     attribute: Attribute = Field(
-        ...,
-        description="Attribute that this knowledge belongs to"
+        ..., description="Attribute that this knowledge belongs to"
     )
     action: Action = Field(
         ...,
         description="Whether this knowledge is adding a new record, or updating an existing record with aggregated information",
     )
 
+
 # Define the state of the agent
 class AgentState(TypedDict):
+    # The user whose memories are being processed
+    user_id: str
     # The list of previous messages in the conversation
     messages: Sequence[BaseMessage]
     # The long-term memories to remember
     memories: Dict[str, str]
+    # The stored facts the aggregator was given; its result replaces those, the other
+    # stored facts of an attribute are kept
+    shown_memories: List[Dict[str, str]]
+    # Version of the stored profile the memories were read from (0 if there is none yet)
+    memories_version: int
     # Whether the information is relevant
     contains_information: str
     # The extracted knowledge from the user's message
     extracted_knowledge: str
     # The aggregations of the extracted knowledge assigned to an attribute
     aggregated_memory: str
+    # The review verdicts: "valid" or "invalid: <reviewer feedback>"
+    extractor_valid: str
+    aggregator_valid: str
+    # Number of reviews so far, to stop a reviewer that never approves
+    extractor_reviews: int
+    aggregator_reviews: int
+    # Whether the last profile write lost a compare-and-swap, and how many writes did
+    write_conflict: bool
+    write_attempts: int
+
 
 def modify_knowledge(
     knowledge: str,
@@ -59,7 +89,9 @@ def modify_knowledge(
     action: str,
     knowledge_old: str = "",
 ) -> dict:
-    print("Modifying Knowledge: ", knowledge, knowledge_old, attribute, action)
+    logger.debug(
+        "Modifying Knowledge: %s %s %s %s", knowledge, knowledge_old, attribute, action
+    )
     # retrieve current knowledge base
     # todo: replace with database retrieval
     memory = {}
@@ -83,7 +115,8 @@ tool_modify_knowledge = StructuredTool.from_function(
 # Set up the agent's tools
 agent_tools = [tool_modify_knowledge]
 
-#region Graph Node Functions
+
+# region Graph Node Functions
 # Define the function that determines whether to continue or not
 def should_continue(state):
     last_message = state["messages"][-1]
@@ -96,6 +129,7 @@ def should_continue(state):
 
 
 # Define the function to execute tools
+@traced("memory.action")
 def call_tool(state):
     messages = state["messages"]
     last_message = messages[-1]
@@ -113,9 +147,124 @@ def call_tool(state):
             )
 
             messages.append(function_message)
-    return {"messages": messages}
+
+    # Persist the approved aggregated memories and index them incrementally
+    user_id = state.get("user_id")
+    aggregated_memory = utils.parse_aggregated_memory(
+        state.get("aggregated_memory", "")
+    )
+    if user_id and aggregated_memory:
+        facts = save_aggregated_memory(state, aggregated_memory)
+        if facts is None:
+            attempts = state.get("write_attempts", 0) + 1
+            if attempts > MAX_WRITE_RETRIES:
+                raise VersionConflictError(
+                    f"Profile of {user_id} kept changing, giving up"
+                )
+            logger.info(
+                "Profile of %s changed concurrently, aggregating again", user_id
+            )
+            # Back through the aggregator and its reviewer with a fresh review budget
+            return {
+                "messages": messages,
+                "write_conflict": True,
+                "write_attempts": attempts,
+                "aggregator_reviews": 0,
+            }
+        memory_index.add_facts(user_id, facts)
+
+    return {"messages": messages, "write_conflict": False}
+
+
+def load_profile(user_id):
+    """Returns the stored memories of a user and the profile version they belong to."""
+    profile = db.find_one(MEMORY_COLLECTION, {"user_id": user_id})
+    if not profile:
+        return None, 0
+    return profile.get("memories", {}), profile.get("version", 0)
+
+
+def seed_memory_index():
+    """
+    Indexes every stored profile. The index lives in memory only, so this rebuilds it
+    after a restart.
+
+    :return: The number of profiles indexed.
+    """
+    count = 0
+    for profile in db.find(MEMORY_COLLECTION, projection={"user_id": 1, "memories": 1}):
+        if profile.get("user_id") and profile.get("memories"):
+            memory_index.add_profile(profile["user_id"], profile["memories"])
+            count += 1
+    logger.info("Indexed the memories of %d profiles", count)
+    return count
+
+
+def merge_aggregated_memory(memories, shown_memories, aggregated_memory):
+    """
+    Merges an aggregation into the stored profile. The aggregator's values replace the
+    stored facts it was given (it may have merged or corrected them); the stored facts of
+    the same attribute it was not given are kept.
+
+    :param memories: The stored profile's mapping of attribute to value.
+    :param shown_memories: The stored facts the aggregator was given.
+    :param aggregated_memory: The aggregator's {"attribute", "value"} entries.
+    :return: Mapping of every attribute the aggregation touches to its merged values.
+    """
+    stored = {attribute.upper(): value for attribute, value in (memories or {}).items()}
+    shown = {
+        (fact["attribute"].upper(), fact["value"].strip())
+        for fact in shown_memories or []
+    }
+    values = {}
+    for memory in aggregated_memory:
+        attribute, value = memory["attribute"].upper(), memory["value"].strip()
+        if attribute not in values:
+            values[attribute] = [
+                fact["value"]
+                for fact in MemoryIndex.profile_facts(
+                    {attribute: stored.get(attribute, "")}
+                )
+                if (attribute, fact["value"]) not in shown
+            ]
+        if value not in values[attribute]:
+            values[attribute].append(value)
+    return values
+
+
+def save_aggregated_memory(state, aggregated_memory):
+    """
+    Merges aggregated memories into the stored profile with a compare-and-swap on the
+    profile version.
+
+    :return: The facts of every attribute written, or None if another pipeline updated
+        the profile since it was read; the aggregation then has to be redone (and
+        reviewed) against the fresh profile instead of overwriting the other pipeline's
+        facts.
+    """
+    values = merge_aggregated_memory(
+        state.get("memories"), state.get("shown_memories"), aggregated_memory
+    )
+    updates = {f"memories.{attribute}": "; ".join(v) for attribute, v in values.items()}
+    updates["last_updated"] = datetime.now(timezone.utc).isoformat()
+
+    try:
+        db.update_one(
+            MEMORY_COLLECTION,
+            {"user_id": state["user_id"]},
+            updates,
+            expected_version=state.get("memories_version", 0),
+        )
+    except VersionConflictError:
+        return None
+    return [
+        {"attribute": attribute, "value": value}
+        for attribute, attribute_values in values.items()
+        for value in attribute_values
+    ]
 
 
+@traced("memory.sentinel")
 def call_memory_sentinel(state):
     messages = state["messages"]
     last_message = messages[-1]
@@ -127,6 +276,7 @@ def call_memory_sentinel(state):
     return {"contains_information": "TRUE" in response and "yes" or "no"}
 
 
+@traced("memory.extractor")
 def call_memory_extractor(state):
     # memories = db.get_collection("memories").find()
     # for document in memories:
@@ -135,65 +285,136 @@ def call_memory_extractor(state):
     last_message = messages[-1]
     message_log = MessageLog(user_id="user", session_id="session")
     memory_extractor = MemoryExtractor(llm=llm, message_log=message_log)
-    response = utils.remove_think_tags(memory_extractor.memory_extractor_runnable.invoke(
-        {"messages": [last_message]}
-    ))
+    response = utils.remove_think_tags(
+        memory_extractor.memory_extractor_runnable.invoke({"messages": [last_message]})
+    )
     response = response.split("Memory Extractor Result:", 1)[-1].strip()
     return {"extracted_knowledge": f"{response}"}
 
 
+@traced("memory.extractor_reviewer")
 def call_extractor_reviewer(state):
     messages = state["messages"]
     last_message = messages[-1]
     extracted_knowledge = state["extracted_knowledge"]
     message_log = MessageLog(user_id="user", session_id="session")
     memory_reviewer = ExtractorReviewer(llm=llm, message_log=message_log)
-    response =utils.remove_think_tags( memory_reviewer.memory_reviewer_runnable.invoke(
-        {"user_message": [last_message], "extracted_knowledge": extracted_knowledge}
-    ))
+    response = utils.remove_think_tags(
+        memory_reviewer.memory_reviewer_runnable.invoke(
+            {"user_message": [last_message], "extracted_knowledge": extracted_knowledge}
+        )
+    )
     return {
-        "extractor_valid": "valid" if "APPROVED" in response else f"invalid: {response}"
+        "extractor_valid": (
+            "valid" if "APPROVED" in response else f"invalid: {response}"
+        ),
+        "extractor_reviews": state.get("extractor_reviews", 0) + 1,
     }
 
 
+def aggregate(memories, extracted_knowledge, user_id=None):
+    """:return: The aggregation result and the stored facts the aggregator was given."""
+    memory_aggregator = MemoryAggregator(llm=llm, memory_index=memory_index)
+    shown_memories = memory_aggregator.select_existing(
+        memories, extracted_knowledge, user_id
+    )
+    response = utils.remove_think_tags(
+        memory_aggregator.run(
+            existing_memories=shown_memories,
+            extracted_knowledge=extracted_knowledge,
+        )
+    )
+    return response.split("Aggregation Result:", 1)[-1].strip(), shown_memories
+
+
+@traced("memory.aggregator")
 def call_memory_aggregator(state):
     memories = state.get("memories", [])
-    extracted_knowledge = state["extracted_knowledge"]
-    memory_aggregator = MemoryAggregator(llm=llm)
-    response = utils.remove_think_tags(memory_aggregator.run(
-        existing_memories=memories, extracted_knowledge=extracted_knowledge
-    ))
-    response = response.split("Aggregation Result:", 1)[-1].strip()
-    return {"aggregated_memory": f"{response}"}
+    version = 0
+    user_id = state.get("user_id")
+    if user_id:
+        # Aggregate against the latest stored profile and remember its version: the
+        # aggregator and its reviewer only see facts from this profile
+        stored_memories, version = load_profile(user_id)
+        memories = stored_memories or {}
+    response, shown_memories = aggregate(
+        memories, state["extracted_knowledge"], user_id
+    )
+    return {
+        "aggregated_memory": f"{response}",
+        "memories": memories,
+        "shown_memories": shown_memories,
+        "memories_version": version,
+    }
 
 
+@traced("memory.aggregator_reviewer")
 def call_aggregator_reviewer(state):
-    memories = state.get("memories", [])
+    # The reviewer judges the aggregation against the same stored facts it was given
+    memories = MemoryIndex.format_facts(state.get("shown_memories") or [])
     extracted_knowledge = state["extracted_knowledge"]
     aggregated_memory = state["aggregated_memory"]
     aggregator_reviewer = AggregatorReviewer(llm=llm)
-    response = utils.remove_think_tags(aggregator_reviewer.run(
-        existing_memories=memories,
-        extracted_knowledge=extracted_knowledge,
-        aggregated_memory=aggregated_memory,
-    ))
+    response = utils.remove_think_tags(
+        aggregator_reviewer.run(
+            existing_memories=memories,
+            extracted_knowledge=extracted_knowledge,
+            aggregated_memory=aggregated_memory,
+        )
+    )
     response = response.split("Aggregation Result:", 1)[-1].strip()
     return {
         "aggregator_valid": (
             "valid" if "APPROVED" in response else f"invalid: {response}"
-        )
+        ),
+        "aggregator_reviews": state.get("aggregator_reviews", 0) + 1,
     }
-#endregion
 
-class GraphHandler():
-    '''
+
+def review_route(verdict_key, rounds_key, approved, retry):
+    """
+    Routes on a reviewer's verdict: on to ``approved`` if it is valid, back to ``retry``
+    otherwise, and to the end once MAX_REVIEW_ROUNDS reviews were rejected.
+    """
+
+    def route(state):
+        if state.get(verdict_key) == "valid":
+            return approved
+        if state.get(rounds_key, 0) >= MAX_REVIEW_ROUNDS:
+            logger.info(
+                "Giving up after %d rejected reviews (%s)",
+                MAX_REVIEW_ROUNDS,
+                verdict_key,
+            )
+            return END
+        return retry
+
+    return route
+
+
+# endregion
+
+
+class GraphHandler:
+    """
     This class is responsible for setting up the graph assigning nodes.
-    '''
+    """
+
     def __init__(self):
         self.state = AgentState
         self.graph = None  # Initialize graph as None
 
-    def run(self):
+    def run(self, ensure_indexes=True):
+        """
+        Compiles the memory graph.
+
+        :param ensure_indexes: Create the profile indexes first (a database round-trip);
+            the server does this in the background instead.
+        """
+        # Versioned profile writes rely on one profile document per user
+        if ensure_indexes:
+            db.ensure_indexes(MEMORY_COLLECTION)
+
         # Initialize a new graph
         self.graph = StateGraph(self.state)
 
@@ -233,10 +454,11 @@ class GraphHandler():
 
         self.graph.add_conditional_edges(
             "memory_reviewer",
-            lambda state: (
-                "memory_aggregator"
-                if "APPROVED" in state["extractor_valid"]
-                else "memory_extractor"
+            review_route(
+                "extractor_valid",
+                "extractor_reviews",
+                "memory_aggregator",
+                "memory_extractor",
             ),
         )
 
@@ -253,15 +475,16 @@ class GraphHandler():
 
         self.graph.add_conditional_edges(
             "aggregator_reviewer",
-            lambda state: (
-                "action"
-                if "APPROVED" in state["aggregator_valid"]
-                else "memory_aggregator"
+            review_route(
+                "aggregator_valid", "aggregator_reviews", "action", "memory_aggregator"
             ),
         )
 
-        # We now add Normal Edges that should always be called after another
-        self.graph.add_edge("action", END)
+        # A write that lost the compare-and-swap is aggregated and reviewed again
+        self.graph.add_conditional_edges(
+            "action",
+            lambda state: "memory_aggregator" if state.get("write_conflict") else END,
+        )
 
         # We compile the entire workflow as a runnable
         app = self.graph.compile()
@@ -277,11 +500,10 @@ class GraphHandler():
         for node in nodes:
             print(f"- {node}")
 
+
 if __name__ == "__main__":
     handler = GraphHandler()
     app = handler.run()
 
     # Print all the nodes in the graph
     handler.print_nodes()
-
-
@@ -0,0 +1,91 @@
+"""Incremental transcription of live audio over a rolling buffer"""
+
+import threading
+from typing import List
+
+import numpy as np
+
+from binge_buddy.audio_io import SAMPLE_RATE
+from binge_buddy.long_form import drop_repeated_prefix, parse_segments
+
+
+class StreamingTranscriber:
+    def __init__(self, agent, step_seconds: float = 1.0, commit_seconds: float = 20.0):
+        """
+        Initializes a transcriber for one live audio stream.
+
+        :param agent: The PerceptionAgent whose Whisper model decodes the audio.
+        :param step_seconds: New audio needed before the next partial transcript is due.
+        :param commit_seconds: Once the buffer is this long, its finished segments are
+            committed and dropped from the buffer, so it never exceeds Whisper's window.
+        """
+        self.agent = agent
+        self.step_samples = int(step_seconds * SAMPLE_RATE)
+        self.commit_samples = int(commit_seconds * SAMPLE_RATE)
+        self.committed: List[str] = []
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._pending = 0  # samples received since the last partial
+        self._lock = threading.Lock()
+
+    @property
+    def due(self) -> bool:
+        """Whether enough new audio arrived for another partial transcript."""
+        return self._pending >= self.step_samples
+
+    def feed(self, samples: np.ndarray) -> None:
+        with self._lock:
+            self._buffer = np.concatenate([self._buffer, samples])
+            self._pending += len(samples)
+
+    def _text(self, tail: str) -> str:
+        committed = " ".join(self.committed)
+        if committed and tail:
+            tail = drop_repeated_prefix(committed, tail)
+        return " ".join(part for part in (committed, tail) if part)
+
+    def _commit(self, buffer: np.ndarray) -> None:
+        """Commits every finished segment but the last, which may still change."""
+        result = self.agent.decode_window(buffer, with_timestamps=True)
+        tokenizer = self.agent.tokenizer
+        segments = parse_segments(
+            result.tokens,
+            tokenizer.timestamp_begin,
+            tokenizer.decode,
+            0.0,
+            len(buffer) / SAMPLE_RATE,
+        )
+        if len(segments) >= 2:
+            keep = segments[:-1]
+            cut = int(keep[-1].end * SAMPLE_RATE)
+        else:
+            # One long segment: commit it whole rather than let the buffer outgrow the window
+            keep, cut = segments, len(buffer)
+        text = " ".join(segment.text for segment in keep)
+        if text:
+            self.committed.append(drop_repeated_prefix(" ".join(self.committed), text))
+        with self._lock:
+            # Only feed() touches the buffer concurrently, and it only appends
+            self._buffer = self._buffer[cut:]
+
+    def partial(self) -> str:
+        """
+        Decodes the current buffer and returns the transcript so far. Only one partial (or
+        finish) may run at a time per stream; feed() can run concurrently.
+        """
+        with self._lock:
+            self._pending = 0
+            buffer = self._buffer
+        if len(buffer) >= self.commit_samples:
+            self._commit(buffer)
+            with self._lock:
+                buffer = self._buffer
+        tail = self.agent.decode_window(buffer).text.strip() if len(buffer) else ""
+        return self._text(tail)
+
+    def finish(self) -> str:
+        """Decodes what is left in the buffer and returns the final transcript."""
+        with self._lock:
+            buffer = self._buffer
+            self._buffer = np.zeros(0, dtype=np.float32)
+        tail = self.agent.transcribe_audio(buffer).strip() if len(buffer) else ""
+        return self._text(tail)
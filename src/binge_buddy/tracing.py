@@ -0,0 +1,324 @@
+"""Span-based request tracing and structured, level-controlled logging"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+def _new_id(n_bytes: int) -> str:
+    return random.getrandbits(8 * n_bytes).to_bytes(n_bytes, "big").hex()
+
+
+class Span:
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "sampled",
+        "attributes",
+        "start_ns",
+        "end_ns",
+        "error",
+    )
+
+    def __init__(
+        self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes: Dict[str, Any] = {}
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if self.sampled:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        if self.sampled:
+            self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_otlp(self) -> Dict:
+        """The span in the OTLP/JSON span format."""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in self.attributes.items()
+            ],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+
+
+def _otlp_value(value: Any) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class FileExporter:
+    """Appends finished spans as OTLP/JSON lines to a local file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]) -> None:
+        lines = "".join(json.dumps(span.to_otlp()) + "\n" for span in spans)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+
+class OtlpHttpExporter:
+    """Sends spans to an OTLP/HTTP collector using the JSON encoding."""
+
+    def __init__(self, endpoint: str, service_name: str = "binge-buddy"):
+        self.endpoint = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+
+    def export(self, spans: List[Span]) -> None:
+        import requests
+
+        body = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": self.service_name},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "binge_buddy"},
+                            "spans": [s.to_otlp() for s in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+        requests.post(self.endpoint, json=body, timeout=5)
+
+
+class Tracer:
+    def __init__(
+        self,
+        exporter=None,
+        sample_rate: float = 1.0,
+        batch_size: int = 64,
+        flush_interval: float = 2.0,
+    ):
+        """
+        Initializes the tracer.
+
+        :param exporter: Receives batches of finished, sampled spans (None disables export).
+        :param sample_rate: Fraction of new traces that are recorded (head sampling).
+        :param batch_size: Spans per export batch.
+        :param flush_interval: Maximum seconds a finished span waits before export.
+        """
+        self.exporter = None
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=10000)
+        if exporter is not None:
+            self.start(exporter)
+
+    def start(self, exporter) -> None:
+        """Starts recording spans and exporting them in a background thread."""
+        if self.exporter is not None:
+            raise RuntimeError("The tracer already exports its spans")
+        self.exporter = exporter
+        threading.Thread(
+            target=self._export_loop, name="trace-exporter", daemon=True
+        ).start()
+
+    @contextmanager
+    def span(
+        self,
+        name: str,
+        attributes: Optional[Dict[str, Any]] = None,
+        trace_id: Optional[str] = None,
+        parent_id: Optional[str] = None,
+    ) -> Iterator[Span]:
+        """
+        Opens a span as a child of the current span, or as the root of a new trace (with the
+        given trace/parent id when continuing a trace from another process).
+        """
+        parent = _current_span.get()
+        if parent is not None and trace_id is None:
+            span = Span(name, parent.trace_id, parent.span_id, parent.sampled)
+        else:
+            # The sampling decision is made once, at the head of the trace
+            sampled = self.exporter is not None and random.random() < self.sample_rate
+            span = Span(name, trace_id or _new_id(16), parent_id, sampled)
+        if attributes:
+            span.set_attributes(attributes)
+
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            if span.sampled:
+                try:
+                    self._queue.put_nowait(span)
+                except queue.Full:
+                    pass
+
+    def _export_loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(
+                        self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    )
+                except queue.Empty:
+                    break
+            try:
+                self.exporter.export(batch)
+            except Exception:
+                logging.getLogger(__name__).warning(
+                    "Exporting %d spans failed", len(batch)
+                )
+
+
+def _create_exporter():
+    exporter = os.getenv("TRACE_EXPORTER", "file")
+    if exporter == "file":
+        return FileExporter(os.getenv("TRACE_FILE", "traces.jsonl"))
+    if exporter == "otlp":
+        return OtlpHttpExporter(
+            os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318")
+        )
+    return None
+
+
+# Nothing is recorded until the application calls configure_tracing()
+tracer = Tracer(sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "0.1")))
+
+
+def configure_tracing() -> None:
+    """Starts exporting traces as configured by TRACE_EXPORTER (once per process)."""
+    exporter = _create_exporter()
+    if exporter is not None and tracer.exporter is None:
+        tracer.start(exporter)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace_id if span else None
+
+
+def traced(name: str) -> Callable:
+    """Decorator running the function inside a span."""
+
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def bind_context(fn: Callable) -> Callable:
+    """Wraps fn so that it runs in a copy of the caller's context (e.g. in another thread)."""
+    context = contextvars.copy_context()
+    return functools.wraps(fn)(lambda *args, **kwargs: context.run(fn, *args, **kwargs))
+
+
+def parse_traceparent(header: Optional[str]):
+    """Returns (trace_id, parent_span_id) from a W3C traceparent header, or (None, None)."""
+    parts = (header or "").split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        return parts[1], parts[2]
+    return None, None
+
+
+class TraceContextFilter(logging.Filter):
+    """Adds the current trace and span id to every log record."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        span = _current_span.get()
+        record.trace_id = span.trace_id if span else None
+        record.span_id = span.span_id if span else None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "trace_id": getattr(record, "trace_id", None),
+            "span_id": getattr(record, "span_id", None),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+# The handler added by configure_logging, so that calling it again does not add another
+_log_handler: Optional[logging.Handler] = None
+
+
+def configure_logging(level: Optional[str] = None) -> None:
+    """
+    Adds a handler writing JSON logs carrying trace ids to the root logger, next to any
+    handlers the host application installed. The level comes from LOG_LEVEL (default INFO).
+    """
+    global _log_handler
+    root = logging.getLogger()
+    if _log_handler is None:
+        _log_handler = logging.StreamHandler()
+        _log_handler.setFormatter(JsonFormatter())
+        _log_handler.addFilter(TraceContextFilter())
+        root.addHandler(_log_handler)
+    root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
@@ -1,4 +1,6 @@
+import json
 import re
+from typing import Dict, List, Optional
 
 
 def remove_think_tags(response: str) -> str:
@@ -14,3 +16,59 @@ def remove_think_tags(response: str) -> str:
     return clean_response.strip()
 
 
+def parse_aggregated_memory(response: str) -> List[Dict[str, str]]:
+    """
+    Extracts the {"attribute": ..., "value": ...} entries from an aggregator response.
+
+    :param response: The aggregator output (only loosely JSON formatted).
+    :return: A list of dictionaries with "attribute" and "value" keys.
+    """
+    memories = []
+    for candidate in re.findall(r"\{[^{}]*\}", response):
+        try:
+            entry = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(entry, dict) and entry.get("attribute") and entry.get("value"):
+            memories.append(
+                {"attribute": str(entry["attribute"]), "value": str(entry["value"])}
+            )
+    return memories
+
+
+def parse_extracted_memories(response: str) -> List[str]:
+    """
+    Extracts the "memory" entries from a memory extractor response.
+
+    :param response: The extractor output in the form [ "memory" : ..., "memory" : ... ].
+    :return: A list of memory strings.
+    """
+    memories = re.findall(r'"memory"\s*:\s*"((?:[^"\\]|\\.)*)"', response)
+    return [memory.strip() for memory in memories if memory.strip()]
+
+
+def parse_extracted_facts(response: str) -> List[Dict[str, Optional[str]]]:
+    """
+    Extracts the {"memory": ..., "attribute": ...} entries from a memory extractor
+    response; memories listed without an attribute get None.
+
+    :param response: The extractor output.
+    :return: A list of dictionaries with "memory" and "attribute" keys.
+    """
+    facts = []
+    for candidate in re.findall(r"\{[^{}]*\}", response):
+        try:
+            entry = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(entry, dict) and str(entry.get("memory") or "").strip():
+            attribute = str(entry.get("attribute") or "").strip().upper()
+            facts.append(
+                {"memory": str(entry["memory"]).strip(), "attribute": attribute or None}
+            )
+    if facts:
+        return facts
+    return [
+        {"memory": memory, "attribute": None}
+        for memory in parse_extracted_memories(response)
+    ]
@@ -0,0 +1,199 @@
+"""Voice-activity detection to trim silence before transcription"""
+
+import logging
+import threading
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from binge_buddy.audio_io import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+VAD_BACKENDS = ("energy", "webrtc")
+
+
+def _runs(mask: np.ndarray) -> List[Tuple[int, int]]:
+    """(start, end) indices of the runs of True in a boolean array."""
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    return list(zip(edges[::2].tolist(), edges[1::2].tolist()))
+
+
+class VoiceActivityDetector:
+    def __init__(
+        self,
+        backend: str = "energy",
+        frame_ms: int = 30,
+        threshold_db: float = -45.0,
+        margin_db: float = 12.0,
+        zcr_threshold: float = 0.3,
+        min_speech_ms: int = 120,
+        padding_ms: int = 200,
+        merge_gap_ms: int = 300,
+        aggressiveness: int = 2,
+    ):
+        """
+        Initializes the detector.
+
+        :param backend: "energy" for frame energy and zero-crossing rate, or "webrtc" for the
+            WebRTC VAD model (optional dependency).
+        :param frame_ms: Frame length; the WebRTC VAD accepts 10, 20 or 30 ms.
+        :param threshold_db: Frames quieter than this (dBFS) are never speech.
+        :param margin_db: How far above the clip's noise floor (and below its peak) speech is.
+        :param zcr_threshold: Zero-crossing rate above which slightly quieter frames still
+            count as speech (unvoiced consonants such as "s" and "f").
+        :param min_speech_ms: Shorter bursts (clicks, bumps) are dropped.
+        :param padding_ms: Audio kept around each speech region, so word edges are not cut.
+        :param merge_gap_ms: Speech regions closer than this are merged.
+        :param aggressiveness: WebRTC VAD aggressiveness, 0 (least) to 3 (most).
+        """
+        if backend not in VAD_BACKENDS:
+            raise ValueError(f"Unsupported VAD backend: {backend}")
+        if backend == "webrtc":
+            try:
+                import webrtcvad
+
+                self._webrtc = webrtcvad.Vad(aggressiveness)
+            except ImportError:
+                logger.warning(
+                    "webrtcvad is not installed, falling back to energy VAD."
+                )
+                backend = "energy"
+        if backend == "webrtc" and frame_ms not in (10, 20, 30):
+            raise ValueError("The WebRTC VAD needs 10, 20 or 30 ms frames")
+
+        self.backend = backend
+        self.frame = SAMPLE_RATE * frame_ms // 1000
+        self.threshold_db = threshold_db
+        self.margin_db = margin_db
+        self.zcr_threshold = zcr_threshold
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.padding = SAMPLE_RATE * padding_ms // 1000
+        self.merge_gap = SAMPLE_RATE * merge_gap_ms // 1000
+        self.stats = {
+            "clips": 0,
+            "silent_clips": 0,
+            "seconds_in": 0.0,
+            "seconds_kept": 0.0,
+        }
+        self._lock = threading.Lock()
+
+    def _frames(self, audio: np.ndarray) -> np.ndarray:
+        count = len(audio) // self.frame
+        return audio[: count * self.frame].reshape(count, self.frame)
+
+    def _energy_mask(self, frames: np.ndarray) -> np.ndarray:
+        energy = 10 * np.log10(np.mean(frames.astype(np.float32) ** 2, axis=1) + 1e-10)
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+        # Adapt to the clip: above its noise floor, but never so high that speech quieter
+        # than the loudest frame by more than the margin is lost
+        noise_floor = np.percentile(energy, 10)
+        threshold = max(
+            self.threshold_db,
+            min(noise_floor + self.margin_db, energy.max() - self.margin_db),
+        )
+        voiced = energy > threshold
+        unvoiced = (energy > threshold - self.margin_db / 2) & (
+            zcr > self.zcr_threshold
+        )
+        return voiced | unvoiced
+
+    def _webrtc_mask(self, frames: np.ndarray) -> np.ndarray:
+        pcm = (np.clip(frames, -1.0, 1.0) * 32767).astype("<i2")
+        return np.array(
+            [self._webrtc.is_speech(frame.tobytes(), SAMPLE_RATE) for frame in pcm]
+        )
+
+    def regions(self, audio: np.ndarray) -> List[Tuple[int, int]]:
+        """
+        Finds the speech in 16 kHz mono float32 samples.
+
+        :return: Non-overlapping (start, end) sample ranges, padded and merged.
+        """
+        frames = self._frames(audio)
+        if not len(frames):
+            return []
+        mask = (
+            self._webrtc_mask(frames)
+            if self.backend == "webrtc"
+            else self._energy_mask(frames)
+        )
+        regions: List[Tuple[int, int]] = []
+        for start, end in _runs(mask):
+            if end - start < self.min_speech_frames:
+                continue
+            start = max(0, start * self.frame - self.padding)
+            end = min(len(audio), end * self.frame + self.padding)
+            if regions and start - regions[-1][1] <= self.merge_gap:
+                regions[-1] = (regions[-1][0], end)
+            else:
+                regions.append((start, end))
+        return regions
+
+    def trim(self, audio: np.ndarray) -> np.ndarray:
+        """
+        Returns only the speech in ``audio``: leading and trailing silence is cut and the
+        remaining regions are joined. Silent audio gives an empty array.
+        """
+        regions = self.regions(audio)
+        if len(regions) == 1:
+            speech = audio[regions[0][0] : regions[0][1]]
+        elif regions:
+            speech = np.concatenate([audio[start:end] for start, end in regions])
+        else:
+            speech = audio[:0]
+        with self._lock:
+            self.stats["clips"] += 1
+            self.stats["silent_clips"] += not regions
+            self.stats["seconds_in"] += len(audio) / SAMPLE_RATE
+            self.stats["seconds_kept"] += len(speech) / SAMPLE_RATE
+        return speech
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self.stats)
+
+
+if __name__ == "__main__":
+    # Decode time with and without VAD over a directory of recorded clips
+    import sys
+    import time
+    from pathlib import Path
+
+    from binge_buddy.audio_io import decode_audio
+    from binge_buddy.perception_agent import PerceptionAgent
+
+    directory = (
+        Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / "audio"
+    )
+    clips = [
+        (path.name, decode_audio(path.read_bytes()))
+        for path in sorted(directory.iterdir())
+    ]
+    # A silent upload (an accidental tap on the record button)
+    clips.append(("silence (5 s)", np.zeros(5 * SAMPLE_RATE, dtype=np.float32)))
+
+    plain = PerceptionAgent()
+    with_vad = PerceptionAgent(vad=VoiceActivityDetector())
+    plain.transcribe_audio(clips[0][1])  # load the models
+    with_vad.transcribe_audio(clips[0][1])
+
+    totals = [0.0, 0.0]
+    for name, audio in clips:
+        timings = []
+        for i, agent in enumerate((plain, with_vad)):
+            start = time.perf_counter()
+            text = agent.transcribe_audio(audio)
+            elapsed = time.perf_counter() - start
+            totals[i] += elapsed
+            timings.append(f"{elapsed:5.2f} s ({len(text.split()):>3} words)")
+        kept = len(with_vad.vad.trim(audio)) / SAMPLE_RATE
+        print(
+            f"{name:<22} {len(audio) / SAMPLE_RATE:5.1f} s -> {kept:5.1f} s speech | "
+            f"without VAD {timings[0]} | with VAD {timings[1]}"
+        )
+    saved = 1 - totals[1] / totals[0] if totals[0] else 0.0
+    print(
+        f"total decode time {totals[0]:.2f} s -> {totals[1]:.2f} s ({saved:.0%} saved)"
+    )